@@ -0,0 +1,218 @@
+"""
+Per-collection document adapters: map Firestore documents to Opportunity fields
+"""
+import base64
+import json
+import re
+import threading
+import zlib
+from datetime import date, datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+# model field -> (document keys tried in order, default for the last key).
+# Earlier keys win only when truthy, as in `a or b or data.get(c, default)`.
+FIELD_CHAINS: Dict[str, Tuple[Tuple[str, ...], object]] = {
+    'title': (('title',), 'Untitled'),
+    'description': (('description',), ''),
+    'summary': (('summary',), ''),
+    'agency': (('agency',), ''),
+    'department': (('department',), ''),
+    'city': (('city',), ''),
+    'state': (('state',), ''),
+    'place': (('place',), ''),
+    'url': (('url', 'synopsisUrl', 'link'), ''),
+    'synopsis_url': (('synopsisUrl',), ''),
+    'link': (('link',), ''),
+    'contact_email': (('contactEmail',), ''),
+    'contact_phone': (('contactPhone',), ''),
+}
+
+DATE_CHAINS: Dict[str, Tuple[str, ...]] = {
+    'posted_date': ('openDate', 'postedDate'),
+    'close_date': ('closeDate', 'deadline'),
+}
+
+# Document key -> Opportunity column that can hold its raw value. Keys
+# whose value is stored verbatim in that column are left out of extra_data.
+PROMOTED_KEYS: Dict[str, str] = {}
+for _field, (_keys, _) in FIELD_CHAINS.items():
+    PROMOTED_KEYS.setdefault(_keys[0], _field)
+
+PROMOTED_MARKER = '__promoted__'
+COMPRESSED_MARKER = '__zlib__'
+# Wraps documents that have a marker key of their own, stored unpacked
+DOCUMENT_MARKER = '__document__'
+MARKERS = (PROMOTED_MARKER, COMPRESSED_MARKER, DOCUMENT_MARKER)
+
+_ISO_DATE = re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2})')
+_SLASH_DATE = re.compile(r'([0-9]{1,2})/([0-9]{1,2})/([0-9]{4})')
+
+
+def _make_date(year: str, month: str, day: str) -> Optional[date]:
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def _iso_date(value: str) -> Optional[date]:
+    """YYYY-MM-DD prefix, with or without a time part"""
+    match = _ISO_DATE.match(value)
+    return _make_date(*match.groups()) if match else None
+
+
+def _month_first_date(value: str) -> Optional[date]:
+    """MM/DD/YYYY"""
+    match = _SLASH_DATE.fullmatch(value[:10])
+    return _make_date(match.group(3), match.group(1), match.group(2)) if match else None
+
+
+def _day_first_date(value: str) -> Optional[date]:
+    """DD/MM/YYYY, only where MM/DD/YYYY cannot apply"""
+    match = _SLASH_DATE.fullmatch(value[:10])
+    if not match or int(match.group(1)) <= 12:
+        return None
+    return _make_date(match.group(3), match.group(2), match.group(1))
+
+
+# Regex parsers agreeing with parse_date() on every string they accept;
+# anything they reject falls back to parse_date()
+DATE_FORMATS: Dict[str, Callable[[str], Optional[date]]] = {
+    'iso': _iso_date,
+    'month_first': _month_first_date,
+    'day_first': _day_first_date,
+}
+
+
+def pack_extra_data(data: dict, opportunity) -> dict:
+    """
+    Residual of a document for Opportunity.extra_data: values copied
+    verbatim into a column are dropped and their keys listed under
+    __promoted__. Residuals of at least EXTRA_DATA_COMPRESS_BYTES are
+    stored zlib-compressed. A document using one of the marker keys itself
+    is kept whole under __document__.
+    """
+    if any(marker in data for marker in MARKERS):
+        residual = {DOCUMENT_MARKER: data}
+    else:
+        promoted = [
+            key for key, field in PROMOTED_KEYS.items()
+            if isinstance(data.get(key), str) and getattr(opportunity, field) == data[key]
+        ]
+        residual = {key: value for key, value in data.items() if key not in promoted}
+        if promoted:
+            residual[PROMOTED_MARKER] = promoted
+
+    threshold = settings.EXTRA_DATA_COMPRESS_BYTES
+    if threshold:
+        encoded = json.dumps(residual, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+        if len(encoded) >= threshold:
+            return {COMPRESSED_MARKER: base64.b64encode(zlib.compress(encoded)).decode('ascii')}
+    return residual
+
+
+def unpack_extra_data(stored: dict, opportunity) -> dict:
+    """Original document from a pack_extra_data() residual and the row's columns"""
+    if not stored:
+        return {}
+    if COMPRESSED_MARKER in stored:
+        data = json.loads(zlib.decompress(base64.b64decode(stored[COMPRESSED_MARKER])))
+    else:
+        data = dict(stored)
+    if DOCUMENT_MARKER in data:
+        return data[DOCUMENT_MARKER]
+    for key in data.pop(PROMOTED_MARKER, ()):
+        data[key] = getattr(opportunity, PROMOTED_KEYS[key])
+    return data
+
+
+def parse_date(date_value):
+    """Parse various date formats"""
+    if not date_value:
+        return None
+
+    if isinstance(date_value, datetime):
+        return date_value.date()
+
+    if isinstance(date_value, str):
+        try:
+            return datetime.fromisoformat(date_value.replace('Z', '+00:00')).date()
+        except ValueError:
+            for fmt in ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y']:
+                try:
+                    return datetime.strptime(date_value[:10], fmt).date()
+                except ValueError:
+                    continue
+
+    return None
+
+
+class CollectionAdapter:
+    """
+    Field mapping for one collection, compiled once.
+
+    Each collection's scraper writes dates in one format, so every date
+    field remembers the format that last parsed and tries it first; the
+    exception-driven parse_date() loop only runs when a value matches
+    none of DATE_FORMATS.
+    """
+
+    _adapters: Dict[str, 'CollectionAdapter'] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, collection_name: str, field_chains: dict = None, date_chains: dict = None):
+        self.collection_name = collection_name
+        self.field_chains = tuple((field, *chain) for field, chain in (field_chains or FIELD_CHAINS).items())
+        self.date_chains = tuple((field, keys) for field, keys in (date_chains or DATE_CHAINS).items())
+        # Date field -> name in DATE_FORMATS that parsed its last value
+        self.date_formats: Dict[str, str] = {}
+
+    @classmethod
+    def for_collection(cls, collection_name: str) -> 'CollectionAdapter':
+        """Shared adapter per collection, safe to use from sync reader threads"""
+        adapter = cls._adapters.get(collection_name)
+        if adapter is None:
+            with cls._lock:
+                adapter = cls._adapters.setdefault(collection_name, cls(collection_name))
+        return adapter
+
+    @staticmethod
+    def _lookup(data: dict, keys: Tuple[str, ...], default):
+        for key in keys[:-1]:
+            value = data.get(key)
+            if value:
+                return value
+        return data.get(keys[-1], default)
+
+    def parse_date(self, field: str, value) -> Optional[date]:
+        """parse_date(), via the format this field used last time when it applies"""
+        if not value or not isinstance(value, str):
+            return parse_date(value)
+
+        remembered = self.date_formats.get(field)
+        if remembered is not None:
+            parsed = DATE_FORMATS[remembered](value)
+            if parsed is not None:
+                return parsed
+
+        for name, parser in DATE_FORMATS.items():
+            if name == remembered:
+                continue
+            parsed = parser(value)
+            if parsed is not None:
+                self.date_formats[field] = name
+                return parsed
+        return parse_date(value)
+
+    def normalize(self, data: dict) -> dict:
+        """
+        Model field values for a document
+        Returns: {field: value} for the mapped Opportunity fields
+        """
+        fields = {field: self._lookup(data, keys, default) for field, keys, default in self.field_chains}
+        for field, keys in self.date_chains:
+            fields[field] = self.parse_date(field, self._lookup(data, keys, None))
+        return fields
@@ -1,7 +1,12 @@
+import json
+
 from django.contrib import admin
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.html import format_html
+
 from .models import (
     UserProfile, Opportunity, OpportunityMatch,
-    Application, SavedOpportunity, ApplicationPathway
+    Application, SavedOpportunity, ApplicationPathway, SyncState
 )
 
 
@@ -17,8 +22,14 @@ class UserProfileAdmin(admin.ModelAdmin):
 class OpportunityAdmin(admin.ModelAdmin):
     list_display = ('title', 'collection_name', 'agency', 'close_date', 'urgency_bucket', 'created_at')
     search_fields = ('title', 'agency', 'department', 'firebase_id')
-    list_filter = ('collection_name', 'close_date', 'created_at')
-    readonly_fields = ('firebase_id', 'last_synced', 'created_at')
+    list_filter = ('collection_name', 'close_date', 'created_at', 'tombstoned_at')
+    readonly_fields = ('firebase_id', 'raw_document', 'sync_generation', 'tombstoned_at', 'last_synced', 'created_at')
+    
+    @admin.display(description='Firestore document')
+    def raw_document(self, obj):
+        return format_html(
+            '<pre>{}</pre>', json.dumps(obj.raw_data, indent=2, sort_keys=True, cls=DjangoJSONEncoder)
+        )
     
 
 @admin.register(OpportunityMatch)
@@ -51,3 +62,10 @@ class ApplicationPathwayAdmin(admin.ModelAdmin):
     search_fields = ('opportunity__title', 'application_url')
     list_filter = ('is_active', 'created_at', 'last_verified')
     readonly_fields = ('created_at', 'last_verified')
+
+
+@admin.register(SyncState)
+class SyncStateAdmin(admin.ModelAdmin):
+    list_display = ('collection_name', 'high_water_mark', 'scan_cursor', 'documents_synced', 'last_completed_at')
+    search_fields = ('collection_name',)
+    readonly_fields = ('updated_at',)
@@ -50,7 +50,7 @@ def find_application_form(opportunity):
 
 def _check_direct_urls(opportunity):
     """Check if opportunity data contains application URLs"""
-    extra_data = opportunity.extra_data or {}
+    extra_data = opportunity.raw_data
     
     # Check for application URL fields
     for field in ['applicationUrl', 'applyUrl', 'formUrl', 'submissionUrl']:
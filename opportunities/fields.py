@@ -0,0 +1,112 @@
+"""
+Custom model fields
+"""
+import base64
+import zlib
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+# Stored values starting with this character carry a one-letter codec
+# header; anything else is plain text (including rows written before the
+# field was compressed)
+HEADER = '\x01'
+PLAIN = 'p'
+CODECS = {'zlib': 'z', 'zstd': 's'}
+
+
+def zstandard_module():
+    """The zstandard package, or None when it isn't installed"""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def compress_text(value: str, codec: str = 'zlib', min_length: Optional[int] = 512) -> str:
+    """
+    Stored form of value: compressed when long enough and it pays off;
+    min_length=None never compresses and only escapes a leading HEADER
+    """
+    if min_length is not None and len(value) >= min_length:
+        data = value.encode()
+        zstd = zstandard_module() if codec == 'zstd' else None
+        if zstd is not None:
+            packed = zstd.ZstdCompressor(level=3).compress(data)
+        else:
+            codec, packed = 'zlib', zlib.compress(data)
+        stored = HEADER + CODECS[codec] + base64.b64encode(packed).decode('ascii')
+        if len(stored) < len(value):
+            return stored
+    if value.startswith(HEADER):
+        return HEADER + PLAIN + value
+    return value
+
+
+def decompress_text(stored: str) -> str:
+    """Inverse of compress_text()"""
+    if not stored.startswith(HEADER):
+        return stored
+    codec, payload = stored[1:2], stored[2:]
+    if codec == PLAIN:
+        return payload
+    if codec not in CODECS.values():
+        # Plain text written before compression that happens to start with HEADER
+        return stored
+    data = base64.b64decode(payload)
+    if codec == CODECS['zstd']:
+        zstd = zstandard_module()
+        if zstd is None:
+            raise ImproperlyConfigured('zstd-compressed text requires the zstandard package')
+        return zstd.ZstdDecompressor().decompress(data).decode()
+    return zlib.decompress(data).decode()
+
+
+class CompressedTextField(models.TextField):
+    """
+    TextField that can store long values compressed (zlib, or zstd when
+    installed) behind a two-character header, for texts that are read far
+    less often than the rows holding them.
+
+    Compression is opt-in: values are written compressed only while
+    settings.COMPRESS_TEXT_FIELDS is on, and the compress_opportunity_text
+    command rewrites existing rows after the setting changes. Reads always
+    return plain str, whichever form a row is stored in; leave the columns
+    out with only()/defer() where they aren't needed so nothing is
+    decompressed.
+
+    The column stays a text column, so plain rows remain valid and exact
+    lookups still work. Pattern lookups (contains, icontains, ...) only see
+    the compressed form of long values; don't filter on these columns with
+    them while compression is on.
+    """
+
+    def __init__(self, *args, codec: str = 'zlib', min_length: int = 512, **kwargs):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}")
+        self.codec = codec
+        self.min_length = min_length
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.codec != 'zlib':
+            kwargs['codec'] = self.codec
+        if self.min_length != 512:
+            kwargs['min_length'] = self.min_length
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return decompress_text(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        min_length = self.min_length if settings.COMPRESS_TEXT_FIELDS else None
+        return compress_text(value, self.codec, min_length)
@@ -4,19 +4,60 @@ Firebase integration for syncing opportunity data
 import firebase_admin
 from firebase_admin import credentials, firestore, auth as firebase_auth
 from django.conf import settings
-from .models import Opportunity, UserProfile
-from datetime import datetime
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import (
+    Application, ApplicationPathway, Opportunity, OpportunityMatch, OpportunityTerm,
+    SavedOpportunity, SyncState, UserProfile,
+)
+from .keywords import KeywordIndex, normalize_search_text
+from .matching import OpportunityMatcher
+from .percolator import ProfilePercolator
+from .sources import FirestoreSource, open_source
+from .adapters import CollectionAdapter, pack_extra_data
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+import hashlib
+import json
 import logging
 import os
+import queue
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+# Collections sync_all_opportunities reads by default
+SYNC_COLLECTIONS = ["SAM", "grants.gov", "grantwatch", "PND_RFPs", "rfpmart", "bid"]
+
+# Firestore documents written per bulk upsert transaction
+SYNC_CHUNK_SIZE = 500
+
+# SyncState fields that make up a collection's checkpoint
+SYNC_POSITION_FIELDS = ('scan_cursor', 'high_water_mark', 'high_water_id')
+
+# Columns refreshed when a synced document already exists
+SYNC_UPDATE_FIELDS = [
+    'collection_name', 'title', 'description', 'summary', 'agency', 'department',
+    'search_text', 'posted_date', 'close_date', 'deadline', 'city', 'state', 'place',
+    'url', 'synopsis_url', 'link', 'contact_email', 'contact_phone', 'extra_data',
+    'content_hash', 'sync_generation', 'tombstoned_at', 'last_synced',
+]
+
+# Bump when _build_opportunity maps documents differently, so the next
+# sync rewrites every document instead of skipping unchanged hashes
+CONTENT_HASH_VERSION = 1
+
 
 class FirebaseService:
     """Service for interacting with Firebase"""
     
     _initialized = False
     _db = None
+    # Spec given to use_source(); None follows settings.OPPORTUNITY_SOURCE
+    _source = None
     
     @classmethod
     def initialize(cls):
@@ -43,15 +84,30 @@ class FirebaseService:
                 logger.warning(f"Firebase initialization skipped: {e}")
                 cls._initialized = False
     
+    @classmethod
+    def use_source(cls, spec: str):
+        """
+        Read documents from another source ('firestore', 'jsonl:/path' or
+        'memory'; see opportunities.sources) instead of OPPORTUNITY_SOURCE
+        """
+        cls._db = None if spec == 'firestore' else open_source(spec)
+        cls._source = spec
+    
     @classmethod
     def get_db(cls):
-        """Get Firestore database client"""
+        """Get the document source: Firestore unless use_source() or OPPORTUNITY_SOURCE says otherwise"""
+        spec = cls._source or settings.OPPORTUNITY_SOURCE
+        if cls._db is None and spec != 'firestore':
+            cls._db = open_source(spec)
+        if cls._db is not None:
+            return cls._db
+        
         if not cls._initialized:
             cls.initialize()
         
         if cls._db is None and cls._initialized:
             try:
-                cls._db = firestore.client()
+                cls._db = FirestoreSource(firestore.client())
             except Exception as e:
                 logger.error(f"Failed to get Firestore client: {e}")
                 return None
@@ -59,77 +115,280 @@ class FirebaseService:
         return cls._db
     
     @classmethod
-    def sync_opportunities_from_collection(cls, collection_name: str, limit: int = None):
-        """Sync opportunities from a specific Firebase collection"""
+    def sync_opportunities_from_collection(cls, collection_name: str, limit: int = None,
+                                           percolator: ProfilePercolator = None,
+                                           full: bool = False, since: datetime = None):
+        """
+        Sync opportunities from a specific Firebase collection
+        
+        Documents are read in ordered pages of SYNC_CHUNK_SIZE and the
+        collection's SyncState is checkpointed in the same transaction as
+        each page, so an interrupted sync resumes after the last page. With
+        FIRESTORE_UPDATED_FIELD set, only documents updated after the stored
+        high-water mark (or since) are fetched; full=True or a missing mark
+        runs a full pass ordered by document id.
+        
+        Every row a run sees is stamped with the collection's sync
+        generation; once a full pass completes, rows left on an older
+        generation (deleted from Firestore) are swept, see _sweep_collection.
+        
+        With a percolator, every synced opportunity is also matched against
+        all user profiles so new matches exist before users ask for them.
+        """
         db = cls.get_db()
         if not db:
             logger.warning("Firestore not available")
             return 0
         
+        started = time.monotonic()
+        synced_count = 0
+        
         try:
-            collection_ref = db.collection(collection_name)
+            state, position, incremental = cls._prepare_sync(collection_name, full, since)
+            pages = cls._read_pages(db, collection_name, position, incremental, limit)
+            for page in pages:
+                written = cls._write_page(collection_name, state, page, incremental, percolator)
+                if written is None:
+                    # Leave the last committed checkpoint for the next run
+                    break
+                synced_count += written
             
-            if limit:
-                docs = collection_ref.limit(limit).stream()
-            else:
-                docs = collection_ref.stream()
-            
-            synced_count = 0
+            logger.info(
+                f"Synced {synced_count} new or changed opportunities from {collection_name} "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+            return synced_count
+        except Exception as e:
+            # Committed pages stay checkpointed; the next run resumes after them
+            logger.error(f"Error accessing collection {collection_name}: {e}")
+            return synced_count
+    
+    @classmethod
+    def _prepare_sync(cls, collection_name: str, full: bool = False, since: datetime = None):
+        """
+        Load the collection's SyncState and pick the kind of pass to run.
+        since only moves this run's starting position back; the stored
+        high-water mark never moves backwards (see _advance_state). An
+        unfinished full pass is resumed first, and since is then ignored.
+        Returns: (state, start position, incremental)
+        """
+        updated_field = getattr(settings, 'FIRESTORE_UPDATED_FIELD', '')
+        state, _ = SyncState.objects.get_or_create(collection_name=collection_name)
+        
+        if full:
+            state.scan_cursor = ''
+        elif since is not None and state.scan_cursor:
+            logger.warning(
+                f"{collection_name}: ignoring since={since.isoformat()}, resuming the unfinished "
+                f"full pass after {state.scan_cursor}"
+            )
+        incremental = bool(updated_field) and not full and not state.scan_cursor and (
+            since is not None or state.high_water_mark is not None
+        )
+        position = cls._position(state)
+        if incremental and since is not None:
+            mark = state.high_water_mark
+            position['high_water_mark'] = since if mark is None else min(since, mark)
+            position['high_water_id'] = ''
+        if not incremental and not state.scan_cursor:
+            # A new full pass; resumed passes keep stamping the same generation
+            state.generation += 1
+        
+        state.documents_synced = 0
+        state.last_started_at = timezone.now()
+        state.save()
+        return state, position, incremental
+    
+    @staticmethod
+    def _position(state: SyncState) -> dict:
+        """Checkpoint fields of a SyncState, advanced by readers without the database"""
+        return {field: getattr(state, field) for field in SYNC_POSITION_FIELDS}
+    
+    @staticmethod
+    def _advance_state(state: SyncState, checkpoint: dict):
+        """
+        Copy a page checkpoint onto the SyncState. The high-water mark only
+        moves forward, so a --since backfill replays older documents without
+        rewinding later incremental syncs; an interrupted backfill is not
+        resumed and has to be run again.
+        """
+        state.scan_cursor = checkpoint['scan_cursor']
+        mark, mark_id = checkpoint['high_water_mark'], checkpoint['high_water_id']
+        if mark is None:
+            return
+        if state.high_water_mark is None or (mark, mark_id) > (state.high_water_mark, state.high_water_id):
+            state.high_water_mark = mark
+            state.high_water_id = mark_id
+    
+    @classmethod
+    def _read_pages(cls, db, collection_name: str, position: dict, incremental: bool, limit: int = None):
+        """
+        Fetch and parse ordered pages after position. Touches no database,
+        so it can run on a reader thread.
+        Yields: (opportunities, checkpoint, ids of documents fetched, pass finished)
+        """
+        updated_field = getattr(settings, 'FIRESTORE_UPDATED_FIELD', '')
+        collection_ref = db.collection(collection_name)
+        fetched = 0
+        
+        while limit is None or fetched < limit:
+            page_size = SYNC_CHUNK_SIZE if limit is None else min(SYNC_CHUNK_SIZE, limit - fetched)
+            query = cls._page_query(collection_ref, position, incremental, updated_field)
+            docs = list(query.limit(page_size).stream())
+            fetched += len(docs)
             
+            chunk = []
             for doc in docs:
+                data = doc.to_dict()
                 try:
-                    data = doc.to_dict()
-                    
-                    posted_date = cls._parse_date(data.get('openDate') or data.get('postedDate'))
-                    close_date = cls._parse_date(data.get('closeDate') or data.get('deadline'))
-                    
-                    opportunity, created = Opportunity.objects.update_or_create(
-                        firebase_id=doc.id,
-                        collection_name=collection_name,
-                        defaults={
-                            'title': data.get('title', 'Untitled'),
-                            'description': data.get('description', ''),
-                            'summary': data.get('summary', ''),
-                            'agency': data.get('agency', ''),
-                            'department': data.get('department', ''),
-                            'posted_date': posted_date,
-                            'close_date': close_date,
-                            'deadline': close_date,
-                            'city': data.get('city', ''),
-                            'state': data.get('state', ''),
-                            'place': data.get('place', ''),
-                            'url': data.get('url') or data.get('synopsisUrl') or data.get('link', ''),
-                            'synopsis_url': data.get('synopsisUrl', ''),
-                            'link': data.get('link', ''),
-                            'contact_email': data.get('contactEmail', ''),
-                            'contact_phone': data.get('contactPhone', ''),
-                            'extra_data': data
-                        }
-                    )
-                    
-                    synced_count += 1
-                    
+                    chunk.append(cls._build_opportunity(doc.id, collection_name, data))
                 except Exception as e:
-                    logger.error(f"Error syncing opportunity {doc.id}: {e}")
-                    continue
+                    logger.error(f"Error parsing opportunity {doc.id}: {e}")
+                cls._advance_position(position, doc, data, incremental, updated_field)
             
-            logger.info(f"Synced {synced_count} opportunities from {collection_name}")
-            return synced_count
+            finished = len(docs) < page_size
+            yield chunk, dict(position), [doc.id for doc in docs], finished
+            if finished:
+                return
+    
+    @classmethod
+    def _write_page(cls, collection_name: str, state: SyncState, page: tuple, incremental: bool,
+                    percolator: ProfilePercolator = None):
+        """
+        Writer side: store one page and its checkpoint, and sweep the
+        collection when the page completes a full pass
+        Returns: number of opportunities written, None when rolled back
+        """
+        chunk, checkpoint, doc_ids, finished = page
+        written = 0
+        if doc_ids:
+            cls._advance_state(state, checkpoint)
+            state.documents_synced += len(doc_ids)
+            written = cls._write_chunk(collection_name, chunk, percolator, checkpoint=state, seen_ids=doc_ids)
+            if written is None:
+                return None
+        
+        if finished:
+            if not incremental:
+                cls._sweep_collection(collection_name, state.generation)
+            # Saved after the sweep so its updated_at covers the removals too
+            state.scan_cursor = ''
+            state.last_completed_at = timezone.now()
+            state.save()
+        return written
+    
+    @classmethod
+    def _sweep_collection(cls, collection_name: str, generation: int):
+        """
+        Remove the rows a completed full pass didn't see, i.e. documents
+        deleted from Firestore. Their matches, pathways and keyword postings
+        go in bulk deletes; rows still referenced by applications or saved
+        opportunities are tombstoned instead, so those records keep their
+        opportunity while it drops out of matching.
+        Returns: (rows deleted, rows tombstoned)
+        """
+        stale_ids = list(Opportunity.objects.filter(
+            collection_name=collection_name, sync_generation__lt=generation
+        ).values_list('id', flat=True))
+        
+        deleted = tombstoned = 0
+        now = timezone.now()
+        try:
+            for start in range(0, len(stale_ids), SYNC_CHUNK_SIZE):
+                batch = stale_ids[start:start + SYNC_CHUNK_SIZE]
+                with transaction.atomic():
+                    OpportunityMatch.objects.filter(opportunity_id__in=batch).delete()
+                    ApplicationPathway.objects.filter(opportunity_id__in=batch).delete()
+                    OpportunityTerm.objects.filter(opportunity_id__in=batch).delete()
+                    
+                    referenced = set(Application.objects.filter(
+                        opportunity_id__in=batch
+                    ).values_list('opportunity_id', flat=True))
+                    referenced.update(SavedOpportunity.objects.filter(
+                        opportunity_id__in=batch
+                    ).values_list('opportunity_id', flat=True))
+                    
+                    tombstoned += Opportunity.objects.filter(
+                        id__in=referenced, tombstoned_at__isnull=True
+                    ).update(tombstoned_at=now)
+                    unreferenced = [pk for pk in batch if pk not in referenced]
+                    if unreferenced:
+                        Opportunity.objects.filter(id__in=unreferenced).delete()
+                        deleted += len(unreferenced)
         except Exception as e:
-            logger.error(f"Error accessing collection {collection_name}: {e}")
-            return 0
+            # Whatever is left is still stale and goes with the next completed pass
+            logger.error(f"Error sweeping {collection_name}: {e}")
+        
+        if deleted or tombstoned:
+            logger.info(
+                f"{collection_name}: swept {deleted} deleted opportunities and tombstoned {tombstoned} "
+                f"still referenced (generation {generation})"
+            )
+        return deleted, tombstoned
+    
+    @staticmethod
+    def _page_query(collection_ref, position: dict, incremental: bool, updated_field: str):
+        """Ordered query for the page after the checkpoint position"""
+        if incremental:
+            query = collection_ref.order_by(updated_field).order_by('__name__')
+            if position['high_water_id']:
+                return query.where(updated_field, '>=', position['high_water_mark']).start_after({
+                    updated_field: position['high_water_mark'], '__name__': position['high_water_id']
+                })
+            return query.where(updated_field, '>', position['high_water_mark'])
+        
+        query = collection_ref.order_by('__name__')
+        if position['scan_cursor']:
+            query = query.start_after({'__name__': position['scan_cursor']})
+        return query
     
     @classmethod
-    def sync_all_opportunities(cls, collections: list = None, limit_per_collection: int = None):
-        """Sync opportunities from all or specified collections"""
+    def _advance_position(cls, position: dict, doc, data: dict, incremental: bool, updated_field: str):
+        """Move the checkpoint past one fetched document"""
+        updated = cls._parse_timestamp(data.get(updated_field)) if updated_field else None
+        if incremental:
+            position['high_water_mark'] = updated
+            position['high_water_id'] = doc.id
+            return
+        
+        position['scan_cursor'] = doc.id
+        # A full pass leaves the mark at the newest update it saw
+        mark = position['high_water_mark']
+        if updated is not None and (mark is None or updated > mark):
+            position['high_water_mark'] = updated
+            position['high_water_id'] = ''
+    
+    @classmethod
+    def sync_all_opportunities(cls, collections: list = None, limit_per_collection: int = None,
+                               match_on_ingest: bool = True, full: bool = False, since: datetime = None,
+                               workers: int = 1):
+        """
+        Sync opportunities from all or specified collections
+        
+        With workers > 1, collections are read concurrently by a thread pool
+        and every page is written by this thread alone (SQLite allows a
+        single writer).
+        """
         if collections is None:
-            collections = ["SAM", "grants.gov", "grantwatch", "PND_RFPs", "rfpmart", "bid"]
+            collections = SYNC_COLLECTIONS
+        
+        # Compiled once from all profiles and shared by every collection
+        percolator = ProfilePercolator() if match_on_ingest else None
+        
+        if workers > 1 and len(collections) > 1:
+            total_synced = cls._sync_concurrently(collections, limit_per_collection, percolator,
+                                                  full, since, workers)
+            logger.info(f"Total opportunities synced: {total_synced}")
+            return total_synced
         
         total_synced = 0
         
         for collection_name in collections:
             try:
-                count = cls.sync_opportunities_from_collection(collection_name, limit_per_collection)
+                count = cls.sync_opportunities_from_collection(
+                    collection_name, limit_per_collection, percolator=percolator,
+                    full=full, since=since
+                )
                 total_synced += count
             except Exception as e:
                 logger.error(f"Error syncing collection {collection_name}: {e}")
@@ -138,6 +397,221 @@ class FirebaseService:
         logger.info(f"Total opportunities synced: {total_synced}")
         return total_synced
     
+    @classmethod
+    def _sync_concurrently(cls, collections: list, limit: int, percolator: ProfilePercolator,
+                           full: bool, since: datetime, workers: int) -> int:
+        """Reader threads fetch and parse pages; the calling thread writes them"""
+        db = cls.get_db()
+        if not db:
+            logger.warning("Firestore not available")
+            return 0
+        
+        started = time.monotonic()
+        pages = queue.Queue(maxsize=workers * 2)
+        stop = {name: threading.Event() for name in collections}
+        writer_done = threading.Event()
+        states = {}
+        incremental = {}
+        
+        def read(collection_name, position, incremental):
+            read_started = time.monotonic()
+            fetched = 0
+            try:
+                for page in cls._read_pages(db, collection_name, position, incremental, limit):
+                    fetched += len(page[2])
+                    if not cls._offer(pages, (collection_name, page), stop[collection_name], writer_done):
+                        return
+            except Exception as e:
+                logger.error(f"Error accessing collection {collection_name}: {e}")
+            finally:
+                logger.info(
+                    f"{collection_name}: read {fetched} documents in {time.monotonic() - read_started:.1f}s"
+                )
+                # End-of-collection marker, even for a reader the writer stopped
+                cls._offer(pages, (collection_name, None), writer_done)
+        
+        synced = {name: 0 for name in collections}
+        write_time = {name: 0.0 for name in collections}
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='firestore-sync') as pool:
+            try:
+                for collection_name in collections:
+                    try:
+                        states[collection_name], position, incremental[collection_name] = cls._prepare_sync(
+                            collection_name, full, since
+                        )
+                    except Exception as e:
+                        logger.error(f"Error syncing collection {collection_name}: {e}")
+                        continue
+                    pool.submit(read, collection_name, position, incremental[collection_name])
+                
+                remaining = len(states)
+                while remaining:
+                    collection_name, page = pages.get()
+                    if page is None:
+                        remaining -= 1
+                        continue
+                    if stop[collection_name].is_set():
+                        continue
+                    
+                    write_started = time.monotonic()
+                    written = cls._write_page(collection_name, states[collection_name], page,
+                                              incremental[collection_name], percolator)
+                    write_time[collection_name] += time.monotonic() - write_started
+                    if written is None:
+                        # Keep the committed checkpoint; drop this collection's later pages
+                        stop[collection_name].set()
+                        continue
+                    synced[collection_name] += written
+            finally:
+                writer_done.set()
+        
+        for collection_name in states:
+            logger.info(
+                f"Synced {synced[collection_name]} new or changed opportunities from {collection_name} "
+                f"(writes {write_time[collection_name]:.1f}s)"
+            )
+        logger.info(f"Concurrent sync of {len(states)} collections took {time.monotonic() - started:.1f}s")
+        return sum(synced.values())
+    
+    @staticmethod
+    def _offer(pages: queue.Queue, item, *stop_events: threading.Event) -> bool:
+        """Put on the bounded page queue, giving up once any stop event is set"""
+        while not any(event.is_set() for event in stop_events):
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    @classmethod
+    def _build_opportunity(cls, firebase_id: str, collection_name: str, data: dict) -> Opportunity:
+        """Map a Firestore document to an unsaved Opportunity"""
+        fields = CollectionAdapter.for_collection(collection_name).normalize(data)
+        
+        opportunity = Opportunity(
+            firebase_id=firebase_id,
+            collection_name=collection_name,
+            search_text=normalize_search_text(
+                fields['title'], fields['description'], fields['summary'],
+                fields['agency'], fields['department']
+            ),
+            deadline=fields['close_date'],
+            content_hash=cls._content_hash(collection_name, data),
+            **fields
+        )
+        # Only what the columns don't already hold; see Opportunity.raw_data
+        opportunity.extra_data = pack_extra_data(data, opportunity)
+        return opportunity
+    
+    @staticmethod
+    def _content_hash(collection_name: str, data: dict) -> str:
+        """
+        Stable hash of a Firestore document: canonical JSON with sorted keys.
+        CONTENT_HASH_VERSION is part of it so a change to the field mapping
+        can force every document to be rewritten once.
+        """
+        canonical = json.dumps(
+            [CONTENT_HASH_VERSION, collection_name, data],
+            sort_keys=True, separators=(',', ':'), cls=DjangoJSONEncoder
+        )
+        return hashlib.sha1(canonical.encode()).hexdigest()
+    
+    @classmethod
+    def _write_chunk(cls, collection_name: str, chunk: list, percolator: ProfilePercolator = None,
+                     checkpoint: SyncState = None, seen_ids: list = None):
+        """
+        Upsert a chunk of opportunities and their keyword postings in one
+        transaction, together with the sync checkpoint, then match them
+        against profiles. Documents whose content hash is unchanged are
+        skipped, so only real changes reach indexing and matching.
+        
+        Rows are stamped with the checkpoint's sync generation. Skipped
+        rows, and those of seen_ids that failed to parse, get it in a single
+        UPDATE so a sweep doesn't mistake them for deleted documents.
+        Returns: number of opportunities written, None when rolled back
+        """
+        # Last copy wins when a document appears twice in one chunk
+        chunk = list({opp.firebase_id: opp for opp in chunk}.values())
+        seen_ids = set(seen_ids or ()).union(opp.firebase_id for opp in chunk)
+        generation = checkpoint.generation if checkpoint is not None else None
+        for opp in chunk:
+            opp.tombstoned_at = None
+            if generation is not None:
+                opp.sync_generation = generation
+        # Outside a sync pass the stored generations are kept
+        update_fields = SYNC_UPDATE_FIELDS if generation is not None else [
+            field for field in SYNC_UPDATE_FIELDS if field != 'sync_generation'
+        ]
+        changed = []
+        
+        queries = [0]
+        
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+        
+        started = time.monotonic()
+        try:
+            with connection.execute_wrapper(count_queries), transaction.atomic():
+                stored = {
+                    firebase_id: (content_hash, tombstoned_at, sync_generation)
+                    for firebase_id, content_hash, tombstoned_at, sync_generation in Opportunity.objects.filter(
+                        firebase_id__in=seen_ids
+                    ).values_list('firebase_id', 'content_hash', 'tombstoned_at', 'sync_generation')
+                }
+                # A tombstoned row that shows up again is restored like a change
+                changed = [
+                    opp for opp in chunk
+                    if stored.get(opp.firebase_id, (None, None))[:2] != (opp.content_hash, None)
+                ]
+                changed_ids = {opp.firebase_id for opp in changed}
+                restamp = [
+                    firebase_id for firebase_id, (_, _, stored_generation) in stored.items()
+                    if firebase_id not in changed_ids and stored_generation != generation
+                ]
+                if generation is not None and restamp:
+                    # Leaves last_synced alone: the content didn't change
+                    Opportunity.objects.filter(firebase_id__in=restamp).update(sync_generation=generation)
+                
+                if changed:
+                    Opportunity.objects.bulk_create(
+                        changed,
+                        update_conflicts=True,
+                        unique_fields=['firebase_id'],
+                        update_fields=update_fields,
+                    )
+                    ids = dict(Opportunity.objects.filter(
+                        firebase_id__in=[opp.firebase_id for opp in changed]
+                    ).values_list('firebase_id', 'id'))
+                    for opp in changed:
+                        opp.pk = ids[opp.firebase_id]
+                    KeywordIndex.index_opportunities(changed)
+                if checkpoint is not None:
+                    checkpoint.save()
+        except Exception as e:
+            logger.error(f"Error writing {len(chunk)} opportunities from {collection_name}: {e}")
+            return None
+        
+        logger.info(
+            f"{collection_name}: upserted {len(changed)} of {len(chunk)} opportunities "
+            f"({len(chunk) - len(changed)} unchanged) with {queries[0]} queries "
+            f"in 1 transaction ({time.monotonic() - started:.2f}s)"
+        )
+        
+        if percolator is not None and changed:
+            cls._percolate(percolator, changed)
+        return len(changed)
+    
+    @staticmethod
+    def _percolate(percolator: ProfilePercolator, opportunities: list):
+        """Match a batch of synced opportunities; failures never abort the sync"""
+        try:
+            percolator.percolate(opportunities)
+        except Exception as e:
+            logger.error(f"Error matching synced opportunities: {e}")
+    
     @classmethod
     def get_user_profile_from_firebase(cls, firebase_uid: str):
         """Get user profile data from Firebase"""
@@ -167,6 +641,8 @@ class FirebaseService:
         if not firebase_data:
             return None
         
+        previous = UserProfile.objects.filter(firebase_uid=firebase_uid).first()
+        
         profile, created = UserProfile.objects.update_or_create(
             firebase_uid=firebase_uid,
             defaults={
@@ -181,8 +657,23 @@ class FirebaseService:
             }
         )
         
+        if previous is not None:
+            cls._rematch_interest_changes(previous, profile)
+        
         return profile
     
+    @staticmethod
+    def _rematch_interest_changes(previous: UserProfile, profile: UserProfile):
+        """Scan only for added keywords when just the interests changed"""
+        previous_matcher = OpportunityMatcher(previous)
+        matcher = OpportunityMatcher(profile)
+        if matcher.get_match_signature() == previous_matcher.get_match_signature():
+            return
+        try:
+            matcher.rematch_interest_changes(previous_matcher)
+        except Exception as e:
+            logger.error(f"Error rematching profile {profile.firebase_uid}: {e}")
+    
     @classmethod
     def verify_firebase_token(cls, id_token: str):
         """Verify Firebase ID token and return user info"""
@@ -200,25 +691,12 @@ class FirebaseService:
             return None
     
     @staticmethod
-    def _parse_date(date_value):
-        """Parse various date formats"""
-        if not date_value:
+    def _parse_timestamp(value):
+        """Aware datetime from a Firestore timestamp or ISO 8601 string"""
+        if isinstance(value, str):
+            value = parse_datetime(value)
+        if not isinstance(value, datetime):
             return None
-        
-        if isinstance(date_value, datetime):
-            return date_value.date()
-        
-        if isinstance(date_value, str):
-            try:
-                return datetime.fromisoformat(date_value.replace('Z', '+00:00')).date()
-            except:
-                try:
-                    for fmt in ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y']:
-                        try:
-                            return datetime.strptime(date_value[:10], fmt).date()
-                        except:
-                            continue
-                except:
-                    pass
-        
-        return None
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, dt_timezone.utc)
+        return value
@@ -6,9 +6,11 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 from django.conf import settings
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 import os
 
+from .sources import FirestoreSource, open_source
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,6 +19,8 @@ class FirebaseService:
     
     _db = None
     _initialized = False
+    # Spec given to use_source(); None follows settings.OPPORTUNITY_SOURCE
+    _source = None
     
     @classmethod
     def initialize(cls, credentials_path: Optional[str] = None):
@@ -43,7 +47,7 @@ class FirebaseService:
                     firebase_admin.initialize_app()
                     logger.info("Firebase initialized with default credentials")
             
-            cls._db = firestore.client()
+            cls._db = FirestoreSource(firestore.client())
             cls._initialized = True
             logger.info("Firebase Firestore client initialized successfully")
             
@@ -51,9 +55,24 @@ class FirebaseService:
             logger.error(f"Failed to initialize Firebase: {e}")
             raise
     
+    @classmethod
+    def use_source(cls, spec: str):
+        """Read and write documents through another source (see opportunities.sources)"""
+        cls._source = spec
+        if spec == 'firestore':
+            cls._db = None
+            cls._initialized = False
+        else:
+            cls._db = open_source(spec)
+            cls._initialized = True
+    
     @classmethod
     def get_db(cls):
-        """Get Firestore database instance"""
+        """Get the document source: Firestore unless use_source() or OPPORTUNITY_SOURCE says otherwise"""
+        spec = cls._source or settings.OPPORTUNITY_SOURCE
+        if not cls._initialized and spec != 'firestore':
+            cls._db = open_source(spec)
+            cls._initialized = True
         if not cls._initialized:
             cls.initialize()
         return cls._db
@@ -74,8 +93,29 @@ class FirebaseService:
         Returns:
             List of opportunity dictionaries
         """
+        all_opportunities = list(cls.iter_opportunities_from_collections(collections, limit))
+        logger.info(f"Total opportunities fetched: {len(all_opportunities)}")
+        return all_opportunities
+    
+    @classmethod
+    def iter_opportunities_from_collections(
+        cls,
+        collections: List[str],
+        limit: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream opportunities from specified Firebase collections, e.g. into
+        OpportunityMatcher.rank_opportunities(..., top_k=N) without holding
+        every document in memory
+        
+        Args:
+            collections: List of collection names to fetch from
+            limit: Maximum number of docs per collection
+            
+        Yields:
+            Opportunity dictionaries
+        """
         db = cls.get_db()
-        all_opportunities = []
         
         for collection_name in collections:
             try:
@@ -85,16 +125,13 @@ class FirebaseService:
                     data = doc.to_dict()
                     data['id'] = doc.id
                     data['collection'] = collection_name
-                    all_opportunities.append(data)
+                    yield data
                 
                 logger.info(f"Fetched opportunities from {collection_name}")
                 
             except Exception as e:
                 logger.error(f"Error fetching from {collection_name}: {e}")
                 continue
-        
-        logger.info(f"Total opportunities fetched: {len(all_opportunities)}")
-        return all_opportunities
     
     @classmethod
     def get_user_profile(cls, user_id: str) -> Optional[Dict[str, Any]]:
@@ -0,0 +1,192 @@
+"""
+Compiled multi-keyword matching for opportunity text
+"""
+import html
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Opportunity, OpportunityTerm
+
+TOKEN_RE = re.compile(r'\w+')
+# Maximal runs of word or of non-word characters
+RUN_RE = re.compile(r'\w+|\W+')
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+WHITESPACE_RE = re.compile(r'\s+')
+MAX_TERM_LENGTH = OpportunityTerm._meta.get_field('term').max_length
+# Larger keyword sets are matched by leading run instead of one regex
+ALTERNATION_MAX_KEYWORDS = 64
+
+
+def normalize_search_text(*parts) -> str:
+    """Join text fields, strip HTML tags and entities, collapse whitespace, lowercase"""
+    text = ' '.join(part or "" for part in parts)
+    text = html.unescape(HTML_TAG_RE.sub(' ', text))
+    return WHITESPACE_RE.sub(' ', text).strip().lower()
+
+
+def build_search_text(opportunity: Opportunity) -> str:
+    """Lowercased text that keyword matching runs against"""
+    if opportunity.search_text is not None:
+        return opportunity.search_text
+    # Rows loaded with only(*SCORING_FIELDS): one query for every missing column
+    deferred = opportunity.get_deferred_fields().intersection(Opportunity.SEARCH_TEXT_FIELDS)
+    if deferred:
+        opportunity.refresh_from_db(fields=deferred)
+    return normalize_search_text(*(getattr(opportunity, field) for field in Opportunity.SEARCH_TEXT_FIELDS))
+
+
+def tokenize(text: str) -> Counter:
+    """Term frequencies of the word tokens in lowercased text"""
+    return Counter(t for t in TOKEN_RE.findall(text) if len(t) <= MAX_TERM_LENGTH)
+
+
+def _is_word_char(ch: str) -> bool:
+    """Mirror of the regex ``\\w`` class for a single character"""
+    return ch.isalnum() or ch == '_'
+
+
+class KeywordMatcher:
+    """
+    Finds whole-word occurrences of many keywords in a single pass.
+
+    Small keyword sets, like one profile's interests, are compiled into one
+    alternation wrapped in a lookahead, so the regex engine reports every
+    position where at least one keyword starts on a word boundary. That
+    costs time per keyword at every position, so larger sets (e.g. every
+    profile's keywords in ProfilePercolator) use a dict instead: a
+    ``\\bkeyword\\b`` hit always starts at the beginning of a run of word
+    (or non-word) characters, and that whole run equals the keyword's own
+    leading run ('mental' for 'mental health', 'c' for 'c++', '.' for
+    '.net'), so each run of the text probes the dict once.
+
+    Either way candidates are checked exactly, which keeps the per-keyword
+    counts identical to running ``\\bkeyword\\b`` findall once per keyword
+    (overlapping and nested keywords included).
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = sorted({k.lower() for k in keywords if k})
+        self._by_first_char: Dict[str, List[str]] = defaultdict(list)
+        self._by_leading_run: Dict[str, List[str]] = defaultdict(list)
+
+        self._pattern = None
+        if len(self.keywords) <= ALTERNATION_MAX_KEYWORDS:
+            for keyword in self.keywords:
+                self._by_first_char[keyword[0]].append(keyword)
+            if self.keywords:
+                alternation = '|'.join(re.escape(k) for k in self.keywords)
+                self._pattern = re.compile(r'(?=\b(?:' + alternation + r')\b)')
+        else:
+            for keyword in self.keywords:
+                self._by_leading_run[RUN_RE.match(keyword).group()].append(keyword)
+
+    def __bool__(self):
+        return bool(self.keywords)
+
+    def count(self, text: str) -> Dict[str, int]:
+        """
+        Count non-overlapping whole-word hits per keyword in lowercased text
+        Returns: {keyword: count} for keywords with at least one hit
+        """
+        if not self.keywords or not text:
+            return {}
+
+        counts: Dict[str, int] = {}
+        next_allowed: Dict[str, int] = {}
+        for start, candidates in self._candidates(text):
+            for keyword in candidates:
+                if start < next_allowed.get(keyword, 0):
+                    continue
+                end = start + len(keyword)
+                if end > len(text) or not text.startswith(keyword, start):
+                    continue
+                before_end = _is_word_char(text[end - 1])
+                after_end = end < len(text) and _is_word_char(text[end])
+                if before_end == after_end:
+                    continue
+                counts[keyword] = counts.get(keyword, 0) + 1
+                next_allowed[keyword] = end
+
+        return counts
+
+    def _candidates(self, text: str) -> Iterator[Tuple[int, List[str]]]:
+        """(position, keywords that may start there) in text order"""
+        if self._pattern is not None:
+            for hit in self._pattern.finditer(text):
+                yield hit.start(), self._by_first_char[text[hit.start()]]
+            return
+
+        offset = 0
+        for run in RUN_RE.findall(text):
+            start, offset = offset, offset + len(run)
+            candidates = self._by_leading_run.get(run)
+            # Every later run starts on a word boundary; the first only when it is a word
+            if candidates is not None and (start or _is_word_char(run[0])):
+                yield start, candidates
+
+
+class KeywordIndex:
+    """
+    Persistent inverted index over opportunity text.
+
+    Every whole-word hit of a keyword lies on word tokens that are themselves
+    complete tokens in the text, so any single token of a keyword is a
+    necessary condition for a match. Candidate generation looks up one
+    anchor token per keyword and only those opportunities (plus any that
+    have not been indexed yet) go on to exact scoring.
+    """
+
+    @staticmethod
+    def index_opportunities(opportunities: Iterable[Opportunity], batch_size: int = 1000) -> int:
+        """Rebuild the postings for the given opportunities"""
+        opportunities = list(opportunities)
+        if not opportunities:
+            return 0
+
+        ids = [opp.pk for opp in opportunities]
+        postings = [
+            OpportunityTerm(opportunity_id=opp.pk, term=term, term_frequency=tf)
+            for opp in opportunities
+            for term, tf in tokenize(build_search_text(opp)).items()
+        ]
+
+        with transaction.atomic():
+            OpportunityTerm.objects.filter(opportunity_id__in=ids).delete()
+            OpportunityTerm.objects.bulk_create(postings, batch_size=batch_size)
+            indexed_at = timezone.now()
+            Opportunity.objects.filter(pk__in=ids).update(indexed_at=indexed_at)
+        for opp in opportunities:
+            opp.indexed_at = indexed_at
+
+        return len(postings)
+
+    @staticmethod
+    def anchor_terms(keywords: Iterable[str]) -> Optional[List[str]]:
+        """
+        Pick one index term per keyword (its longest token)
+        Returns: None when some keyword has no indexable token
+        """
+        anchors = set()
+        for keyword in keywords:
+            if not keyword:
+                continue
+            tokens = [t for t in TOKEN_RE.findall(keyword.lower()) if len(t) <= MAX_TERM_LENGTH]
+            if not tokens:
+                return None
+            anchors.add(max(tokens, key=len))
+        return sorted(anchors)
+
+    @classmethod
+    def filter_candidates(cls, queryset, keywords: Iterable[str]):
+        """Narrow an Opportunity queryset to rows that can match any keyword"""
+        anchors = cls.anchor_terms(keywords)
+        if anchors is None:
+            return queryset
+
+        postings = OpportunityTerm.objects.filter(term__in=anchors).values('opportunity_id')
+        return queryset.filter(Q(pk__in=postings) | Q(indexed_at__isnull=True))
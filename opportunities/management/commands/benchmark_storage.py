@@ -0,0 +1,141 @@
+"""
+Management command to measure opportunity storage size and /api/match/ latency
+"""
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory
+
+from opportunities.models import Opportunity, UserProfile
+from opportunities.views import match_opportunities
+
+
+class Command(BaseCommand):
+    help = (
+        'Report database size and /api/match/ latency; run before and after a '
+        'storage change (e.g. compress_opportunity_text with COMPRESS_TEXT_FIELDS on) to compare'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile',
+            type=str,
+            help='Firebase UID of the profile to request matches for (default: first profile)',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=20,
+            help='Number of timed /api/match/ requests',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='Matches per request',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON',
+        )
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.order_by('pk')
+        if options.get('profile'):
+            profiles = profiles.filter(firebase_uid=options['profile'])
+        profile = profiles.first()
+        if profile is None:
+            raise CommandError('No matching profile to benchmark /api/match/ with')
+
+        results = {
+            'opportunities': Opportunity.objects.count(),
+            **self._storage(),
+            'scan_seconds': self._time_scan(),
+            **self._time_match(profile, max(1, options['requests']), options['limit']),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        mb = 1024 * 1024
+        self.stdout.write(f"Opportunities:        {results['opportunities']}")
+        if results['database_bytes'] is not None:
+            self.stdout.write(f"Database size:        {results['database_bytes'] / mb:.1f} MB")
+        if results['table_bytes'] is not None:
+            self.stdout.write(f"Opportunities table:  {results['table_bytes'] / mb:.1f} MB")
+        self.stdout.write(f"Stored text columns:  {results['text_bytes'] / mb:.1f} MB")
+        self.stdout.write(f"Full-row scan:        {results['scan_seconds'] * 1000:.0f} ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"/api/match/ latency:  p50 {results['match_p50_ms']:.1f} ms, "
+            f"p95 {results['match_p95_ms']:.1f} ms ({results['match_requests']} requests)"
+        ))
+
+    @staticmethod
+    def _storage():
+        """Sizes as stored by the database (compressed values count compressed)"""
+        table = Opportunity._meta.db_table
+        database_bytes = table_bytes = None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT SUM(LENGTH(description)), SUM(LENGTH(summary)) FROM {connection.ops.quote_name(table)}'
+            )
+            text_bytes = sum(value or 0 for value in cursor.fetchone())
+
+            if connection.vendor == 'sqlite':
+                cursor.execute('PRAGMA page_count')
+                pages = cursor.fetchone()[0]
+                cursor.execute('PRAGMA page_size')
+                database_bytes = pages * cursor.fetchone()[0]
+                try:
+                    # Needs SQLite built with the dbstat virtual table
+                    cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [table])
+                    table_bytes = cursor.fetchone()[0]
+                except Exception:
+                    table_bytes = None
+            elif connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_database_size(current_database()), pg_total_relation_size(%s)', [table])
+                database_bytes, table_bytes = cursor.fetchone()
+
+        return {'database_bytes': database_bytes, 'table_bytes': table_bytes, 'text_bytes': text_bytes}
+
+    @staticmethod
+    def _time_scan():
+        """A query that has to read every row, like unindexed list filters"""
+        started = time.perf_counter()
+        Opportunity.objects.filter(title__icontains='benchmark-no-such-title').count()
+        return time.perf_counter() - started
+
+    @staticmethod
+    def _time_match(profile, requests, limit):
+        """
+        Time the view inside a transaction that is rolled back, so the
+        matches and watermark it stores for the profile are left as found
+        """
+        factory = APIRequestFactory()
+        payload = {'firebase_uid': profile.firebase_uid, 'limit': limit}
+
+        timings = []
+        with transaction.atomic():
+            # The first call may rescore; the timed ones read stored matches
+            match_opportunities(factory.post('/api/match/', payload, format='json'))
+
+            for _ in range(requests):
+                started = time.perf_counter()
+                response = match_opportunities(factory.post('/api/match/', payload, format='json'))
+                response.render()
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f'/api/match/ returned {response.status_code}: {response.data}')
+            transaction.set_rollback(True)
+
+        timings.sort()
+        return {
+            'match_requests': requests,
+            'match_p50_ms': statistics.median(timings),
+            'match_p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        }
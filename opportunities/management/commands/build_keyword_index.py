@@ -0,0 +1,51 @@
+"""
+Management command to build the inverted keyword index for opportunities
+"""
+from django.core.management.base import BaseCommand
+from opportunities.keywords import KeywordIndex
+from opportunities.models import Opportunity
+
+
+class Command(BaseCommand):
+    help = 'Build the inverted keyword index used for match candidate generation'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Reindex every opportunity (default: only unindexed ones)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of opportunities indexed per transaction',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        
+        queryset = Opportunity.objects.only(
+            'id', 'search_text', 'title', 'description', 'summary', 'agency', 'department'
+        ).order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(indexed_at__isnull=True)
+        
+        self.stdout.write(self.style.WARNING('Building keyword index...'))
+        
+        # Page by primary key instead of holding a cursor open on the rows
+        # each batch updates (indexed_at), which SQLite doesn't handle reliably
+        indexed = 0
+        postings = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            postings += KeywordIndex.index_opportunities(batch)
+            indexed += len(batch)
+            last_pk = batch[-1].pk
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {indexed} opportunities ({postings} postings)')
+        )
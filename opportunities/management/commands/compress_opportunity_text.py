@@ -0,0 +1,59 @@
+"""
+Management command to rewrite opportunity text in the form COMPRESS_TEXT_FIELDS asks for
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.functions import Cast
+
+from opportunities.models import Opportunity
+
+TEXT_FIELDS = ('description', 'summary')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compress long description/summary values when COMPRESS_TEXT_FIELDS is on, '
+        'or store them as plain text again when it is off'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of opportunities rewritten per transaction',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        mode = 'Compressing' if settings.COMPRESS_TEXT_FIELDS else 'Decompressing'
+        self.stdout.write(self.style.WARNING(f'{mode} opportunity text...'))
+
+        # The stored values, next to the decoded ones the fields return
+        queryset = Opportunity.objects.only('id', *TEXT_FIELDS).annotate(**{
+            f'stored_{field}': Cast(field, models.TextField()) for field in TEXT_FIELDS
+        }).order_by('pk')
+        fields = [Opportunity._meta.get_field(field) for field in TEXT_FIELDS]
+
+        rewritten = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            changed = [
+                opportunity for opportunity in batch
+                if any(
+                    field.get_prep_value(getattr(opportunity, field.attname))
+                    != getattr(opportunity, f'stored_{field.attname}')
+                    for field in fields
+                )
+            ]
+            if changed:
+                with transaction.atomic():
+                    Opportunity.objects.bulk_update(changed, list(TEXT_FIELDS))
+                rewritten += len(changed)
+
+        self.stdout.write(self.style.SUCCESS(f'Rewrote {rewritten} opportunities'))
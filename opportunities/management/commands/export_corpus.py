@@ -0,0 +1,61 @@
+"""
+Management command to export the opportunity corpus as a compressed snapshot
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from opportunities.snapshots import SNAPSHOT_CHUNK_SIZE, CorpusSnapshot, SnapshotError
+
+
+class Command(BaseCommand):
+    help = 'Export opportunities and sync checkpoints to a snapshot directory for import_corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directory',
+            type=str,
+            help='Directory to write the manifest and chunk files to',
+        )
+        parser.add_argument(
+            '--collections',
+            nargs='+',
+            type=str,
+            help='Specific collections to export (default: all)',
+        )
+        parser.add_argument(
+            '--with-terms',
+            action='store_true',
+            help='Include the keyword index postings (larger snapshot, no reindex after import)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=SNAPSHOT_CHUNK_SIZE,
+            help='Rows per chunk file',
+        )
+        parser.add_argument(
+            '--compression',
+            choices=['zstd', 'gzip'],
+            help='Chunk compression (default: zstd if the zstandard package is installed, else gzip)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Exporting opportunity corpus...'))
+        started = time.monotonic()
+        
+        try:
+            manifest = CorpusSnapshot.export(
+                options['directory'],
+                collections=options.get('collections'),
+                with_terms=options['with_terms'],
+                chunk_size=max(1, options['chunk_size']),
+                compression=options.get('compression'),
+            )
+        except SnapshotError as e:
+            raise CommandError(str(e))
+        
+        summary = ', '.join(f"{spec['rows']} {table}" for table, spec in manifest['tables'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {summary} ({manifest['compression']}) in {time.monotonic() - started:.1f}s"
+        ))
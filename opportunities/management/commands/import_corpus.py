@@ -0,0 +1,37 @@
+"""
+Management command to bootstrap an empty database from an export_corpus snapshot
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from opportunities.snapshots import CorpusSnapshot, SnapshotError
+
+
+class Command(BaseCommand):
+    help = 'Load an export_corpus snapshot into an empty database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directory',
+            type=str,
+            help='Snapshot directory containing manifest.json',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Importing opportunity corpus...'))
+        started = time.monotonic()
+        
+        try:
+            loaded = CorpusSnapshot.load(options['directory'])
+        except SnapshotError as e:
+            raise CommandError(str(e))
+        
+        summary = ', '.join(f'{rows} {table}' for table, rows in loaded.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {summary} in {time.monotonic() - started:.1f}s'
+        ))
+        if 'opportunity_terms' not in loaded:
+            self.stdout.write(
+                'Snapshot has no keyword postings; run build_keyword_index to index the corpus'
+            )
@@ -0,0 +1,227 @@
+"""
+Management command to recompute matches for every user profile in parallel
+"""
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from opportunities.management.options import parse_since
+from opportunities.matching import MATCH_SCORE_FIELDS, OpportunityMatcher, SCORING_FIELDS, WATERMARK_MARGIN
+from opportunities.models import Opportunity, OpportunityMatch, UserProfile
+
+# Read-only corpus snapshot, inherited by forked workers
+_snapshot = None
+_since = None
+_engine = None
+
+# Keyword counts per interest signature, computed once per worker
+_keyword_counts = OrderedDict()
+KEYWORD_COUNTS_CACHE_SIZE = 32
+
+
+def _init_worker(snapshot, since):
+    global _snapshot, _since, _engine
+    _snapshot = snapshot
+    _since = since
+    _engine = None
+    _keyword_counts.clear()
+
+
+def _cached_keyword_counts(matcher):
+    """Scan the snapshot once per distinct interest signature"""
+    signature = matcher.get_interest_signature()
+    if signature in _keyword_counts:
+        _keyword_counts.move_to_end(signature)
+        return _keyword_counts[signature]
+    
+    collections = set(matcher.get_relevant_collections())
+    counts = matcher.keyword_counts(
+        opp for opp in _snapshot.values() if opp.collection_name in collections
+    )
+    _keyword_counts[signature] = counts
+    if len(_keyword_counts) > KEYWORD_COUNTS_CACHE_SIZE:
+        _keyword_counts.popitem(last=False)
+    return counts
+
+
+def _score_profiles(profile_ids):
+    """
+    Worker: score a shard of profiles against the shared snapshot
+    Returns: [(profile_id, match_signature, [(opportunity_id, [MATCH_SCORE_FIELDS values])])]
+    """
+    global _engine
+    results = []
+    for profile in UserProfile.objects.filter(pk__in=profile_ids):
+        matcher = OpportunityMatcher(profile)
+        if isinstance(_snapshot, dict):
+            # Shared keyword counts; only state/urgency/win rate are per profile
+            counts = _cached_keyword_counts(matcher)
+            matches = matcher.score_opportunities(
+                (_snapshot[pk] for pk in counts), keyword_counts=counts
+            )
+        else:
+            if _engine is None:
+                from opportunities.vector_scoring import SparseScoringEngine
+                _engine = SparseScoringEngine(_snapshot)
+            matches = _engine.score(matcher, since=_since)
+
+        rows = [
+            (m.opportunity_id, [getattr(m, field) for field in MATCH_SCORE_FIELDS])
+            for m in matches
+        ]
+        results.append((profile.pk, matcher.get_match_signature(), rows))
+
+    connections.close_all()
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Recompute opportunity matches for all user profiles using a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: CPU count, 0 = in-process)',
+        )
+        parser.add_argument(
+            '--profiles',
+            nargs='+',
+            type=str,
+            help='Firebase UIDs of the profiles to rematch (default: all)',
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Only rescore opportunities synced at or after this date/datetime (ISO 8601)',
+        )
+        parser.add_argument(
+            '--shard-size',
+            type=int,
+            default=25,
+            help='Profiles per worker task (profiles sharing interests go to consecutive tasks)',
+        )
+        parser.add_argument(
+            '--engine',
+            choices=['python', 'sparse'],
+            default='python',
+            help='Scoring engine shared by the workers',
+        )
+
+    def handle(self, *args, **options):
+        since = parse_since(options.get('since'))
+        workers = options['workers']
+        shard_size = max(1, options['shard_size'])
+
+        profiles = UserProfile.objects.all()
+        if options.get('profiles'):
+            profiles = profiles.filter(firebase_uid__in=options['profiles'])
+        profiles = {p.pk: p for p in profiles}
+
+        if not profiles:
+            self.stdout.write(self.style.WARNING('No profiles to rematch'))
+            return
+
+        self.stdout.write(self.style.WARNING(f'Rematching {len(profiles)} profiles...'))
+        started = time.monotonic()
+        run_started = timezone.now()
+
+        snapshot = self._load_snapshot(options['engine'], since)
+        self.stdout.write(f'Corpus snapshot loaded in {time.monotonic() - started:.1f}s')
+
+        shards, signatures = self._shard_by_signature(profiles, shard_size)
+        self.stdout.write(f'{signatures} distinct interest signatures in {len(shards)} shards')
+
+        matched_profiles = 0
+        written = 0
+        for results in self._run_shards(shards, snapshot, since, workers):
+            for profile_id, signature, rows in results:
+                written += self._write_results(profiles[profile_id], signature, rows, run_started, since)
+                matched_profiles += 1
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rematched {matched_profiles} profiles ({written} matches) in {elapsed:.1f}s: '
+            f'{matched_profiles / elapsed:.1f} profiles/s, {written / elapsed:.0f} matches/s'
+        ))
+
+    @staticmethod
+    def _shard_by_signature(profiles, shard_size):
+        """
+        Cut profiles ordered by interest signature into shards of
+        shard_size. Small groups share a shard, letting a worker reuse its
+        keyword counts; a group larger than a shard is spread over
+        consecutive shards so one popular signature doesn't leave the other
+        workers idle, at the cost of one scan per worker it reaches.
+        """
+        groups = defaultdict(list)
+        for pk, profile in profiles.items():
+            groups[OpportunityMatcher(profile).get_interest_signature()].append(pk)
+        
+        ordered = [
+            pk
+            for signature in sorted(groups, key=lambda s: -len(groups[s]))
+            for pk in sorted(groups[signature])
+        ]
+        shards = [ordered[start:start + shard_size] for start in range(0, len(ordered), shard_size)]
+        return shards, len(groups)
+
+    @staticmethod
+    def _load_snapshot(engine, since):
+        """Load the corpus once in the parent; workers only read it"""
+        if engine == 'sparse':
+            from opportunities.vector_scoring import CorpusMatrix
+            return CorpusMatrix.load()
+
+        queryset = Opportunity.objects.filter(tombstoned_at__isnull=True).only(*SCORING_FIELDS)
+        if since:
+            queryset = queryset.filter(last_synced__gte=since)
+        return {opp.pk: opp for opp in queryset.iterator(chunk_size=2000)}
+
+    @staticmethod
+    def _run_shards(shards, snapshot, since, workers):
+        """Yield shard results, from a forked process pool when available"""
+        if workers <= 0 or 'fork' not in multiprocessing.get_all_start_methods():
+            _init_worker(snapshot, since)
+            for shard in shards:
+                yield _score_profiles(shard)
+            return
+
+        # Forked children must open their own database connections
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker,
+            initargs=(snapshot, since),
+        ) as pool:
+            futures = [pool.submit(_score_profiles, shard) for shard in shards]
+            for future in as_completed(futures):
+                yield future.result()
+
+    @staticmethod
+    def _write_results(profile, signature, rows, run_started, since):
+        """Single writer: batched upsert of one profile's matches"""
+        matcher = OpportunityMatcher(profile)
+        matches = [
+            OpportunityMatch(
+                user_profile=profile,
+                opportunity_id=opportunity_id,
+                **dict(zip(MATCH_SCORE_FIELDS, values))
+            )
+            for opportunity_id, values in rows
+        ]
+        scope = {'opportunity__last_synced__gte': since} if since else None
+        matcher.save_matches(matches, run_started, scope=scope)
+
+        # A full rescore lets the next /api/match/ call run incrementally
+        if since is None:
+            matcher.update_watermark(run_started - WATERMARK_MARGIN, signature)
+        return len(matches)
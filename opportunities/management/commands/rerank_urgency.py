@@ -0,0 +1,49 @@
+"""
+Management command to refresh date-dependent match scores as deadlines approach
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from opportunities.matching import OpportunityMatcher
+from opportunities.models import Opportunity, OpportunityMatch
+
+
+class Command(BaseCommand):
+    help = 'Re-rank matches whose deadline moved to another urgency bucket (no text scanning)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of matches updated per statement',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # Only rows whose stored bucket differs from today's need an update;
+        # rows without components are left for the next full rematch
+        stale = OpportunityMatch.objects.exclude(urgency_bucket='').annotate(
+            current_bucket=Opportunity.urgency_bucket_expression('opportunity__')
+        ).exclude(urgency_bucket=F('current_bucket'))
+        pending = list(stale.values_list('pk', 'current_bucket'))
+
+        self.stdout.write(self.style.WARNING(f'Re-ranking {len(pending)} matches...'))
+
+        for offset in range(0, len(pending), batch_size):
+            buckets = dict(pending[offset:offset + batch_size])
+            matches = OpportunityMatch.objects.filter(pk__in=list(buckets)).only(
+                'id', 'keyword_score', 'base_points', 'win_rate_reasoning'
+            )
+            matches = list(matches)
+            for match in matches:
+                OpportunityMatcher.apply_urgency(match, buckets[match.pk])
+            with transaction.atomic():
+                OpportunityMatch.objects.bulk_update(
+                    matches,
+                    ['relevance_score', 'win_rate', 'win_rate_reasoning', 'urgency_bucket'],
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'Re-ranked {len(pending)} matches'))
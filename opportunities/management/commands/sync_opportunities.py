@@ -1,8 +1,12 @@
 """
 Management command to sync opportunities from Firebase
 """
-from django.core.management.base import BaseCommand
-from opportunities.firebase_integration import FirebaseService
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from opportunities.firebase_integration import SYNC_COLLECTIONS, FirebaseService
+from opportunities.management.options import parse_since
+from opportunities.models import SyncState
 
 
 class Command(BaseCommand):
@@ -20,22 +24,82 @@ class Command(BaseCommand):
             type=int,
             help='Limit number of opportunities per collection',
         )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-read every document instead of resuming from the stored sync position',
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Only fetch documents updated after this date/datetime (ISO 8601); '
+                 'requires FIRESTORE_UPDATED_FIELD',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Collections read concurrently (default: 1, sequential); one thread writes',
+        )
+        parser.add_argument(
+            '--source',
+            type=str,
+            help="Document source: 'firestore', 'jsonl:/path/to/dir' or 'memory' "
+                 "(default: OPPORTUNITY_SOURCE)",
+        )
+        parser.add_argument(
+            '--skip-matching',
+            action='store_true',
+            help='Do not match synced opportunities against user profiles',
+        )
 
     def handle(self, *args, **options):
         collections = options.get('collections')
         limit = options.get('limit')
+        since = parse_since(options.get('since'))
+        
+        if since and not settings.FIRESTORE_UPDATED_FIELD:
+            raise CommandError('--since requires FIRESTORE_UPDATED_FIELD to be set')
+        if since and options.get('full'):
+            raise CommandError('--since and --full are mutually exclusive')
+        if since:
+            # An unfinished full pass resumes first and would ignore --since
+            unfinished = SyncState.objects.filter(
+                collection_name__in=collections or SYNC_COLLECTIONS
+            ).exclude(scan_cursor='').values_list('collection_name', flat=True)
+            if unfinished:
+                raise CommandError(
+                    f"--since can't be used while a full pass is unfinished for: "
+                    f"{', '.join(sorted(unfinished))}. Run without --since to finish it, "
+                    f"or with --full to restart it"
+                )
+        
+        if options.get('source'):
+            try:
+                FirebaseService.use_source(options['source'])
+            except ValueError as e:
+                raise CommandError(str(e))
         
         self.stdout.write(self.style.WARNING('Starting opportunity sync...'))
         
         try:
             count = FirebaseService.sync_all_opportunities(
                 collections=collections,
-                limit_per_collection=limit
+                limit_per_collection=limit,
+                match_on_ingest=not options.get('skip_matching'),
+                full=options.get('full'),
+                since=since,
+                workers=options['workers']
             )
             
             self.stdout.write(
                 self.style.SUCCESS(f'Successfully synced {count} opportunities')
             )
+            
+            if settings.MATCHING_ENGINE == 'sparse':
+                from opportunities.vector_scoring import CorpusMatrix
+                corpus = CorpusMatrix.refresh()
+                self.stdout.write(f'Rebuilt the corpus matrix ({corpus.matrix.shape[0]} opportunities)')
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'Error syncing opportunities: {e}')
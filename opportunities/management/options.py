@@ -0,0 +1,27 @@
+"""
+Option parsing shared by the management commands
+"""
+from datetime import datetime, time as dt_time
+
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def parse_since(value):
+    """
+    Parse a --since date or datetime (ISO 8601); a date means its midnight
+    and naive values are in the current time zone
+    Returns: aware datetime, or None when value is empty
+    """
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid --since value: {value}')
+        since = datetime.combine(day, dt_time.min)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
@@ -1,10 +1,47 @@
 """
 Intelligent matching algorithm for fundraising opportunities
 """
-import re
-from typing import List, Dict, Tuple
+import hashlib
+import heapq
+import json
+from datetime import timedelta
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+from django.db import transaction
+from django.utils import timezone
+from .keywords import KeywordIndex, KeywordMatcher, build_search_text
 from .models import Opportunity, UserProfile, OpportunityMatch
 
+# Rows per INSERT ... ON CONFLICT statement when saving matches
+MATCH_BATCH_SIZE = 500
+
+# Opportunities fetched per round trip when streaming the corpus
+STREAM_CHUNK_SIZE = 2000
+
+# Opportunity columns read when scoring (keyword text plus win rate inputs)
+SCORING_FIELDS = ('id', 'collection_name', 'search_text', 'state', 'close_date', 'deadline')
+
+# OpportunityMatch columns written by every scoring path
+MATCH_SCORE_FIELDS = (
+    'relevance_score', 'win_rate', 'win_rate_reasoning',
+    'keyword_score', 'base_points', 'urgency_bucket', 'keyword_counts',
+)
+
+# Opportunity columns the win rate and urgency need (no text)
+WIN_RATE_FIELDS = ('id', 'collection_name', 'state', 'close_date', 'deadline')
+
+# How far a profile's match watermark trails the start of its run.
+# last_synced is stamped when a sync writes a row, before its transaction
+# commits, so rows committed just after a run read the corpus can carry an
+# earlier time; the margin makes the next incremental run rescore them.
+WATERMARK_MARGIN = timedelta(minutes=5)
+
+# Urgency bucket -> (relevance multiplier, timing points, timing detail)
+URGENCY_FACTORS = {
+    "urgent": (1.2, 5, "Deadline within 30 days"),
+    "soon": (1.1, 3, "Deadline within 3 months"),
+    "ongoing": (1.0, 2, "Ongoing or long-term opportunity"),
+}
+
 
 class OpportunityMatcher:
     """Matches opportunities to user profiles based on multiple criteria"""
@@ -20,6 +57,7 @@ class OpportunityMatcher:
         self.user_profile = user_profile
         self.interests_main = [k.lower() for k in (user_profile.interests_main or [])]
         self.interests_sub = [k.lower() for k in (user_profile.interests_sub or [])]
+        self.keyword_matcher = KeywordMatcher(self.interests_main + self.interests_sub)
         
     def get_relevant_collections(self) -> List[str]:
         """Get collection names based on user's funding type preferences"""
@@ -28,16 +66,34 @@ class OpportunityMatcher:
             collections.update(self.COLLECTION_MAP.get(funding_type, []))
         return list(collections)
     
+    def get_interest_signature(self) -> str:
+        """
+        Canonical hash of what keyword hit counts depend on: the collections
+        scanned and the set of keywords. Profiles sharing it share counts.
+        """
+        criteria = {
+            'collections': sorted(set(self.get_relevant_collections())),
+            'keywords': self.keyword_matcher.keywords,
+        }
+        return hashlib.sha256(json.dumps(criteria, sort_keys=True).encode()).hexdigest()
+    
+    def get_match_signature(self) -> str:
+        """Hash of the profile criteria that stored matches depend on"""
+        criteria = {
+            'funding_types': sorted(self.user_profile.funding_types or []),
+            'interests_main': sorted(self.interests_main),
+            'interests_sub': sorted(self.interests_sub),
+            'state': (self.user_profile.state or '').lower(),
+        }
+        return hashlib.sha256(json.dumps(criteria, sort_keys=True).encode()).hexdigest()
+    
     def calculate_keyword_score(self, opportunity: Opportunity) -> Tuple[float, Dict]:
         """Calculate relevance score based on keyword matches"""
-        search_text = ' '.join([
-            opportunity.title or "",
-            opportunity.description or "",
-            opportunity.summary or "",
-            opportunity.agency or "",
-            opportunity.department or "",
-        ]).lower()
-        
+        search_text = build_search_text(opportunity)
+        return self.score_keyword_counts(self.keyword_matcher.count(search_text))
+    
+    def score_keyword_counts(self, counts: Dict[str, int]) -> Tuple[float, Dict]:
+        """Turn per-keyword hit counts into a weighted score and match details"""
         match_details = {
             'main_matches': [],
             'sub_matches': [],
@@ -48,23 +104,15 @@ class OpportunityMatcher:
         
         # Main keywords have higher weight
         for keyword in self.interests_main:
-            if not keyword:
-                continue
-            pattern = re.compile(r'\b' + re.escape(keyword) + r'\b', re.IGNORECASE)
-            matches = pattern.findall(search_text)
-            if matches:
-                count = len(matches)
+            count = counts.get(keyword)
+            if count:
                 score += count * 3.0
                 match_details['main_matches'].append({'keyword': keyword, 'count': count})
         
         # Sub keywords have standard weight
         for keyword in self.interests_sub:
-            if not keyword:
-                continue
-            pattern = re.compile(r'\b' + re.escape(keyword) + r'\b', re.IGNORECASE)
-            matches = pattern.findall(search_text)
-            if matches:
-                count = len(matches)
+            count = counts.get(keyword)
+            if count:
                 score += count * 1.0
                 match_details['sub_matches'].append({'keyword': keyword, 'count': count})
         
@@ -127,17 +175,7 @@ class OpportunityMatcher:
         })
         
         # Factor 5: Timing/Urgency (0-5 points)
-        urgency_bucket = opportunity.urgency_bucket
-        if urgency_bucket == "urgent":
-            timing_points = 5
-            timing_detail = "Deadline within 30 days"
-        elif urgency_bucket == "soon":
-            timing_points = 3
-            timing_detail = "Deadline within 3 months"
-        else:
-            timing_points = 2
-            timing_detail = "Ongoing or long-term opportunity"
-        
+        _, timing_points, timing_detail = URGENCY_FACTORS[opportunity.urgency_bucket]
         reasoning['factors'].append({
             'name': 'Timing',
             'score': timing_points,
@@ -154,46 +192,280 @@ class OpportunityMatcher:
         
         return win_rate, reasoning
     
-    def match_opportunities(self, opportunities: List[Opportunity] = None) -> List[OpportunityMatch]:
-        """Match opportunities to user profile"""
+    def match_opportunities(self, opportunities: List[Opportunity] = None, full: bool = False,
+                            engine=None, top_k: int = None) -> List[OpportunityMatch]:
+        """
+        Match opportunities to user profile
+        
+        Without an explicit opportunity list the run is incremental: only
+        opportunities synced since the profile's last match run are scored,
+        unless the matching criteria changed or full=True. For these corpus
+        runs an engine such as vector_scoring.SparseScoringEngine scores all
+        candidates in one batch instead of object by object.
+        
+        The corpus is streamed in chunks with only the scoring columns, and
+        matches are written as each batch fills. With top_k set, only the best
+        top_k matches are kept in memory and returned, with their full
+        Opportunity rows loaded; top_k=0 keeps none, for callers that read
+        the stored matches afterwards.
+        Returns: the matches computed by this run
+        """
+        run_started = timezone.now()
+        scope = None
+        signature = None
+        since = None
+        
         if opportunities is None:
+            signature = self.get_match_signature()
+            if not full and self.user_profile.match_signature == signature:
+                since = self.user_profile.last_matched_at
+            
             relevant_collections = self.get_relevant_collections()
-            if not relevant_collections:
-                return []
+            if since:
+                scope = {'opportunity__last_synced__gte': since}
             
-            opportunities = Opportunity.objects.filter(
-                collection_name__in=relevant_collections
-            )
+            if engine is not None:
+                scored = iter(engine.score(self, since=since))
+            elif relevant_collections:
+                opportunities = Opportunity.objects.filter(
+                    collection_name__in=relevant_collections, tombstoned_at__isnull=True
+                ).only(*SCORING_FIELDS)
+                if since:
+                    opportunities = opportunities.filter(last_synced__gte=since)
+                opportunities = KeywordIndex.filter_candidates(
+                    opportunities, self.keyword_matcher.keywords
+                )
+                scored = self.score_opportunities(opportunities.iterator(chunk_size=STREAM_CHUNK_SIZE))
+            else:
+                scored = iter(())
+        else:
+            opportunities = list(opportunities)
+            scope = {'opportunity_id__in': [opp.pk for opp in opportunities]}
+            scored = self.score_opportunities(opportunities)
         
         matches = []
+        top = []
+        batch = []
         
-        for opportunity in opportunities:
-            keyword_score, match_details = self.calculate_keyword_score(opportunity)
+        with transaction.atomic():
+            for seq, match in enumerate(scored):
+                batch.append(match)
+                if len(batch) >= MATCH_BATCH_SIZE:
+                    self.upsert_matches(batch)
+                    batch = []
+                
+                if top_k is None:
+                    matches.append(match)
+                elif top_k:
+                    # Min-heap of the best top_k; seq breaks ties in scan order
+                    entry = (match.relevance_score, match.win_rate, -seq, match)
+                    if len(top) < top_k:
+                        heapq.heappush(top, entry)
+                    elif entry[:3] > top[0][:3]:
+                        heapq.heapreplace(top, entry)
             
-            if keyword_score == 0:
-                continue
-            
-            urgency_multiplier = 1.2 if opportunity.urgency_bucket == "urgent" else (1.1 if opportunity.urgency_bucket == "soon" else 1.0)
-            relevance_score = keyword_score * urgency_multiplier
-            
-            win_rate, win_rate_reasoning = self.calculate_win_rate(opportunity, keyword_score, match_details)
-            
-            match, created = OpportunityMatch.objects.get_or_create(
-                user_profile=self.user_profile,
-                opportunity=opportunity,
-                defaults={
-                    'relevance_score': relevance_score,
-                    'win_rate': win_rate,
-                    'win_rate_reasoning': win_rate_reasoning
-                }
-            )
-            
-            if not created:
-                match.relevance_score = relevance_score
-                match.win_rate = win_rate
-                match.win_rate_reasoning = win_rate_reasoning
-                match.save()
-            
-            matches.append(match)
+            self.upsert_matches(batch)
+            self.delete_stale_matches(run_started, scope=scope)
+            if signature is not None:
+                self.update_watermark(run_started - WATERMARK_MARGIN, signature)
+        
+        if top_k:
+            matches = [entry[3] for entry in sorted(top, key=lambda e: e[:3], reverse=True)]
+            full_rows = Opportunity.objects.in_bulk([m.opportunity_id for m in matches])
+            for match in matches:
+                match.opportunity = full_rows[match.opportunity_id]
         
         return matches
+    
+    def rematch_interest_changes(self, previous: 'OpportunityMatcher') -> bool:
+        """
+        Update stored matches after the profile's keywords were edited
+        
+        previous is a matcher for the profile as it was before the edit.
+        Stored matches keep per-keyword hit counts, so removed keywords are
+        subtracted from them and only added keywords are scanned for, among
+        opportunities the watermark covers. Scores are then recomputed from
+        the counts. The watermark time is kept and only its signature moves,
+        so the next incremental run still picks up later syncs.
+        Returns: False when the stored matches cannot be reused and a full
+        rematch is needed
+        """
+        since = self.user_profile.last_matched_at
+        if (since is None
+                or self.user_profile.match_signature != previous.get_match_signature()
+                or set(self.get_relevant_collections()) != set(previous.get_relevant_collections())):
+            return False
+        
+        signature = self.get_match_signature()
+        stored = OpportunityMatch.objects.filter(user_profile=self.user_profile)
+        if stored.filter(is_dismissed=False, keyword_counts={}).exists():
+            # Matches saved before per-keyword counts were kept
+            return False
+        
+        run_started = timezone.now()
+        old_keywords = set(previous.keyword_matcher.keywords)
+        new_keywords = set(self.keyword_matcher.keywords)
+        removed = old_keywords - new_keywords
+        added = KeywordMatcher(new_keywords - old_keywords)
+        
+        counts = {
+            opportunity_id: {k: c for k, c in keyword_counts.items() if k not in removed}
+            for opportunity_id, keyword_counts in stored.values_list('opportunity_id', 'keyword_counts')
+        }
+        
+        if added:
+            candidates = Opportunity.objects.filter(
+                collection_name__in=self.get_relevant_collections(),
+                last_synced__lte=since,
+                tombstoned_at__isnull=True
+            ).only('id', 'search_text')
+            candidates = KeywordIndex.filter_candidates(candidates, added.keywords)
+            for opportunity in candidates.iterator(chunk_size=STREAM_CHUNK_SIZE):
+                hits = added.count(build_search_text(opportunity))
+                if hits:
+                    counts.setdefault(opportunity.pk, {}).update(hits)
+        
+        ids = list(counts)
+        with transaction.atomic():
+            for offset in range(0, len(ids), MATCH_BATCH_SIZE):
+                chunk = Opportunity.objects.only(*WIN_RATE_FIELDS).in_bulk(ids[offset:offset + MATCH_BATCH_SIZE])
+                self.upsert_matches([
+                    match for match in (
+                        self.score_opportunity(opportunity, counts[pk]) for pk, opportunity in chunk.items()
+                    ) if match is not None
+                ])
+            self.delete_stale_matches(run_started)
+            self.update_watermark(since, signature)
+        
+        return True
+    
+    def keyword_counts(self, opportunities: Iterable[Opportunity]) -> Dict[int, Dict[str, int]]:
+        """Per-keyword hit counts for every opportunity with at least one hit"""
+        counts = {}
+        for opportunity in opportunities:
+            hits = self.keyword_matcher.count(build_search_text(opportunity))
+            if hits:
+                counts[opportunity.pk] = hits
+        return counts
+    
+    def score_opportunities(self, opportunities: Iterable[Opportunity],
+                            keyword_counts: Dict[int, Dict[str, int]] = None) -> Iterator[OpportunityMatch]:
+        """
+        Yield an unsaved OpportunityMatch for every opportunity that scores
+        
+        keyword_counts, as returned by keyword_counts() for any profile with
+        the same interest signature, skips the text scan so only the
+        profile-specific factors are computed here.
+        """
+        for opportunity in opportunities:
+            if keyword_counts is None:
+                match = self.score_opportunity(opportunity)
+            else:
+                match = self.score_opportunity(opportunity, keyword_counts.get(opportunity.pk, {}))
+            if match is not None:
+                yield match
+    
+    def score_opportunity(self, opportunity: Opportunity,
+                          counts: Dict[str, int] = None) -> Optional[OpportunityMatch]:
+        """
+        Score one opportunity, scanning its text unless hit counts are given
+        Returns: an unsaved OpportunityMatch, or None when no keyword matched
+        """
+        if counts is None:
+            counts = self.keyword_matcher.count(build_search_text(opportunity))
+        keyword_score, match_details = self.score_keyword_counts(counts)
+        
+        if keyword_score == 0:
+            return None
+        
+        urgency_bucket = opportunity.urgency_bucket
+        urgency_multiplier = URGENCY_FACTORS[urgency_bucket][0]
+        relevance_score = keyword_score * urgency_multiplier
+        
+        win_rate, win_rate_reasoning = self.calculate_win_rate(opportunity, keyword_score, match_details)
+        
+        return OpportunityMatch(
+            user_profile=self.user_profile,
+            opportunity=opportunity,
+            relevance_score=relevance_score,
+            win_rate=win_rate,
+            win_rate_reasoning=win_rate_reasoning,
+            keyword_score=keyword_score,
+            base_points=self.base_points(win_rate_reasoning),
+            urgency_bucket=urgency_bucket,
+            keyword_counts=counts
+        )
+    
+    @staticmethod
+    def base_points(reasoning: Dict) -> float:
+        """Win rate points from every factor except Timing"""
+        return sum(f['score'] for f in reasoning['factors'] if f['name'] != 'Timing')
+    
+    @staticmethod
+    def apply_urgency(match: OpportunityMatch, urgency_bucket: str):
+        """
+        Recompute the date-dependent parts of a stored match (relevance
+        multiplier, Timing factor, win rate) from its keyword_score and
+        base_points, without rescanning any text
+        """
+        urgency_multiplier, timing_points, timing_detail = URGENCY_FACTORS[urgency_bucket]
+        match.relevance_score = match.keyword_score * urgency_multiplier
+        
+        reasoning = match.win_rate_reasoning
+        for factor in reasoning.get('factors', []):
+            if factor['name'] == 'Timing':
+                factor['score'] = timing_points
+                factor['details'] = timing_detail
+        total_score = match.base_points + timing_points
+        reasoning['total_score'] = total_score
+        match.win_rate = (total_score / reasoning.get('max_score', 100)) * 100
+        match.urgency_bucket = urgency_bucket
+    
+    def update_watermark(self, run_started, signature: str):
+        """
+        Record the profile's match watermark: opportunities synced at or after it
+        are rescored by the next incremental run. Runs pass their start time
+        less WATERMARK_MARGIN.
+        """
+        UserProfile.objects.filter(pk=self.user_profile.pk).update(
+            last_matched_at=run_started,
+            match_signature=signature
+        )
+        self.user_profile.last_matched_at = run_started
+        self.user_profile.match_signature = signature
+    
+    def save_matches(self, matches: List[OpportunityMatch], run_started, scope: Dict = None):
+        """
+        Upsert scored matches in batches and drop rows that no longer score.
+        
+        Rows not refreshed by this run (updated before run_started) are stale,
+        limited by the scope filter when only part of the corpus was scored.
+        Dismissed rows are kept so a pass survives later rescoring.
+        """
+        with transaction.atomic():
+            for offset in range(0, len(matches), MATCH_BATCH_SIZE):
+                self.upsert_matches(matches[offset:offset + MATCH_BATCH_SIZE])
+            self.delete_stale_matches(run_started, scope=scope)
+    
+    @staticmethod
+    def upsert_matches(matches: List[OpportunityMatch]):
+        """Insert or update one batch of matches on (user_profile, opportunity)"""
+        if not matches:
+            return
+        OpportunityMatch.objects.bulk_create(
+            matches,
+            update_conflicts=True,
+            unique_fields=['user_profile', 'opportunity'],
+            update_fields=[*MATCH_SCORE_FIELDS, 'updated_at'],
+        )
+    
+    def delete_stale_matches(self, run_started, scope: Dict = None):
+        """Delete non-dismissed matches that this run did not refresh"""
+        stale = OpportunityMatch.objects.filter(
+            user_profile=self.user_profile,
+            updated_at__lt=run_started,
+            is_dismissed=False
+        )
+        if scope:
+            stale = stale.filter(**scope)
+        stale.delete()
@@ -5,9 +5,12 @@ This module handles matching opportunities to user profiles based on:
 - Keyword matching (main and sub interests)
 - Urgency buckets (urgent, soon, ongoing)
 """
+import heapq
 import re
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+from .keywords import KeywordMatcher
 
 
 class OpportunityMatcher:
@@ -30,69 +33,64 @@ class OpportunityMatcher:
             collections.update(cols)
         return list(collections)
     
+    @staticmethod
+    def _keyword_hits(
+        opportunity: Dict[str, Any],
+        interests_main: List[str],
+        interests_sub: List[str],
+        keyword_matcher: Optional[KeywordMatcher] = None
+    ) -> Tuple[int, List[Tuple[str, int]], List[Tuple[str, int]]]:
+        """
+        Count keyword hits without building the match details payload
+        Returns: (score, [(main keyword, count)], [(sub keyword, count)])
+        """
+        # Combine all searchable text, unless it was precomputed at sync time
+        search_text = opportunity.get('search_text')
+        if search_text is None:
+            search_text = " ".join([
+                str(opportunity.get('title', '')),
+                str(opportunity.get('description', '')),
+                str(opportunity.get('summary', '')),
+                str(opportunity.get('agency', '')),
+                str(opportunity.get('department', '')),
+            ]).lower()
+        
+        if keyword_matcher is None:
+            keyword_matcher = KeywordMatcher(list(interests_main) + list(interests_sub))
+        counts = keyword_matcher.count(search_text)
+        
+        main_hits = [(k, counts[k.lower()]) for k in interests_main if counts.get(k.lower())]
+        sub_hits = [(k, counts[k.lower()]) for k in interests_sub if counts.get(k.lower())]
+        
+        # Main keywords get 3x weight, sub keywords 1x
+        score = sum(count * 3 for _, count in main_hits) + sum(count for _, count in sub_hits)
+        return score, main_hits, sub_hits
+    
+    @staticmethod
+    def _match_details(main_hits: List[Tuple[str, int]], sub_hits: List[Tuple[str, int]]) -> Dict[str, Any]:
+        """Build the match details payload from keyword hits"""
+        return {
+            'main_keyword_matches': [{'keyword': k, 'count': c} for k, c in main_hits],
+            'sub_keyword_matches': [{'keyword': k, 'count': c} for k, c in sub_hits],
+            'total_matches': sum(c for _, c in main_hits) + sum(c for _, c in sub_hits),
+            'matched_keywords': list({k.lower() for k, _ in main_hits + sub_hits}),
+        }
+    
     @staticmethod
     def calculate_match_score(
         opportunity: Dict[str, Any],
         interests_main: List[str],
-        interests_sub: List[str]
+        interests_sub: List[str],
+        keyword_matcher: Optional[KeywordMatcher] = None
     ) -> Tuple[int, Dict[str, Any]]:
         """
         Calculate relevance score based on keyword matches
         Returns: (score, match_details)
         """
-        # Combine all searchable text
-        search_text = " ".join([
-            str(opportunity.get('title', '')),
-            str(opportunity.get('description', '')),
-            str(opportunity.get('summary', '')),
-            str(opportunity.get('agency', '')),
-            str(opportunity.get('department', '')),
-        ]).lower()
-        
-        score = 0
-        match_details = {
-            'main_keyword_matches': [],
-            'sub_keyword_matches': [],
-            'total_matches': 0,
-            'matched_keywords': set()
-        }
-        
-        # Check main interest keywords (higher weight)
-        for keyword in interests_main:
-            keyword_lower = keyword.lower()
-            # Use word boundary regex for exact matches
-            pattern = r'\b' + re.escape(keyword_lower) + r'\b'
-            matches = re.findall(pattern, search_text, re.IGNORECASE)
-            if matches:
-                count = len(matches)
-                score += count * 3  # Main keywords get 3x weight
-                match_details['main_keyword_matches'].append({
-                    'keyword': keyword,
-                    'count': count
-                })
-                match_details['matched_keywords'].add(keyword_lower)
-        
-        # Check sub-interest keywords
-        for keyword in interests_sub:
-            keyword_lower = keyword.lower()
-            pattern = r'\b' + re.escape(keyword_lower) + r'\b'
-            matches = re.findall(pattern, search_text, re.IGNORECASE)
-            if matches:
-                count = len(matches)
-                score += count  # Sub keywords get 1x weight
-                match_details['sub_keyword_matches'].append({
-                    'keyword': keyword,
-                    'count': count
-                })
-                match_details['matched_keywords'].add(keyword_lower)
-        
-        match_details['total_matches'] = (
-            sum(m['count'] for m in match_details['main_keyword_matches']) +
-            sum(m['count'] for m in match_details['sub_keyword_matches'])
+        score, main_hits, sub_hits = OpportunityMatcher._keyword_hits(
+            opportunity, interests_main, interests_sub, keyword_matcher
         )
-        match_details['matched_keywords'] = list(match_details['matched_keywords'])
-        
-        return score, match_details
+        return score, OpportunityMatcher._match_details(main_hits, sub_hits)
     
     @staticmethod
     def get_urgency_bucket(deadline: Any) -> str:
@@ -129,6 +127,49 @@ class OpportunityMatcher:
         except Exception:
             return 'ongoing'
     
+    @staticmethod
+    def _win_rate_points(
+        opportunity: Dict[str, Any],
+        match_score: int,
+        main_match_count: int
+    ) -> Dict[str, Any]:
+        """Points per win rate factor, without the reasoning payload"""
+        urgency = OpportunityMatcher.get_urgency_bucket(
+            opportunity.get('closeDate') or opportunity.get('deadline')
+        )
+        
+        completeness_score = 0
+        has_description = bool(opportunity.get('description') or opportunity.get('summary'))
+        has_contact = bool(opportunity.get('contactEmail') or opportunity.get('contactPhone'))
+        has_location = bool(opportunity.get('place') or opportunity.get('city') or opportunity.get('state'))
+        has_url = bool(opportunity.get('url') or opportunity.get('synopsisUrl'))
+        
+        completeness_score += 5 if has_description else 0
+        completeness_score += 3 if has_contact else 0
+        completeness_score += 3 if has_location else 0
+        completeness_score += 4 if has_url else 0
+        
+        return {
+            'keyword_match': min(40, match_score * 2),  # Cap at 40
+            'main_keywords': min(30, main_match_count * 10),
+            'urgency': {
+                'urgent': 5,   # Less time means more competition
+                'soon': 15,    # Sweet spot - enough time to apply well
+                'ongoing': 10  # No immediate deadline
+            }.get(urgency, 10),
+            'urgency_level': urgency,
+            'completeness': completeness_score,
+        }
+    
+    @staticmethod
+    def _win_rate_from_points(points: Dict[str, Any]) -> float:
+        """Final win rate (0-100%) from factor points; the factors total 100"""
+        total_score = (
+            points['keyword_match'] + points['main_keywords'] +
+            points['urgency'] + points['completeness']
+        )
+        return total_score / 100 * 100
+    
     @staticmethod
     def calculate_win_rate(
         opportunity: Dict[str, Any],
@@ -147,13 +188,11 @@ class OpportunityMatcher:
             'max_score': 0
         }
         
-        total_score = 0
-        max_score = 0
+        main_match_count = len(match_details.get('main_keyword_matches', []))
+        points = OpportunityMatcher._win_rate_points(opportunity, match_score, main_match_count)
         
         # Factor 1: Keyword match strength (40 points)
-        max_score += 40
-        keyword_score = min(40, match_score * 2)  # Cap at 40
-        total_score += keyword_score
+        keyword_score = points['keyword_match']
         reasoning['score_breakdown']['keyword_match'] = {
             'score': keyword_score,
             'max': 40,
@@ -169,49 +208,26 @@ class OpportunityMatcher:
             reasoning['factors'].append("Limited keyword matches - may be less relevant")
         
         # Factor 2: Main keyword matches (30 points)
-        max_score += 30
-        main_keyword_score = min(30, len(match_details.get('main_keyword_matches', [])) * 10)
-        total_score += main_keyword_score
+        main_keyword_score = points['main_keywords']
         reasoning['score_breakdown']['main_keywords'] = {
             'score': main_keyword_score,
             'max': 30,
-            'description': f"Matched {len(match_details.get('main_keyword_matches', []))} main interests"
+            'description': f"Matched {main_match_count} main interests"
         }
         if main_keyword_score >= 20:
             reasoning['factors'].append("Strong match with your primary interests")
         
         # Factor 3: Deadline urgency (15 points)
-        max_score += 15
-        urgency = OpportunityMatcher.get_urgency_bucket(
-            opportunity.get('closeDate') or opportunity.get('deadline')
-        )
-        urgency_score = {
-            'urgent': 5,   # Less time means more competition
-            'soon': 15,    # Sweet spot - enough time to apply well
-            'ongoing': 10  # No immediate deadline
-        }.get(urgency, 10)
-        total_score += urgency_score
+        urgency = points['urgency_level']
         reasoning['score_breakdown']['urgency'] = {
-            'score': urgency_score,
+            'score': points['urgency'],
             'max': 15,
             'urgency_level': urgency,
             'description': f"Deadline urgency: {urgency}"
         }
         
         # Factor 4: Complete opportunity information (15 points)
-        max_score += 15
-        completeness_score = 0
-        has_description = bool(opportunity.get('description') or opportunity.get('summary'))
-        has_contact = bool(opportunity.get('contactEmail') or opportunity.get('contactPhone'))
-        has_location = bool(opportunity.get('place') or opportunity.get('city') or opportunity.get('state'))
-        has_url = bool(opportunity.get('url') or opportunity.get('synopsisUrl'))
-        
-        completeness_score += 5 if has_description else 0
-        completeness_score += 3 if has_contact else 0
-        completeness_score += 3 if has_location else 0
-        completeness_score += 4 if has_url else 0
-        
-        total_score += completeness_score
+        completeness_score = points['completeness']
         reasoning['score_breakdown']['completeness'] = {
             'score': completeness_score,
             'max': 15,
@@ -221,10 +237,12 @@ class OpportunityMatcher:
             reasoning['factors'].append("Opportunity has detailed information available")
         
         # Calculate final win rate (0-100%)
-        win_rate = (total_score / max_score * 100) if max_score > 0 else 0
+        win_rate = OpportunityMatcher._win_rate_from_points(points)
         
-        reasoning['total_score'] = total_score
-        reasoning['max_score'] = max_score
+        reasoning['total_score'] = (
+            keyword_score + main_keyword_score + points['urgency'] + completeness_score
+        )
+        reasoning['max_score'] = 100
         reasoning['win_rate_percentage'] = round(win_rate, 2)
         
         # Add overall assessment
@@ -241,49 +259,96 @@ class OpportunityMatcher:
     
     @staticmethod
     def rank_opportunities(
-        opportunities: List[Dict[str, Any]],
-        user_profile: Dict[str, Any]
+        opportunities: Iterable[Dict[str, Any]],
+        user_profile: Dict[str, Any],
+        top_k: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
         Rank and score all opportunities for a user
+        
+        With top_k, candidates stream through a bounded heap on
+        (match_score, win_rate) and the match_details / win_rate_reasoning
+        payloads are only built for the top_k survivors.
         Returns: List of opportunities with scores and win rates
         """
         interests_main = user_profile.get('interestsMain', [])
         interests_sub = user_profile.get('interestsSub', []) or user_profile.get('grantsByInterest', [])
+        keyword_matcher = KeywordMatcher(list(interests_main) + list(interests_sub))
         
-        ranked_opportunities = []
+        if top_k is None:
+            ranked_opportunities = [
+                OpportunityMatcher._score_opportunity(opp, user_profile, interests_main, interests_sub, keyword_matcher)
+                for opp in opportunities
+            ]
+            ranked_opportunities = [opp for opp in ranked_opportunities if opp is not None]
+            
+            # Sort by score descending, then by win rate
+            ranked_opportunities.sort(
+                key=lambda x: (x['match_score'], x['win_rate']),
+                reverse=True
+            )
+            return ranked_opportunities
         
-        for opp in opportunities:
-            # Calculate match score
-            score, match_details = OpportunityMatcher.calculate_match_score(
-                opp, interests_main, interests_sub
+        # Min-heap of the best top_k; -seq keeps the stable order of a full sort
+        heap = []
+        for seq, opp in enumerate(opportunities):
+            score, main_hits, sub_hits = OpportunityMatcher._keyword_hits(
+                opp, interests_main, interests_sub, keyword_matcher
             )
             
             # Only include opportunities with at least some match
-            if score > 0:
-                # Calculate win rate
-                win_rate, reasoning = OpportunityMatcher.calculate_win_rate(
-                    opp, score, match_details, user_profile
-                )
-                
-                # Add scoring data to opportunity
-                opp_with_score = {
-                    **opp,
-                    'match_score': score,
-                    'match_details': match_details,
-                    'win_rate': win_rate,
-                    'win_rate_reasoning': reasoning,
-                    'urgency': OpportunityMatcher.get_urgency_bucket(
-                        opp.get('closeDate') or opp.get('deadline')
-                    )
-                }
-                
-                ranked_opportunities.append(opp_with_score)
+            if score <= 0:
+                continue
+            
+            points = OpportunityMatcher._win_rate_points(opp, score, len(main_hits))
+            key = (score, OpportunityMatcher._win_rate_from_points(points), -seq)
+            if len(heap) < top_k:
+                heapq.heappush(heap, (key, opp, main_hits, sub_hits))
+            elif key > heap[0][0]:
+                heapq.heapreplace(heap, (key, opp, main_hits, sub_hits))
         
-        # Sort by score descending, then by win rate
-        ranked_opportunities.sort(
-            key=lambda x: (x['match_score'], x['win_rate']),
-            reverse=True
-        )
+        ranked_opportunities = []
+        for (score, _, _), opp, main_hits, sub_hits in sorted(heap, key=lambda e: e[0], reverse=True):
+            match_details = OpportunityMatcher._match_details(main_hits, sub_hits)
+            ranked_opportunities.append(OpportunityMatcher._with_scores(opp, score, match_details, user_profile))
         
         return ranked_opportunities
+    
+    @staticmethod
+    def _score_opportunity(
+        opp: Dict[str, Any],
+        user_profile: Dict[str, Any],
+        interests_main: List[str],
+        interests_sub: List[str],
+        keyword_matcher: KeywordMatcher
+    ) -> Optional[Dict[str, Any]]:
+        """Score one opportunity; None when it has no keyword match"""
+        # Calculate match score
+        score, match_details = OpportunityMatcher.calculate_match_score(
+            opp, interests_main, interests_sub, keyword_matcher
+        )
+        
+        # Only include opportunities with at least some match
+        if score <= 0:
+            return None
+        return OpportunityMatcher._with_scores(opp, score, match_details, user_profile)
+    
+    @staticmethod
+    def _with_scores(
+        opp: Dict[str, Any],
+        score: int,
+        match_details: Dict[str, Any],
+        user_profile: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Copy of the opportunity with its scoring payload attached"""
+        win_rate, reasoning = OpportunityMatcher.calculate_win_rate(
+            opp, score, match_details, user_profile
+        )
+        return {
+            **opp,
+            'match_score': score,
+            'match_details': match_details,
+            'win_rate': win_rate,
+            'win_rate_reasoning': reasoning,
+            'urgency': reasoning['score_breakdown']['urgency']['urgency_level']
+        }
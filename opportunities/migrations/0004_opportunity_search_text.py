@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:37
+
+import html
+import re
+
+from django.db import migrations, models
+
+# Copy of keywords.normalize_search_text as of this migration, so the
+# backfill doesn't change with later edits to the live function
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_search_text(*parts):
+    text = ' '.join(part or "" for part in parts)
+    text = html.unescape(HTML_TAG_RE.sub(' ', text))
+    return WHITESPACE_RE.sub(' ', text).strip().lower()
+
+
+def backfill_search_text(apps, schema_editor):
+    Opportunity = apps.get_model('opportunities', 'Opportunity')
+    fields = ('id', 'title', 'description', 'summary', 'agency', 'department')
+    batch = []
+    for opp in Opportunity.objects.only(*fields).iterator(chunk_size=1000):
+        opp.search_text = normalize_search_text(
+            opp.title, opp.description, opp.summary, opp.agency, opp.department
+        )
+        batch.append(opp)
+        if len(batch) >= 1000:
+            Opportunity.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        Opportunity.objects.bulk_update(batch, ['search_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opportunities', '0003_profile_match_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='opportunity',
+            name='search_text',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:48
+
+from django.db import migrations, models
+
+# Copy of matching.URGENCY_FACTORS as of this migration: urgency bucket ->
+# (relevance multiplier, timing points, timing detail)
+URGENCY_FACTORS = {
+    "urgent": (1.2, 5, "Deadline within 30 days"),
+    "soon": (1.1, 3, "Deadline within 3 months"),
+    "ongoing": (1.0, 2, "Ongoing or long-term opportunity"),
+}
+
+
+def backfill_score_components(apps, schema_editor):
+    """Recover the stored bucket from the Timing factor of existing reasoning"""
+    OpportunityMatch = apps.get_model('opportunities', 'OpportunityMatch')
+    bucket_by_points = {points: bucket for bucket, (_, points, _) in URGENCY_FACTORS.items()}
+    fields = ('id', 'relevance_score', 'win_rate_reasoning')
+    batch = []
+    for match in OpportunityMatch.objects.only(*fields).iterator(chunk_size=1000):
+        reasoning = match.win_rate_reasoning or {}
+        timing = next(
+            (f['score'] for f in reasoning.get('factors', []) if f['name'] == 'Timing'), None
+        )
+        bucket = bucket_by_points.get(timing)
+        if bucket is None:
+            continue
+        match.urgency_bucket = bucket
+        # Keyword weights are whole numbers; rounding undoes the float division
+        match.keyword_score = round(match.relevance_score / URGENCY_FACTORS[bucket][0], 6)
+        match.base_points = reasoning.get('total_score', 0) - timing
+        batch.append(match)
+        if len(batch) >= 1000:
+            OpportunityMatch.objects.bulk_update(batch, ['urgency_bucket', 'keyword_score', 'base_points'])
+            batch = []
+    if batch:
+        OpportunityMatch.objects.bulk_update(batch, ['urgency_bucket', 'keyword_score', 'base_points'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opportunities', '0004_opportunity_search_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='opportunitymatch',
+            name='base_points',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='opportunitymatch',
+            name='keyword_score',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='opportunitymatch',
+            name='urgency_bucket',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.RunPython(backfill_score_components, migrations.RunPython.noop),
+    ]
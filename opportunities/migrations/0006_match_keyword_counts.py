@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opportunities', '0005_match_score_components'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='opportunitymatch',
+            name='keyword_counts',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opportunities', '0006_match_keyword_counts'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='opportunitymatch',
+            options={'ordering': ['-relevance_score', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='opportunity',
+            name='opportuniti_collect_cef588_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='opportunity',
+            name='opportuniti_firebas_0a3441_idx',
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['user_profile', '-applied_at'], name='application_user_pr_2ea820_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='opportunity',
+            index=models.Index(fields=['collection_name', 'close_date'], name='opportuniti_collect_3615f1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='opportunity',
+            index=models.Index(fields=['-posted_date'], name='opportuniti_posted__d756f8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='opportunitymatch',
+            index=models.Index(condition=models.Q(('is_dismissed', False)), fields=['user_profile', '-relevance_score', '-id'], name='match_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='savedopportunity',
+            index=models.Index(fields=['user_profile', '-saved_at'], name='saved_oppor_user_pr_4ab339_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:03
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opportunities', '0007_query_shape_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection_name', models.CharField(max_length=100, unique=True)),
+                ('scan_cursor', models.CharField(blank=True, max_length=255)),
+                ('high_water_mark', models.DateTimeField(blank=True, null=True)),
+                ('high_water_id', models.CharField(blank=True, max_length=255)),
+                ('documents_synced', models.PositiveIntegerField(default=0)),
+                ('last_started_at', models.DateTimeField(blank=True, null=True)),
+                ('last_completed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'sync_states',
+            },
+        ),
+        migrations.AlterField(
+            model_name='opportunity',
+            name='extra_data',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opportunities', '0008_sync_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='opportunity',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+    ]
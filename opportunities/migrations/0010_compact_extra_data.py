@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:18
+
+import base64
+import json
+import zlib
+
+from django.db import migrations
+
+# Copy of adapters.PROMOTED_KEYS as of this migration: document key ->
+# Opportunity column holding its raw value
+PROMOTED_KEYS = {
+    "title": "title",
+    "description": "description",
+    "summary": "summary",
+    "agency": "agency",
+    "department": "department",
+    "city": "city",
+    "state": "state",
+    "place": "place",
+    "url": "url",
+    "synopsisUrl": "synopsis_url",
+    "link": "link",
+    "contactEmail": "contact_email",
+    "contactPhone": "contact_phone",
+}
+PROMOTED_MARKER = "__promoted__"
+COMPRESSED_MARKER = "__zlib__"
+DOCUMENT_MARKER = "__document__"
+MARKERS = (PROMOTED_MARKER, COMPRESSED_MARKER, DOCUMENT_MARKER)
+
+
+def pack_extra_data(data, opportunity):
+    """
+    Copy of adapters.pack_extra_data() with EXTRA_DATA_COMPRESS_BYTES at its
+    default of 0: promoted values are dropped, nothing is compressed
+    """
+    if any(marker in data for marker in MARKERS):
+        return {DOCUMENT_MARKER: data}
+    promoted = [
+        key for key, field in PROMOTED_KEYS.items()
+        if isinstance(data.get(key), str) and getattr(opportunity, field) == data[key]
+    ]
+    residual = {key: value for key, value in data.items() if key not in promoted}
+    if promoted:
+        residual[PROMOTED_MARKER] = promoted
+    return residual
+
+
+def unpack_extra_data(stored, opportunity):
+    """Copy of adapters.unpack_extra_data(); also reads residuals compressed after this migration"""
+    if COMPRESSED_MARKER in stored:
+        data = json.loads(zlib.decompress(base64.b64decode(stored[COMPRESSED_MARKER])))
+    else:
+        data = dict(stored)
+    if DOCUMENT_MARKER in data:
+        return data[DOCUMENT_MARKER]
+    for key in data.pop(PROMOTED_MARKER, ()):
+        data[key] = getattr(opportunity, PROMOTED_KEYS[key])
+    return data
+
+
+def _rewrite_extra_data(apps, convert):
+    Opportunity = apps.get_model('opportunities', 'Opportunity')
+    fields = ('id', 'extra_data', *PROMOTED_KEYS.values())
+    batch = []
+    for opportunity in Opportunity.objects.only(*fields).iterator(chunk_size=1000):
+        extra_data = convert(opportunity)
+        if extra_data is None or extra_data == opportunity.extra_data:
+            continue
+        opportunity.extra_data = extra_data
+        batch.append(opportunity)
+        if len(batch) >= 1000:
+            Opportunity.objects.bulk_update(batch, ['extra_data'])
+            batch = []
+    if batch:
+        Opportunity.objects.bulk_update(batch, ['extra_data'])
+
+
+def compact_extra_data(apps, schema_editor):
+    """Drop the document values already stored in their own columns; every row holds a whole document"""
+    _rewrite_extra_data(apps, lambda opp: pack_extra_data(opp.extra_data, opp) if opp.extra_data else None)
+
+
+def expand_extra_data(apps, schema_editor):
+    """Store whole documents again; every row holds a residual"""
+    _rewrite_extra_data(apps, lambda opp: unpack_extra_data(opp.extra_data, opp) if opp.extra_data else None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opportunities', '0009_opportunity_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_extra_data, expand_extra_data),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:20
+
+import base64
+import zlib
+
+import opportunities.fields
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations
+
+TEXT_FIELDS = ('description', 'summary')
+
+# Copy of the fields module's storage format as of this migration: values
+# starting with HEADER carry a one-letter codec; anything else is plain text
+HEADER = '\x01'
+PLAIN = 'p'
+ZLIB = 'z'
+ZSTD = 's'
+
+
+def decompress_text(stored):
+    """Copy of fields.decompress_text()"""
+    if not stored.startswith(HEADER):
+        return stored
+    codec, payload = stored[1:2], stored[2:]
+    if codec == PLAIN:
+        return payload
+    if codec not in (ZLIB, ZSTD):
+        return stored
+    data = base64.b64decode(payload)
+    if codec == ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise ImproperlyConfigured('zstd-compressed text requires the zstandard package')
+        return zstandard.ZstdDecompressor().decompress(data).decode()
+    return zlib.decompress(data).decode()
+
+
+def _rewrite_text(apps, schema_editor, convert):
+    """
+    Apply convert to the stored column values in pk order. Reads and writes
+    the raw columns, so the result doesn't depend on the current field class.
+    """
+    Opportunity = apps.get_model('opportunities', 'Opportunity')
+    quote = schema_editor.quote_name
+    table = quote(Opportunity._meta.db_table)
+    pk = quote(Opportunity._meta.pk.column)
+    columns = [quote(Opportunity._meta.get_field(field).column) for field in TEXT_FIELDS]
+    select = f"SELECT {pk}, {', '.join(columns)} FROM {table} WHERE {pk} > %s ORDER BY {pk} LIMIT 1000"
+    update = f"UPDATE {table} SET {', '.join(f'{column} = %s' for column in columns)} WHERE {pk} = %s"
+    with schema_editor.connection.cursor() as cursor:
+        last = 0
+        while True:
+            cursor.execute(select, [last])
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last = rows[-1][0]
+            changed = []
+            for row_pk, *values in rows:
+                converted = [value if value is None else convert(value) for value in values]
+                if converted != values:
+                    changed.append([*converted, row_pk])
+            if changed:
+                cursor.executemany(update, changed)
+
+
+def escape_existing_text(apps, schema_editor):
+    """
+    Compression is opt-in (COMPRESS_TEXT_FIELDS), so nothing is compressed
+    here; plain values that happen to start with HEADER are escaped so the
+    field doesn't read them as encoded
+    """
+    _rewrite_text(apps, schema_editor, lambda stored: HEADER + PLAIN + stored if stored.startswith(HEADER) else stored)
+
+
+def decompress_existing_text(apps, schema_editor):
+    """Store plain text again, including values compressed while COMPRESS_TEXT_FIELDS was on"""
+    _rewrite_text(apps, schema_editor, decompress_text)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opportunities', '0010_compact_extra_data'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='opportunity',
+            name='description',
+            field=opportunities.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='opportunity',
+            name='summary',
+            field=opportunities.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.RunPython(escape_existing_text, decompress_existing_text),
+    ]
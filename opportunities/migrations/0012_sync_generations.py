@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opportunities', '0011_compress_opportunity_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='opportunity',
+            name='sync_generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='opportunity',
+            name='tombstoned_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='syncstate',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='opportunity',
+            index=models.Index(fields=['collection_name', 'sync_generation'], name='opportuniti_collect_f5ea20_idx'),
+        ),
+    ]
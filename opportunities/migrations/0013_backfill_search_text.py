@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 09:12
+
+import html
+import re
+
+from django.db import migrations
+
+# Copy of keywords.normalize_search_text as of this migration, so the
+# backfill doesn't change with later edits to the live function
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_search_text(*parts):
+    text = ' '.join(part or "" for part in parts)
+    text = html.unescape(HTML_TAG_RE.sub(' ', text))
+    return WHITESPACE_RE.sub(' ', text).strip().lower()
+
+
+def backfill_missing_search_text(apps, schema_editor):
+    """Rows created outside sync since 0004 (admin, shell) never got search_text"""
+    Opportunity = apps.get_model('opportunities', 'Opportunity')
+    fields = ('id', 'title', 'description', 'summary', 'agency', 'department')
+    missing = Opportunity.objects.filter(search_text__isnull=True).only(*fields).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(missing.filter(pk__gt=last_pk)[:1000])
+        if not batch:
+            break
+        for opp in batch:
+            opp.search_text = normalize_search_text(
+                opp.title, opp.description, opp.summary, opp.agency, opp.department
+            )
+            # Postings were built from the same text; reindex with build_keyword_index
+            opp.indexed_at = None
+        Opportunity.objects.bulk_update(batch, ['search_text', 'indexed_at'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opportunities', '0012_sync_generations'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_missing_search_text, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,12 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThanOrEqual
 from django.contrib.auth.models import User
 
+from .adapters import unpack_extra_data
+from .fields import CompressedTextField
+
 
 class UserProfile(models.Model):
     """Extended user profile with matching preferences"""
@@ -19,6 +25,10 @@ class UserProfile(models.Model):
     total_applied = models.IntegerField(default=0)
     total_saved = models.IntegerField(default=0)
     
+    # Matching watermark: when matches were last computed and for which criteria
+    last_matched_at = models.DateTimeField(null=True, blank=True)
+    match_signature = models.CharField(max_length=64, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -35,8 +45,9 @@ class Opportunity(models.Model):
     collection_name = models.CharField(max_length=100)
     
     title = models.TextField()
-    description = models.TextField(blank=True, null=True)
-    summary = models.TextField(blank=True, null=True)
+    # Often several KB and only read when a card is rendered
+    description = CompressedTextField(blank=True, null=True)
+    summary = CompressedTextField(blank=True, null=True)
     
     agency = models.CharField(max_length=255, blank=True, null=True)
     department = models.CharField(max_length=255, blank=True, null=True)
@@ -56,14 +67,65 @@ class Opportunity(models.Model):
     contact_email = models.EmailField(blank=True, null=True)
     contact_phone = models.CharField(max_length=50, blank=True, null=True)
     
-    extra_data = models.JSONField(default=dict, blank=True)
+    # Firestore document minus the values copied verbatim into the columns
+    # above (use raw_data for the whole document); Firestore timestamps are
+    # stored as ISO strings
+    extra_data = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    
+    # SHA-1 of the canonical source document, to skip unchanged rewrites
+    content_hash = models.CharField(max_length=40, blank=True)
+    
+    # Lowercased title/description/summary/agency/department with HTML
+    # stripped, computed at sync time for keyword matching
+    search_text = models.TextField(blank=True, null=True)
+    
+    indexed_at = models.DateTimeField(null=True, blank=True)
+    
+    # SyncState.generation of the last sync that saw the document; rows
+    # left behind by a completed full pass were deleted from Firestore
+    sync_generation = models.PositiveIntegerField(default=0)
+    # Set instead of deleting when applications or saves still reference
+    # a deleted document; tombstoned rows are never matched
+    tombstoned_at = models.DateTimeField(null=True, blank=True)
     
     last_synced = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Columns search_text is built from, in order
+    SEARCH_TEXT_FIELDS = ('title', 'description', 'summary', 'agency', 'department')
+    
     def __str__(self):
         return f"{self.title[:50]} ({self.collection_name})"
     
+    def save(self, *args, **kwargs):
+        """
+        Recompute search_text from the text columns and reindex the keyword
+        postings when it changed, so edits outside sync (admin, shell) are
+        matched against the new text. Skipped when a text column is deferred
+        or left out of update_fields.
+        """
+        from .keywords import KeywordIndex, normalize_search_text
+        
+        update_fields = kwargs.get('update_fields')
+        reindex = False
+        if not self.get_deferred_fields().intersection(self.SEARCH_TEXT_FIELDS) and (
+            update_fields is None or set(update_fields) & set(self.SEARCH_TEXT_FIELDS)
+        ):
+            search_text = normalize_search_text(*(getattr(self, field) for field in self.SEARCH_TEXT_FIELDS))
+            reindex = search_text != self.search_text or self.indexed_at is None
+            self.search_text = search_text
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_text'}
+        
+        super().save(*args, **kwargs)
+        if reindex:
+            KeywordIndex.index_opportunities([self])
+    
+    @property
+    def raw_data(self):
+        """The synced Firestore document, rebuilt from extra_data and the columns"""
+        return unpack_extra_data(self.extra_data, self)
+    
     @property
     def urgency_bucket(self):
         if not self.close_date and not self.deadline:
@@ -79,16 +141,74 @@ class Opportunity(models.Model):
             return "soon"
         return "ongoing"
     
+    @staticmethod
+    def urgency_bucket_expression(prefix: str = ''):
+        """
+        SQL equivalent of urgency_bucket for annotations and filters
+        (prefix='opportunity__' when querying from a related model)
+        """
+        from datetime import datetime, timedelta
+        today = datetime.now().date()
+        deadline = Coalesce(f'{prefix}close_date', f'{prefix}deadline')
+        return models.Case(
+            models.When(LessThanOrEqual(deadline, today + timedelta(days=30)), then=models.Value("urgent")),
+            models.When(LessThanOrEqual(deadline, today + timedelta(days=92)), then=models.Value("soon")),
+            default=models.Value("ongoing"),
+            output_field=models.CharField(),
+        )
+    
     class Meta:
         db_table = 'opportunities'
         ordering = ['-posted_date']
         indexes = [
-            models.Index(fields=['collection_name']),
+            # Also serves collection_name lookups on its own
+            models.Index(fields=['collection_name', 'close_date']),
             models.Index(fields=['close_date']),
-            models.Index(fields=['firebase_id']),
+            models.Index(fields=['-posted_date']),
+            models.Index(fields=['collection_name', 'sync_generation']),
         ]
 
 
+class SyncState(models.Model):
+    """Per-collection Firestore sync position, committed with each synced page"""
+    collection_name = models.CharField(max_length=100, unique=True)
+    
+    # Last document id of an unfinished full pass ordered by document id
+    scan_cursor = models.CharField(max_length=255, blank=True)
+    
+    # Incremental position: (updated timestamp, document id) of the last
+    # document synced, ordered by FIRESTORE_UPDATED_FIELD
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    high_water_id = models.CharField(max_length=255, blank=True)
+    
+    # Incremented when a full pass starts; rows still on an older
+    # generation after the pass completes are swept
+    generation = models.PositiveIntegerField(default=0)
+    
+    # Documents fetched by the latest run
+    documents_synced = models.PositiveIntegerField(default=0)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.collection_name} sync state"
+    
+    class Meta:
+        db_table = 'sync_states'
+
+
+class OpportunityTerm(models.Model):
+    """Inverted keyword index: one posting per term per opportunity"""
+    term = models.CharField(max_length=100)
+    opportunity = models.ForeignKey(Opportunity, on_delete=models.CASCADE, related_name='terms')
+    term_frequency = models.PositiveIntegerField(default=1)
+    
+    class Meta:
+        db_table = 'opportunity_terms'
+        unique_together = [['term', 'opportunity']]
+
+
 class OpportunityMatch(models.Model):
     """Stores matched opportunities for users with relevance scores"""
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='matches')
@@ -98,6 +218,15 @@ class OpportunityMatch(models.Model):
     win_rate = models.FloatField(default=0.0)
     win_rate_reasoning = models.JSONField(default=dict, blank=True)
     
+    # Date-independent score components, so urgency changes can be
+    # re-ranked without rescanning opportunity text
+    keyword_score = models.FloatField(default=0.0)
+    base_points = models.FloatField(default=0.0)
+    urgency_bucket = models.CharField(max_length=10, blank=True)
+    
+    # Hit count per profile keyword, so interest edits only scan added keywords
+    keyword_counts = models.JSONField(default=dict, blank=True)
+    
     is_viewed = models.BooleanField(default=False)
     is_dismissed = models.BooleanField(default=False)
     
@@ -107,7 +236,15 @@ class OpportunityMatch(models.Model):
     class Meta:
         db_table = 'opportunity_matches'
         unique_together = [['user_profile', 'opportunity']]
-        ordering = ['-relevance_score', '-created_at']
+        ordering = ['-relevance_score', '-id']
+        indexes = [
+            # Ranked, non-dismissed matches per profile (/api/match/ pages)
+            models.Index(
+                fields=['user_profile', '-relevance_score', '-id'],
+                condition=models.Q(is_dismissed=False),
+                name='match_rank_idx',
+            ),
+        ]
 
 
 class Application(models.Model):
@@ -135,6 +272,9 @@ class Application(models.Model):
         db_table = 'applications'
         unique_together = [['user_profile', 'opportunity']]
         ordering = ['-applied_at']
+        indexes = [
+            models.Index(fields=['user_profile', '-applied_at']),
+        ]
 
 
 class SavedOpportunity(models.Model):
@@ -149,6 +289,9 @@ class SavedOpportunity(models.Model):
         db_table = 'saved_opportunities'
         unique_together = [['user_profile', 'opportunity']]
         ordering = ['-saved_at']
+        indexes = [
+            models.Index(fields=['user_profile', '-saved_at']),
+        ]
 
 
 class ApplicationPathway(models.Model):
@@ -0,0 +1,121 @@
+"""
+Ingest-time matching: score newly synced opportunities against every profile
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+from django.db import transaction
+from django.utils import timezone
+
+from .keywords import KeywordMatcher, build_search_text
+from .matching import MATCH_BATCH_SIZE, OpportunityMatcher
+from .models import Opportunity, OpportunityMatch, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilePercolator:
+    """
+    Reverse matcher over all user profiles.
+
+    The union of every profile's keywords goes into one KeywordMatcher with
+    a keyword -> profiles map, so each new or changed opportunity is scanned
+    once and only the profiles owning a keyword that hit are scored. Past
+    a few dozen keywords the matcher probes a dict per run of text, so the
+    scan costs the same however many profiles there are. Keyword counts are independent of the other keywords in
+    the matcher, so a profile's slice of the counts is exactly what its own
+    OpportunityMatcher would have found.
+    """
+
+    def __init__(self, profiles: Iterable[UserProfile] = None):
+        # Scope for dropping stale matches; None means every profile
+        self.profile_ids = None
+        if profiles is None:
+            profiles = UserProfile.objects.all()
+        else:
+            profiles = list(profiles)
+            self.profile_ids = [profile.pk for profile in profiles]
+
+        self.matchers: Dict[int, OpportunityMatcher] = {}
+        self.collections: Dict[int, Set[str]] = {}
+        self.keywords: Dict[int, Set[str]] = {}
+        self.profiles_by_keyword: Dict[str, Set[int]] = defaultdict(set)
+
+        for profile in profiles:
+            matcher = OpportunityMatcher(profile)
+            collections = set(matcher.get_relevant_collections())
+            if not collections or not matcher.keyword_matcher:
+                continue
+            self.matchers[profile.pk] = matcher
+            self.collections[profile.pk] = collections
+            self.keywords[profile.pk] = set(matcher.keyword_matcher.keywords)
+            for keyword in matcher.keyword_matcher.keywords:
+                self.profiles_by_keyword[keyword].add(profile.pk)
+
+        self.keyword_matcher = KeywordMatcher(self.profiles_by_keyword)
+
+    def __bool__(self):
+        return bool(self.matchers)
+
+    def match_opportunity(self, opportunity: Opportunity) -> List[OpportunityMatch]:
+        """Score one opportunity against every profile whose keywords it hits"""
+        counts = self.keyword_matcher.count(build_search_text(opportunity))
+        if not counts:
+            return []
+
+        hit_profiles = set()
+        for keyword in counts:
+            hit_profiles |= self.profiles_by_keyword[keyword]
+
+        matches = []
+        for profile_id in sorted(hit_profiles):
+            if opportunity.collection_name not in self.collections[profile_id]:
+                continue
+            keywords = self.keywords[profile_id]
+            match = self.matchers[profile_id].score_opportunity(
+                opportunity, {k: c for k, c in counts.items() if k in keywords}
+            )
+            if match is not None:
+                matches.append(match)
+        return matches
+
+    def percolate(self, opportunities: Iterable[Opportunity]) -> int:
+        """
+        Create or refresh matches for the given opportunities across all
+        profiles, and drop existing matches they no longer earn.
+        Dismissed matches are kept, as in OpportunityMatcher.
+        Returns: number of matches written
+        """
+        opportunities = list(opportunities)
+        if not opportunities:
+            return 0
+
+        run_started = timezone.now()
+        written = 0
+        batch = []
+
+        with transaction.atomic():
+            for opportunity in opportunities:
+                batch.extend(self.match_opportunity(opportunity))
+                if len(batch) >= MATCH_BATCH_SIZE:
+                    OpportunityMatcher.upsert_matches(batch)
+                    written += len(batch)
+                    batch = []
+
+            OpportunityMatcher.upsert_matches(batch)
+            written += len(batch)
+
+            ids = [opp.pk for opp in opportunities]
+            for offset in range(0, len(ids), MATCH_BATCH_SIZE):
+                stale = OpportunityMatch.objects.filter(
+                    opportunity_id__in=ids[offset:offset + MATCH_BATCH_SIZE],
+                    updated_at__lt=run_started,
+                    is_dismissed=False
+                )
+                if self.profile_ids is not None:
+                    stale = stale.filter(user_profile_id__in=self.profile_ids)
+                stale.delete()
+
+        logger.info(f"Percolated {len(opportunities)} opportunities into {written} matches")
+        return written
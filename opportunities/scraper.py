@@ -58,7 +58,7 @@ class ApplicationFormScraper:
     def _check_direct_urls(self, opportunity: Opportunity) -> Optional[str]:
         """Check if opportunity already has application URL in data"""
         # Check extra_data for application-related URLs
-        extra_data = opportunity.extra_data or {}
+        extra_data = opportunity.raw_data
         
         possible_fields = [
             'applicationUrl', 'application_url', 'applyUrl', 'apply_url',
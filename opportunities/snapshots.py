@@ -0,0 +1,269 @@
+"""
+Corpus snapshots: compressed, chunked exports of the synced opportunity
+tables for bootstrapping a fresh database without a full Firestore sync
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from datetime import date
+from typing import Dict, List
+
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models, transaction
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .fields import CompressedTextField, zstandard_module
+from .models import Opportunity, OpportunityTerm, SyncState
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_CHUNK_SIZE = 50000
+MANIFEST_NAME = 'manifest.json'
+
+# Rows per executemany() call during import
+LOAD_BATCH_SIZE = 5000
+
+# In load order: postings reference opportunities
+SNAPSHOT_MODELS = {
+    'opportunities': Opportunity,
+    'opportunity_terms': OpportunityTerm,
+    'sync_states': SyncState,
+}
+
+
+def default_compression() -> str:
+    """zstd when the zstandard package is installed, gzip otherwise"""
+    return 'zstd' if zstandard_module() else 'gzip'
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == 'zstd':
+        return zstandard_module().ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    if compression == 'zstd':
+        zstd = zstandard_module()
+        if zstd is None:
+            raise SnapshotError('This snapshot is zstd-compressed; install the zstandard package')
+        return zstd.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class SnapshotEncoder(DjangoJSONEncoder):
+    """Full-precision ISO dates (DjangoJSONEncoder truncates datetimes to milliseconds)"""
+
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return super().default(o)
+
+
+class SnapshotError(Exception):
+    """A snapshot is missing, corrupt or cannot be loaded into this database"""
+
+
+class CorpusSnapshot:
+    """
+    Snapshot layout: a directory with manifest.json and, per table, chunk
+    files of at most SNAPSHOT_CHUNK_SIZE rows. Each chunk is compressed
+    NDJSON holding one JSON array per row, in the column order listed in
+    the manifest, so column names are stored once. Primary keys are kept,
+    so keyword postings stay valid and the next sync resumes from the
+    exported SyncState checkpoints and content hashes.
+    """
+
+    @classmethod
+    def export(cls, directory: str, collections: List[str] = None, with_terms: bool = False,
+               chunk_size: int = SNAPSHOT_CHUNK_SIZE, compression: str = None) -> dict:
+        """
+        Write the opportunity corpus to directory
+        Returns: the manifest
+        """
+        compression = compression or default_compression()
+        if compression == 'zstd' and zstandard_module() is None:
+            raise SnapshotError('zstd compression requires the zstandard package')
+        os.makedirs(directory, exist_ok=True)
+
+        opportunities = Opportunity.objects.order_by('pk')
+        sync_states = SyncState.objects.order_by('pk')
+        terms = OpportunityTerm.objects.order_by('pk')
+        if collections:
+            opportunities = opportunities.filter(collection_name__in=collections)
+            sync_states = sync_states.filter(collection_name__in=collections)
+            terms = terms.filter(opportunity__collection_name__in=collections)
+
+        querysets = {'opportunities': opportunities, 'sync_states': sync_states}
+        if with_terms:
+            querysets['opportunity_terms'] = terms
+
+        manifest = {
+            'format': SNAPSHOT_FORMAT,
+            'created_at': timezone.now().isoformat(),
+            'compression': compression,
+            'collections': collections or [],
+            'tables': {},
+        }
+        for table, queryset in querysets.items():
+            manifest['tables'][table] = cls._export_table(
+                directory, table, queryset, chunk_size, compression
+            )
+
+        with open(os.path.join(directory, MANIFEST_NAME), 'w') as handle:
+            json.dump(manifest, handle, indent=2)
+        return manifest
+
+    @classmethod
+    def _export_table(cls, directory: str, table: str, queryset, chunk_size: int,
+                      compression: str) -> dict:
+        fields = queryset.model._meta.concrete_fields
+        columns = [field.attname for field in fields]
+        # Compressed text is exported in its stored form, as a plain text cast
+        stored = {
+            f'stored_{field.attname}': Cast(field.attname, models.TextField())
+            for field in fields if isinstance(field, CompressedTextField)
+        }
+        selected = [f'stored_{column}' if f'stored_{column}' in stored else column for column in columns]
+        extension = 'zst' if compression == 'zstd' else 'gz'
+        chunks = []
+
+        def flush(lines):
+            name = f'{table}-{len(chunks):05d}.ndjson.{extension}'
+            data = _compress(b''.join(lines), compression)
+            with open(os.path.join(directory, name), 'wb') as handle:
+                handle.write(data)
+            chunks.append({'file': name, 'rows': len(lines), 'sha256': hashlib.sha256(data).hexdigest()})
+
+        encoder = SnapshotEncoder(separators=(',', ':'))
+        lines = []
+        for row in queryset.annotate(**stored).values_list(*selected).iterator(chunk_size=2000):
+            lines.append(encoder.encode(row).encode() + b'\n')
+            if len(lines) >= chunk_size:
+                flush(lines)
+                lines = []
+        if lines:
+            flush(lines)
+
+        logger.info(f"Exported {sum(c['rows'] for c in chunks)} rows of {table}")
+        return {'columns': columns, 'rows': sum(c['rows'] for c in chunks), 'chunks': chunks}
+
+    @staticmethod
+    def read_manifest(directory: str) -> dict:
+        path = os.path.join(directory, MANIFEST_NAME)
+        if not os.path.exists(path):
+            raise SnapshotError(f'No {MANIFEST_NAME} in {directory}')
+        with open(path) as handle:
+            manifest = json.load(handle)
+        if manifest.get('format') != SNAPSHOT_FORMAT:
+            raise SnapshotError(f"Unsupported snapshot format: {manifest.get('format')}")
+        return manifest
+
+    @classmethod
+    def load(cls, directory: str) -> Dict[str, int]:
+        """
+        Load a snapshot into an empty opportunity table.
+
+        Rows are inserted with executemany() in one transaction while the
+        secondary (Meta) indexes of the loaded tables are dropped; they are
+        rebuilt once at the end, which is much cheaper than maintaining
+        them row by row. Without exported postings, indexed_at is cleared
+        so build_keyword_index picks every opportunity up.
+        Returns: rows loaded per table
+        """
+        manifest = cls.read_manifest(directory)
+        tables = manifest['tables']
+        if Opportunity.objects.exists():
+            raise SnapshotError('The opportunities table is not empty; import_corpus only bootstraps empty databases')
+
+        loaded_models = [SNAPSHOT_MODELS[table] for table in SNAPSHOT_MODELS if table in tables]
+        with connection.schema_editor(collect_sql=True) as editor:
+            deferred = [
+                (str(index.remove_sql(model, editor)), str(index.create_sql(model, editor)))
+                for model in loaded_models
+                for index in model._meta.indexes
+            ]
+
+        loaded = {}
+        with transaction.atomic(), connection.cursor() as cursor:
+            if 'sync_states' in tables:
+                SyncState.objects.all().delete()
+            for drop_sql, _ in deferred:
+                cursor.execute(drop_sql)
+
+            for table, model in SNAPSHOT_MODELS.items():
+                if table not in tables:
+                    continue
+                overrides = {}
+                if table == 'opportunities' and 'opportunity_terms' not in tables:
+                    overrides['indexed_at'] = None
+                loaded[table] = cls._load_table(cursor, directory, manifest, table, model, overrides)
+
+            for _, create_sql in deferred:
+                cursor.execute(create_sql)
+            for sql in connection.ops.sequence_reset_sql(no_style(), loaded_models):
+                cursor.execute(sql)
+
+        return loaded
+
+    @classmethod
+    def _load_table(cls, cursor, directory: str, manifest: dict, table: str, model,
+                    overrides: dict) -> int:
+        spec = manifest['tables'][table]
+        fields = [model._meta.get_field(column) for column in spec['columns']]
+        # The connection proxy is too slow to consult once per value
+        ops = connections[DEFAULT_DB_ALIAS].ops
+        converters = [cls._converter(field, overrides, ops) for field in fields]
+        # Snapshots taken before a column was added load it with its default
+        added = [
+            field for field in model._meta.concrete_fields
+            if field.attname not in spec['columns'] and field.has_default()
+        ]
+        defaults = [field.get_db_prep_save(field.get_default(), connection) for field in added]
+        fields += added
+
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+
+        loaded = 0
+        for chunk in spec['chunks']:
+            with open(os.path.join(directory, chunk['file']), 'rb') as handle:
+                data = handle.read()
+            if hashlib.sha256(data).hexdigest() != chunk['sha256']:
+                raise SnapshotError(f"Checksum mismatch in {chunk['file']}")
+
+            rows = [
+                [convert(value) for convert, value in zip(converters, json.loads(line))] + defaults
+                for line in _decompress(data, manifest['compression']).splitlines()
+            ]
+            if len(rows) != chunk['rows']:
+                raise SnapshotError(f"{chunk['file']} has {len(rows)} rows, manifest says {chunk['rows']}")
+            for offset in range(0, len(rows), LOAD_BATCH_SIZE):
+                cursor.executemany(sql, rows[offset:offset + LOAD_BATCH_SIZE])
+            loaded += len(rows)
+
+        logger.info(f"Loaded {loaded} rows into {table}")
+        return loaded
+
+    @staticmethod
+    def _converter(field, overrides: dict, ops):
+        """JSON value -> database parameter for one column, via the backend's adapters"""
+        if field.attname in overrides:
+            value = overrides[field.attname]
+            return lambda _: value
+        if isinstance(field, models.JSONField):
+            return lambda value: None if value is None else ops.adapt_json_value(value, field.encoder)
+        if isinstance(field, models.DateTimeField):
+            return lambda value: ops.adapt_datetimefield_value(parse_datetime(value) if value else None)
+        if isinstance(field, models.DateField):
+            return lambda value: ops.adapt_datefield_value(parse_date(value) if value else None)
+        return lambda value: value
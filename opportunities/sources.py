@@ -0,0 +1,456 @@
+"""
+Pluggable document sources behind the Firebase services
+
+Sync and profile code only use a small, Firestore-shaped surface:
+collection(name) returning a reference that supports document(id).get(),
+where/order_by/start_after/limit and stream(). FirestoreSource wraps the
+real client; JsonlSource (a directory of JSONL files) and MemorySource
+implement the same calls so sync and matching can run offline.
+"""
+import bisect
+import copy
+import json
+import operator
+import os
+import threading
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+DOCUMENT_ID = '__name__'
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson')
+
+_MISSING = object()
+
+
+def open_source(spec: str):
+    """
+    Build a source from a spec string: 'firestore', 'jsonl:/path/to/dir'
+    or 'memory'
+    """
+    kind, _, argument = spec.partition(':')
+    if kind == 'firestore':
+        return FirestoreSource()
+    if kind == 'jsonl':
+        if not argument:
+            raise ValueError('jsonl source needs a directory, e.g. jsonl:/data/corpus')
+        updated_field = getattr(settings, 'FIRESTORE_UPDATED_FIELD', '')
+        return JsonlSource(argument, timestamp_fields=(updated_field,) if updated_field else ())
+    if kind == 'memory':
+        return MemorySource()
+    raise ValueError(f"Unknown opportunity source: {spec}")
+
+
+def _sort_value(value):
+    """
+    Comparable form of a field value. Values are ranked by type first, as
+    Firestore does; strings always compare as strings.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=dt_timezone.utc)
+        return (3, value)
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, repr(value))
+
+
+def _field_value(data: dict, field_path: str):
+    """Dotted field lookup; _MISSING when any segment is absent"""
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+class FirestoreSource:
+    """The real Firestore client; firebase_admin must be initialized first"""
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from firebase_admin import firestore
+            self._client = firestore.client()
+        return self._client
+
+    def collection(self, name: str):
+        return self.client.collection(name)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class DocumentSnapshot:
+    """Result of DocumentReference.get() or Query.stream()"""
+
+    def __init__(self, doc_id: str, data: Optional[dict], reference=None):
+        self.id = doc_id
+        self.reference = reference
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str):
+        value = _field_value(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return value
+
+
+class DocumentReference:
+    def __init__(self, store: 'DocumentStore', path: str, doc_id: str):
+        self._store = store
+        self._path = path
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._path}/{self.id}"
+
+    def get(self) -> DocumentSnapshot:
+        return DocumentSnapshot(self.id, self._store.read(self._path, self.id), self)
+
+    def set(self, data: dict, merge: bool = False):
+        if merge:
+            current = self._store.read(self._path, self.id) or {}
+            data = {**current, **data}
+        self._store.write(self._path, self.id, copy.deepcopy(data))
+
+    def delete(self):
+        self._store.remove(self._path, self.id)
+
+    def collection(self, name: str) -> 'CollectionReference':
+        return CollectionReference(self._store, f"{self.path}/{name}")
+
+
+class Query:
+    """Ascending order_by, where, start_after and limit over a DocumentStore"""
+
+    def __init__(self, store: 'DocumentStore', path: str, orders: Tuple = (), filters: Tuple = (),
+                 cursor: Optional[Tuple] = None, count: Optional[int] = None):
+        self._store = store
+        self._path = path
+        self._orders = orders
+        self._filters = filters
+        self._cursor = cursor
+        self._count = count
+
+    def _copy(self, **changes) -> 'Query':
+        state = dict(orders=self._orders, filters=self._filters, cursor=self._cursor, count=self._count)
+        state.update(changes)
+        return Query(self._store, self._path, **state)
+
+    def order_by(self, field_path: str, direction: str = 'ASCENDING') -> 'Query':
+        if str(direction).upper() not in ('ASCENDING', 'ASC'):
+            raise NotImplementedError('Only ascending order is supported by local sources')
+        return self._copy(orders=self._orders + (str(field_path),))
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None) -> 'Query':
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in OPERATORS:
+            raise NotImplementedError(f"Unsupported operator for local sources: {op_string}")
+        field_path = str(field_path)
+        if field_path != DOCUMENT_ID:
+            value = _sort_value(value)
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def start_after(self, document_fields_or_snapshot) -> 'Query':
+        fields = document_fields_or_snapshot
+        if isinstance(fields, DocumentSnapshot):
+            fields = {**(fields.to_dict() or {}), DOCUMENT_ID: fields.id}
+        return self._copy(cursor=tuple(fields[order] for order in self._sort_fields()))
+
+    def limit(self, count: int) -> 'Query':
+        return self._copy(count=count)
+
+    def _sort_fields(self) -> Tuple:
+        orders = tuple(order for order in self._orders if order != DOCUMENT_ID)
+        return orders + (DOCUMENT_ID,)
+
+    def stream(self) -> Iterator[DocumentSnapshot]:
+        doc_ids = self._store.query(self._path, self._sort_fields(), self._filters,
+                                    self._cursor, self._count)
+        for doc_id, data in zip(doc_ids, self._store.read_many(self._path, doc_ids)):
+            reference = DocumentReference(self._store, self._path, doc_id)
+            yield DocumentSnapshot(doc_id, data, reference)
+
+    def get(self) -> List[DocumentSnapshot]:
+        return list(self.stream())
+
+
+class CollectionReference(Query):
+    def __init__(self, store: 'DocumentStore', path: str):
+        super().__init__(store, path)
+
+    @property
+    def id(self) -> str:
+        return self._path.rsplit('/', 1)[-1]
+
+    def document(self, doc_id: str) -> DocumentReference:
+        return DocumentReference(self._store, self._path, doc_id)
+
+
+class DocumentStore:
+    """
+    Shared query engine of the local sources.
+
+    Subclasses provide scan(), read() and version(), and may override
+    read_many() to fetch a query's documents in one pass. For each collection
+    and ordering a sorted key list is built once and cached until the
+    collection changes, so paging with start_after costs a bisect plus
+    the page itself rather than a full scan per page.
+    """
+
+    def __init__(self):
+        self._sorted: Dict[Tuple, Tuple] = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name: str) -> CollectionReference:
+        return CollectionReference(self, name)
+
+    def scan(self, path: str) -> Iterator[Tuple[str, dict]]:
+        raise NotImplementedError
+
+    def read(self, path: str, doc_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def read_many(self, path: str, doc_ids: Iterable[str]) -> Iterator[Optional[dict]]:
+        for doc_id in doc_ids:
+            yield self.read(path, doc_id)
+
+    def version(self, path: str):
+        raise NotImplementedError
+
+    def write(self, path: str, doc_id: str, data: dict):
+        raise NotImplementedError(f"{type(self).__name__} is read-only")
+
+    def remove(self, path: str, doc_id: str):
+        raise NotImplementedError(f"{type(self).__name__} is read-only")
+
+    def _sorted_entries(self, path: str, sort_fields: Tuple, filter_fields: Tuple):
+        """Cached (keys, values) sorted by sort_fields; documents missing an order field are left out"""
+        cache_key = (path, sort_fields, filter_fields)
+        version = self.version(path)
+        with self._lock:
+            cached = self._sorted.get(cache_key)
+            if cached is not None and cached[0] == version:
+                return cached[1], cached[2]
+
+            entries = []
+            for doc_id, data in self.scan(path):
+                key = tuple(self._key_value(doc_id, data, field) for field in sort_fields)
+                if _MISSING in key:
+                    continue
+                values = tuple(self._key_value(doc_id, data, field) for field in filter_fields)
+                entries.append((key, values))
+            entries.sort(key=lambda entry: entry[0])
+
+            keys = [entry[0] for entry in entries]
+            values = [entry[1] for entry in entries]
+            self._sorted[cache_key] = (version, keys, values)
+            return keys, values
+
+    def query(self, path: str, sort_fields: Tuple, filters: Tuple, cursor: Optional[Tuple],
+              count: Optional[int]) -> List[str]:
+        """Document ids in order, after the cursor, passing every filter"""
+        filter_fields = tuple(sorted({field for field, _, _ in filters}))
+        keys, values = self._sorted_entries(path, sort_fields, filter_fields)
+        checks = [(filter_fields.index(field), OPERATORS[op], value) for field, op, value in filters]
+
+        start = 0
+        if cursor is not None:
+            cursor_key = tuple(
+                value if field == DOCUMENT_ID else _sort_value(value)
+                for field, value in zip(sort_fields, cursor)
+            )
+            start = bisect.bisect_right(keys, cursor_key)
+
+        doc_ids = []
+        for index in range(start, len(keys)):
+            if count is not None and len(doc_ids) >= count:
+                break
+            row = values[index]
+            if all(row[i] is not _MISSING and self._compare(check, row[i], value)
+                   for i, check, value in checks):
+                doc_ids.append(keys[index][-1])
+        return doc_ids
+
+    @staticmethod
+    def _key_value(doc_id: str, data: dict, field: str):
+        if field == DOCUMENT_ID:
+            return doc_id
+        value = _field_value(data, field)
+        return value if value is _MISSING else _sort_value(value)
+
+    @staticmethod
+    def _compare(check, left, right) -> bool:
+        try:
+            return check(left, right)
+        except TypeError:
+            return False
+
+
+class MemorySource(DocumentStore):
+    """In-memory document store, e.g. for tests and load generation"""
+
+    def __init__(self, collections: Dict[str, Dict[str, dict]] = None):
+        super().__init__()
+        self._documents: Dict[str, Dict[str, dict]] = {}
+        self._versions: Dict[str, int] = {}
+        for name, documents in (collections or {}).items():
+            for doc_id, data in documents.items():
+                self.write(name, doc_id, data)
+
+    def scan(self, path):
+        return iter(list(self._documents.get(path, {}).items()))
+
+    def read(self, path, doc_id):
+        return self._documents.get(path, {}).get(doc_id)
+
+    def version(self, path):
+        return self._versions.get(path, 0)
+
+    def write(self, path, doc_id, data):
+        with self._lock:
+            self._documents.setdefault(path, {})[doc_id] = data
+            self._versions[path] = self._versions.get(path, 0) + 1
+
+    def remove(self, path, doc_id):
+        with self._lock:
+            self._documents.get(path, {}).pop(doc_id, None)
+            self._versions[path] = self._versions.get(path, 0) + 1
+
+
+class JsonlSource(DocumentStore):
+    """
+    Read-only directory of JSONL files, one per collection:
+    <root>/<collection>.jsonl (or .ndjson), and subcollections as
+    <root>/profiles/<uid>/Applied.jsonl. Each line is one document,
+    {"id": "...", "data": {...}}; a line without "data" is the document
+    itself, with its id under "id".
+
+    Documents are read back by byte offset, so only the ids, offsets and
+    sort keys of a collection are held in memory. JSON has no timestamp
+    type, so ISO 8601 strings in timestamp_fields (dotted paths) are
+    parsed into datetimes as each line is decoded.
+    """
+
+    def __init__(self, root: str, timestamp_fields: Tuple[str, ...] = ()):
+        super().__init__()
+        if not os.path.isdir(root):
+            raise ValueError(f"JSONL source directory not found: {root}")
+        self.root = root
+        self.timestamp_fields = tuple(timestamp_fields)
+        self._offsets: Dict[str, Tuple] = {}
+
+    def _file(self, path: str) -> Optional[str]:
+        base = os.path.join(self.root, *path.split('/'))
+        for extension in JSONL_EXTENSIONS:
+            if os.path.isfile(base + extension):
+                return base + extension
+        return None
+
+    def version(self, path):
+        filename = self._file(path)
+        if filename is None:
+            return None
+        stat = os.stat(filename)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _decode(self, line: bytes) -> Tuple[str, dict]:
+        record = json.loads(line)
+        if 'data' in record and len(record) == 2:
+            doc_id, data = str(record['id']), record['data']
+        else:
+            data = dict(record)
+            doc_id = str(data.pop('id'))
+        for field_path in self.timestamp_fields:
+            self._parse_timestamp(data, field_path)
+        return doc_id, data
+
+    @staticmethod
+    def _parse_timestamp(data: dict, field_path: str):
+        *parents, name = field_path.split('.')
+        for part in parents:
+            data = data.get(part) if isinstance(data, dict) else None
+        if isinstance(data, dict) and isinstance(data.get(name), str):
+            parsed = parse_datetime(data[name])
+            if parsed is not None:
+                data[name] = parsed
+
+    def scan(self, path):
+        filename = self._file(path)
+        if filename is None:
+            return
+        offsets = {}
+        with open(filename, 'rb') as handle:
+            offset = handle.tell()
+            for line in iter(handle.readline, b''):
+                if line.strip():
+                    doc_id, data = self._decode(line)
+                    offsets[doc_id] = offset
+                    yield doc_id, data
+                offset = handle.tell()
+        self._offsets[path] = (self.version(path), offsets)
+
+    def _offset_index(self, path: str) -> Dict[str, int]:
+        version = self.version(path)
+        cached = self._offsets.get(path)
+        if cached is None or cached[0] != version:
+            for _ in self.scan(path):
+                pass
+            cached = self._offsets.get(path, (version, {}))
+        return cached[1]
+
+    def read(self, path, doc_id):
+        offset = self._offset_index(path).get(doc_id)
+        if offset is None:
+            return None
+        with open(self._file(path), 'rb') as handle:
+            handle.seek(offset)
+            return self._decode(handle.readline())[1]
+
+    def read_many(self, path, doc_ids):
+        """One index lookup and one open file for all of doc_ids"""
+        offsets = self._offset_index(path)
+        if not offsets:
+            for _ in doc_ids:
+                yield None
+            return
+        with open(self._file(path), 'rb') as handle:
+            for doc_id in doc_ids:
+                offset = offsets.get(doc_id)
+                if offset is None:
+                    yield None
+                    continue
+                handle.seek(offset)
+                yield self._decode(handle.readline())[1]
@@ -1,3 +1,1279 @@
-from django.test import TestCase
+import copy
+import io
+import json
+import os
+import random
+import re
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import firebase_integration, firebase_service, keywords, matching, matching_algorithm
+from .fields import HEADER
+from .firebase_integration import FirebaseService
+from .keywords import KeywordIndex, KeywordMatcher
+from .management.options import parse_since
+from .matching import OpportunityMatcher
+from .models import (
+    Application, Opportunity, OpportunityMatch, OpportunityTerm, SavedOpportunity, SyncState, UserProfile,
+)
+from .percolator import ProfilePercolator
+from .snapshots import CorpusSnapshot
+from .sources import JsonlSource, MemorySource
+from .vector_scoring import CorpusMatrix, SparseScoringEngine
+from .views import visible_matches
+
+
+def index_name(model, *fields):
+    """Name of the Meta index declared on exactly these fields"""
+    for index in model._meta.indexes:
+        if index.fields == list(fields):
+            return index.name
+    raise LookupError(f"No index on {fields} for {model.__name__}")
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Plans are checked with SQLite EXPLAIN QUERY PLAN')
+class QueryPlanTests(TestCase):
+    """The hot read queries are served by indexes, without a sort step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='plan-test')
+        cls.profile = UserProfile.objects.create(user=user, firebase_uid='plan-test')
+
+    def assertUsesIndex(self, queryset, name):
+        plan = queryset.explain()
+        self.assertIn(f'INDEX {name}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_match_page_uses_rank_index(self):
+        name = index_name(OpportunityMatch, 'user_profile', '-relevance_score', '-id')
+        self.assertUsesIndex(visible_matches(self.profile)[:51], name)
+        self.assertUsesIndex(visible_matches(self.profile, after=(3.0, 10))[:51], name)
+
+    def test_applications_by_profile(self):
+        name = index_name(Application, 'user_profile', '-applied_at')
+        self.assertUsesIndex(
+            Application.objects.filter(user_profile=self.profile).select_related('opportunity'), name
+        )
+
+    def test_saved_by_profile(self):
+        name = index_name(SavedOpportunity, 'user_profile', '-saved_at')
+        self.assertUsesIndex(
+            SavedOpportunity.objects.filter(user_profile=self.profile).select_related('opportunity'), name
+        )
+
+    def test_opportunities_by_collection_and_deadline(self):
+        name = index_name(Opportunity, 'collection_name', 'close_date')
+        self.assertUsesIndex(
+            Opportunity.objects.filter(
+                collection_name='grants.gov', close_date__gte='2025-01-01'
+            ).order_by('close_date'),
+            name
+        )
+
+    def test_opportunity_default_ordering(self):
+        name = index_name(Opportunity, '-posted_date')
+        self.assertUsesIndex(Opportunity.objects.all()[:20], name)
+
+
+def regex_counts(keywords, text):
+    """Per-keyword counts the way matching worked before KeywordMatcher"""
+    counts = {}
+    for keyword in {k.lower() for k in keywords}:
+        hits = len(re.findall(r'\b' + re.escape(keyword) + r'\b', text, re.IGNORECASE))
+        if hits:
+            counts[keyword] = hits
+    return counts
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    """One compiled pass counts exactly what one findall per keyword did"""
+
+    KEYWORDS = [
+        # Overlapping and nested
+        'health', 'health care', 'care', 'mental health', 'health health',
+        'water', 'waters', 'clean water', 'aa', 'aa aa',
+        # Non-word characters at either end or inside
+        'c++', 'c#', '.net', 'r&d', 'k-12', 'ai/ml', '(new)', 'u.s.', 'co-op', '$', 'e-mail',
+    ]
+
+    def assertSameCounts(self, keywords, text):
+        self.assertEqual(KeywordMatcher(keywords).count(text), regex_counts(keywords, text), text)
+
+    def test_examples(self):
+        for text in [
+            'mental health care and health care for health workers',
+            'health health health in health-care',
+            'clean water, waters and clean waterways',
+            'aa aa aa aaa aa',
+            'c++ c#, .net and c++/c# on .network; r&d for k-12 and k-123',
+            'ai/ml (new) programs in the u.s. and u.s.a. co-op e-mail $ 5',
+            'c++c++ (new)(new) u.s.u.s. ',
+            '',
+        ]:
+            with self.subTest(text=text):
+                self.assertSameCounts(self.KEYWORDS, text)
+
+    def test_random_text(self):
+        rng = random.Random(1)
+        vocabulary = self.KEYWORDS + ['a', 'the', 'net', 'k', '12', 'x', ',', '-', '/', '.', '(', ')']
+        for _ in range(300):
+            text = ''.join(
+                rng.choice(vocabulary) + rng.choice([' ', '', '', '-', '.', ', '])
+                for _ in range(rng.randint(0, 40))
+            )
+            keywords = rng.sample(self.KEYWORDS, rng.randint(1, len(self.KEYWORDS)))
+            self.assertSameCounts(keywords, text)
+
+    def test_no_keywords(self):
+        self.assertEqual(KeywordMatcher([]).count('health'), {})
+        self.assertFalse(KeywordMatcher(['']))
+
+    def test_leading_run_lookup(self):
+        with mock.patch.object(keywords, 'ALTERNATION_MAX_KEYWORDS', 0):
+            self.assertIsNone(KeywordMatcher(['health'])._pattern)
+            self.test_examples()
+            self.test_random_text()
+            self.test_no_keywords()
+
+
+class KeywordIndexTests(TestCase):
+    """Narrowing candidates through the postings loses no match of a full scan"""
+
+    WORDS = KeywordMatcherTests.KEYWORDS + [
+        'net', 'k', '12', 'mental', 'clean', 'the', 'a', 'grant', 'network', 'k-123', 'c', 'ai', 'ml',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(2)
+        for i in range(120):
+            Opportunity.objects.create(
+                firebase_id=f'index-{i:03d}', collection_name='grants.gov',
+                title=' '.join(rng.choice(cls.WORDS) for _ in range(rng.randint(1, 4))),
+                description=''.join(
+                    rng.choice(cls.WORDS) + rng.choice([' ', ', ', '. ', '-', '/'])
+                    for _ in range(rng.randint(0, 12))
+                ),
+            )
+        for i, text in enumerate([
+            'Build asp.net and c++ tools for k-12 schools', 'Mental health care, health-care and r&d in the u.s. ',
+            'k-123 networks on .network', 'clean water (new) for k-12.',
+        ]):
+            Opportunity.objects.create(firebase_id=f'index-fixed-{i}', collection_name='grants.gov', title=text)
+        # Not indexed yet: always a candidate
+        Opportunity.objects.filter(firebase_id__in=['index-000', 'index-001']).update(indexed_at=None)
+        OpportunityTerm.objects.filter(opportunity__firebase_id__in=['index-000', 'index-001']).delete()
+
+    def matching_ids(self, opportunities, keyword_list):
+        matcher = KeywordMatcher(keyword_list)
+        return {
+            opportunity.firebase_id for opportunity in opportunities
+            if matcher.count(keywords.build_search_text(opportunity))
+        }
+
+    def assertSameMatches(self, keyword_list):
+        queryset = Opportunity.objects.all()
+        full_scan = self.matching_ids(queryset, keyword_list)
+        narrowed = self.matching_ids(KeywordIndex.filter_candidates(queryset, keyword_list), keyword_list)
+        self.assertEqual(narrowed, full_scan, keyword_list)
+        return full_scan
+
+    def test_punctuated_and_multi_word_keywords(self):
+        for keyword_list in [
+            ['.net'], ['k-12'], ['c++', 'c#'], ['r&d'], ['ai/ml'], ['u.s.'], ['(new)'], ['e-mail', 'co-op'],
+            ['health care'], ['mental health', 'clean water'], ['aa aa'], ['health', 'waters'],
+        ]:
+            with self.subTest(keywords=keyword_list):
+                matched = self.assertSameMatches(keyword_list)
+                if keyword_list[0] in ('.net', 'k-12', 'health care', 'mental health'):
+                    self.assertTrue(matched)
+
+    def test_random_keyword_sets(self):
+        rng = random.Random(3)
+        for _ in range(40):
+            self.assertSameMatches(rng.sample(KeywordMatcherTests.KEYWORDS, rng.randint(1, 6)))
+
+    def test_narrows_candidates(self):
+        candidates = KeywordIndex.filter_candidates(Opportunity.objects.all(), ['k-12'])
+        self.assertLess(candidates.count(), Opportunity.objects.count())
+        self.assertLessEqual({'index-000', 'index-001'}, set(candidates.values_list('firebase_id', flat=True)))
+        # '$' has no indexable token: nothing can be ruled out
+        self.assertEqual(
+            KeywordIndex.filter_candidates(Opportunity.objects.all(), ['$', 'health']).count(),
+            Opportunity.objects.count(),
+        )
+
+
+class RankOpportunitiesTests(SimpleTestCase):
+    """The top-K heap returns the head of the full ranking"""
+
+    PROFILE = {'interestsMain': ['health', 'k-12'], 'interestsSub': ['water', 'arts']}
+
+    def documents(self):
+        rng = random.Random(2)
+        words = ['health', 'k-12', 'water', 'arts', 'grant', 'the', 'health-care']
+        today = date.today()
+        return [
+            {
+                'id': f'doc-{i}',
+                'title': ' '.join(rng.choice(words) for _ in range(rng.randint(0, 6))),
+                'description': rng.choice(['', 'Health and water programs']),
+                'closeDate': rng.choice([None, (today + timedelta(days=rng.randint(1, 200))).isoformat()]),
+                'url': rng.choice(['', 'https://example.com']),
+            }
+            for i in range(300)
+        ]
+
+    def test_top_k_equals_full_ranking(self):
+        ranked = matching_algorithm.OpportunityMatcher.rank_opportunities(self.documents(), self.PROFILE)
+        self.assertGreater(len(ranked), 100)
+        for top_k in (1, 7, 50, len(ranked), len(ranked) + 10):
+            with self.subTest(top_k=top_k):
+                top = matching_algorithm.OpportunityMatcher.rank_opportunities(
+                    iter(self.documents()), self.PROFILE, top_k=top_k
+                )
+                self.assertEqual(top, ranked[:top_k])
+
+    def test_streams_from_collections(self):
+        source = MemorySource({'SAM': {doc.pop('id'): doc for doc in self.documents()}})
+        with mock.patch.object(firebase_service.FirebaseService, '_db', source), \
+                mock.patch.object(firebase_service.FirebaseService, '_initialized', True):
+            documents = firebase_service.FirebaseService.iter_opportunities_from_collections(['SAM'])
+            top = matching_algorithm.OpportunityMatcher.rank_opportunities(documents, self.PROFILE, top_k=5)
+            everything = firebase_service.FirebaseService.get_opportunities_from_collections(['SAM'])
+        self.assertEqual(top, matching_algorithm.OpportunityMatcher.rank_opportunities(everything, self.PROFILE)[:5])
+
+
+class SparseScoringEngineTests(TestCase):
+    """The sparse engine scores exactly like the per-opportunity Python path"""
+
+    TEXTS = [
+        'Mental health care for rural clinics; health care workers wanted',
+        'K-12 STEM education and R&D for c++ and .NET developers',
+        'Clean water infrastructure. Water, waters and clean-water grants',
+        'Arts and culture: <b>community</b> arts &amp; health programs',
+        'Youth sports, youth arts, mental-health awareness and k-12 outreach',
+        'Nothing relevant here at all',
+    ]
+    PROFILES = [
+        (['health', 'water'], ['arts', 'care'], ''),
+        (['mental health', 'k-12'], ['r&d', 'c++', '.net', 'health'], 'CA'),
+        (['health care', 'health'], ['clean water', 'youth arts', 'arts'], 'ny'),
+        (['missing keyword'], ['also missing'], ''),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        today = date.today()
+        deadlines = [None, today + timedelta(days=10), today + timedelta(days=60), today + timedelta(days=300)]
+        states = ['CA', 'NY', '', None]
+        opportunities = []
+        for i in range(48):
+            opportunities.append(Opportunity.objects.create(
+                firebase_id=f'sparse-{i}',
+                collection_name=['grants.gov', 'SAM', 'rfpmart', 'grantwatch', 'bid'][i % 5],
+                title=f'Opportunity {i}',
+                description=cls.TEXTS[i % len(cls.TEXTS)],
+                agency='Department of Health' if i % 5 == 0 else 'Agency',
+                state=states[i % len(states)],
+                close_date=deadlines[i % len(deadlines)],
+            ))
+        KeywordIndex.index_opportunities(opportunities)
+
+        cls.profiles = []
+        for i, (main, sub, state) in enumerate(cls.PROFILES):
+            user = User.objects.create(username=f'sparse-{i}')
+            cls.profiles.append(UserProfile.objects.create(
+                user=user, firebase_uid=f'sparse-{i}', funding_types=['Grants', 'Contracts'],
+                interests_main=main, interests_sub=sub, state=state,
+            ))
+
+    @staticmethod
+    def scores(matches):
+        return {
+            match.opportunity_id: (
+                round(match.relevance_score, 9), round(match.win_rate, 9),
+                match.keyword_counts, match.urgency_bucket,
+            )
+            for match in matches
+        }
+
+    def test_same_matches_and_scores(self):
+        engine = SparseScoringEngine(CorpusMatrix.build())
+        hit_keywords = set()
+        for profile in self.profiles:
+            with self.subTest(profile=profile.firebase_uid):
+                matcher = OpportunityMatcher(profile)
+                candidates = Opportunity.objects.filter(collection_name__in=matcher.get_relevant_collections())
+                expected = self.scores(matcher.score_opportunities(candidates))
+                self.assertEqual(self.scores(engine.score(matcher)), expected)
+                for _, _, counts, _ in expected.values():
+                    hit_keywords.update(counts)
+
+        # Phrases and non-word keywords went through _complex_counts
+        self.assertLessEqual({'mental health', 'health care', 'clean water', 'k-12', 'r&d'}, hit_keywords)
+
+
+class SearchTextTests(TestCase):
+    """search_text and the term postings follow edits made outside sync"""
+
+    def setUp(self):
+        self.opportunity = Opportunity.objects.create(
+            firebase_id='search-text', collection_name='grants.gov',
+            title='Rural <b>Clinic</b>', description='Mental health care', agency='HHS',
+        )
+
+    def terms(self):
+        return set(self.opportunity.terms.values_list('term', flat=True))
+
+    def test_create_indexes(self):
+        self.assertEqual(self.opportunity.search_text, 'rural clinic mental health care hhs')
+        self.assertIsNotNone(self.opportunity.indexed_at)
+        self.assertEqual(self.terms(), {'rural', 'clinic', 'mental', 'health', 'care', 'hhs'})
+
+    def test_save_recomputes(self):
+        self.opportunity.description = 'Clean water'
+        self.opportunity.save()
+        self.opportunity.refresh_from_db()
+        self.assertEqual(self.opportunity.search_text, 'rural clinic clean water hhs')
+        self.assertEqual(self.terms(), {'rural', 'clinic', 'clean', 'water', 'hhs'})
+
+        # Through update_fields and with only() too
+        opportunity = Opportunity.objects.only('id', *Opportunity.SEARCH_TEXT_FIELDS).get(pk=self.opportunity.pk)
+        opportunity.title = 'Urban Clinic'
+        opportunity.save(update_fields=['title'])
+        self.opportunity.refresh_from_db()
+        self.assertEqual(self.opportunity.search_text, 'urban clinic clean water hhs')
+        self.assertIn('urban', self.terms())
+
+    def test_other_fields_leave_index(self):
+        opportunity = Opportunity.objects.only('id', 'state').get(pk=self.opportunity.pk)
+        opportunity.state = 'CA'
+        with self.assertNumQueries(1):
+            opportunity.save(update_fields=['state'])
+
+        self.opportunity.refresh_from_db()
+        self.assertEqual(self.opportunity.state, 'CA')
+        self.assertEqual(self.opportunity.search_text, 'rural clinic mental health care hhs')
+
+    def test_fallback_loads_text_once(self):
+        Opportunity.objects.filter(pk=self.opportunity.pk).update(search_text=None)
+        opportunity = Opportunity.objects.only(*matching.SCORING_FIELDS).get(pk=self.opportunity.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(keywords.build_search_text(opportunity), 'rural clinic mental health care hhs')
+
+
+class ProfilePercolatorTests(TestCase):
+    """Ingest-time matching stores what each profile's own match run would"""
+
+    WORDS = ['health', 'water', 'arts', 'k-12', 'c++', '.net', 'youth', 'mental health', 'clinic', 'r&d']
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(3)
+        today = date.today()
+        vocabulary = cls.WORDS + [f'topic{i}' for i in range(100)] + ['the', 'and', ',', '-']
+        cls.opportunities = []
+        for i in range(40):
+            cls.opportunities.append(Opportunity.objects.create(
+                firebase_id=f'percolate-{i}', collection_name=['grants.gov', 'SAM', 'bid'][i % 3],
+                title=' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 12))),
+                state=rng.choice(['CA', '']), close_date=today + timedelta(days=rng.randint(1, 200)),
+            ))
+        # Enough keywords across profiles for the leading-run matcher
+        for i in range(30):
+            user = User.objects.create(username=f'percolate-{i}')
+            UserProfile.objects.create(
+                user=user, firebase_uid=f'percolate-{i}', state=rng.choice(['CA', '']),
+                funding_types=rng.sample(['Grants', 'Contracts', 'Bids'], rng.randint(1, 2)),
+                interests_main=rng.sample(vocabulary, 3), interests_sub=rng.sample(vocabulary, 3),
+            )
+
+    @staticmethod
+    def stored():
+        return {
+            (profile_id, opportunity_id): (round(relevance, 9), round(win_rate, 9), counts)
+            for profile_id, opportunity_id, relevance, win_rate, counts in OpportunityMatch.objects.values_list(
+                'user_profile_id', 'opportunity_id', 'relevance_score', 'win_rate', 'keyword_counts'
+            )
+        }
+
+    def test_same_matches_as_each_profile(self):
+        percolator = ProfilePercolator()
+        self.assertGreater(len(percolator.keyword_matcher.keywords), keywords.ALTERNATION_MAX_KEYWORDS)
+        percolator.percolate(self.opportunities)
+        percolated = self.stored()
+        self.assertGreater(len(percolated), 20)
+
+        OpportunityMatch.objects.all().delete()
+        for profile in UserProfile.objects.all():
+            OpportunityMatcher(profile).match_opportunities(full=True)
+        self.assertEqual(percolated, self.stored())
+
+    def test_drops_matches_no_longer_earned(self):
+        user = User.objects.create(username='percolate-arts')
+        profile = UserProfile.objects.create(user=user, firebase_uid='percolate-arts', funding_types=['Grants'],
+                                             interests_main=['arts'], interests_sub=[])
+        kept, changed, dismissed = [
+            Opportunity.objects.create(firebase_id=f'percolate-arts-{i}', collection_name='grants.gov',
+                                       title='Community arts')
+            for i in range(3)
+        ]
+        ProfilePercolator([profile]).percolate([kept, changed, dismissed])
+        OpportunityMatch.objects.filter(opportunity=dismissed).update(is_dismissed=True)
+
+        for opportunity in (changed, dismissed):
+            opportunity.title = 'Road repair'
+            opportunity.save()
+        ProfilePercolator([profile]).percolate([changed, dismissed])
+        self.assertEqual(
+            set(OpportunityMatch.objects.filter(user_profile=profile).values_list('opportunity_id', flat=True)),
+            {kept.pk, dismissed.pk},
+        )
+
+
+class InterestRematchTests(TestCase):
+    """Rematching only the keyword delta ends where a full rematch does"""
+
+    TEXTS = [
+        'health clinic', 'health and water', 'water only', 'arts only', 'mental health arts',
+        'youth water arts', 'nothing here', 'k-12 health',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        today = date.today()
+        opportunities = [
+            Opportunity.objects.create(
+                firebase_id=f'rematch-{i}', collection_name='grants.gov', title=cls.TEXTS[i % len(cls.TEXTS)],
+                state='CA' if i % 2 else '', close_date=today + timedelta(days=20 * (i % 7)),
+            )
+            for i in range(40)
+        ]
+        KeywordIndex.index_opportunities(opportunities)
+        # Synced well before the profile's first match run
+        Opportunity.objects.update(last_synced=timezone.now() - timedelta(days=1))
+        user = User.objects.create(username='rematch')
+        cls.profile = UserProfile.objects.create(
+            user=user, firebase_uid='rematch', funding_types=['Grants'], state='CA',
+            interests_main=['health'], interests_sub=['water', 'arts'],
+        )
+
+    def stored(self):
+        return {
+            opportunity_id: (round(relevance, 9), round(win_rate, 9), counts)
+            for opportunity_id, relevance, win_rate, counts in OpportunityMatch.objects.filter(
+                user_profile=self.profile
+            ).values_list('opportunity_id', 'relevance_score', 'win_rate', 'keyword_counts')
+        }
+
+    def edit_interests(self, interests_main, interests_sub):
+        """Rematch the keyword delta, then the incremental run a request makes"""
+        OpportunityMatcher(self.profile).match_opportunities(full=True)
+        previous = OpportunityMatcher(copy.copy(self.profile))
+        self.profile.interests_main = interests_main
+        self.profile.interests_sub = interests_sub
+        self.profile.save()
+
+        self.assertTrue(OpportunityMatcher(self.profile).rematch_interest_changes(previous))
+        # Synced after the watermark: left to the next incremental run
+        recent = Opportunity.objects.create(firebase_id='rematch-recent', collection_name='grants.gov',
+                                            title='youth health water k-12')
+        KeywordIndex.index_opportunities([recent])
+        OpportunityMatcher(self.profile).match_opportunities()
+        return self.stored()
+
+    def full_rematch(self):
+        OpportunityMatch.objects.filter(user_profile=self.profile).delete()
+        OpportunityMatcher(self.profile).match_opportunities(full=True)
+        return self.stored()
+
+    def test_added_keywords(self):
+        delta = self.edit_interests(['health', 'youth'], ['water', 'arts', 'k-12'])
+        self.assertEqual(delta, self.full_rematch())
+
+    def test_removed_keywords(self):
+        only_arts = set(Opportunity.objects.filter(title='arts only').values_list('pk', flat=True))
+        delta = self.edit_interests(['health'], ['water'])
+        self.assertEqual(delta, self.full_rematch())
+        # Rows whose only hit was a removed keyword are gone
+        self.assertTrue(only_arts)
+        self.assertFalse(only_arts & set(delta))
+
+    def test_added_and_removed_keywords(self):
+        delta = self.edit_interests(['water', 'mental health'], ['youth'])
+        self.assertEqual(delta, self.full_rematch())
+
+
+class WatermarkTests(TestCase):
+    """Incremental runs score what was synced since the profile's watermark"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(12):
+            Opportunity.objects.create(
+                firebase_id=f'watermark-{i:02d}', collection_name='grants.gov', state='CA',
+                title=['health clinic', 'water arts', 'health and water'][i % 3],
+            )
+        user = User.objects.create(username='watermark')
+        cls.profile = UserProfile.objects.create(
+            user=user, firebase_uid='watermark', funding_types=['Grants'], state='CA',
+            interests_main=['health'], interests_sub=['water', 'arts'],
+        )
+
+    def scored(self, **kwargs):
+        """firebase ids of the opportunities one match run scores"""
+        score_opportunities = OpportunityMatcher.score_opportunities
+        ids = []
+
+        def spy(matcher, opportunities, *args, **kw):
+            def record():
+                for opportunity in opportunities:
+                    ids.append(opportunity.pk)
+                    yield opportunity
+            return score_opportunities(matcher, record(), *args, **kw)
+
+        with mock.patch.object(OpportunityMatcher, 'score_opportunities', autospec=True, side_effect=spy):
+            OpportunityMatcher(self.profile).match_opportunities()
+        return set(Opportunity.objects.filter(pk__in=ids).values_list('firebase_id', flat=True))
+
+    def synced(self, firebase_ids, at):
+        Opportunity.objects.filter(firebase_id__in=firebase_ids).update(last_synced=at)
+
+    def test_incremental_run_scores_rows_since_watermark(self):
+        Opportunity.objects.update(last_synced=timezone.now() - timedelta(days=1))
+        self.assertEqual(len(self.scored()), 12)
+        watermark = self.profile.last_matched_at
+        self.assertIsNotNone(watermark)
+        self.assertLess(watermark, timezone.now() - matching.WATERMARK_MARGIN)
+
+        self.synced(['watermark-00', 'watermark-01'], watermark - timedelta(seconds=1))
+        # Synced while the last run was going: inside WATERMARK_MARGIN
+        self.synced(['watermark-02', 'watermark-03'], watermark + timedelta(seconds=1))
+        self.synced(['watermark-04'], watermark)
+        self.synced(['watermark-05'], timezone.now())
+        self.assertEqual(self.scored(), {'watermark-02', 'watermark-03', 'watermark-04', 'watermark-05'})
+        self.assertGreater(self.profile.last_matched_at, watermark)
+
+        # Matches outside the scored rows are left in place
+        self.assertEqual(OpportunityMatch.objects.filter(user_profile=self.profile).count(), 12)
+
+    def test_signature_change_forces_full_rematch(self):
+        Opportunity.objects.update(last_synced=timezone.now() - timedelta(days=1))
+        self.scored()
+        self.assertEqual(self.scored(), set())
+
+        self.profile.interests_sub = ['water']
+        self.profile.save()
+        self.assertEqual(len(self.scored()), 12)
+        self.assertEqual(OpportunityMatch.objects.filter(user_profile=self.profile).count(), 12)
+
+        self.assertEqual(self.scored(), set())
+        self.profile.state = 'NY'
+        self.profile.save()
+        self.assertEqual(len(self.scored()), 12)
+
+
+class UrgencyTests(TestCase):
+    """The SQL urgency bucket and rerank_urgency agree with the Python scoring path"""
+
+    TEXTS = ['health clinic', 'health and water', 'water arts', 'mental health arts']
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='urgency')
+        cls.profile = UserProfile.objects.create(
+            user=user, firebase_uid='urgency', funding_types=['Grants'], state='CA',
+            interests_main=['health'], interests_sub=['water', 'arts'],
+        )
+
+    def create(self, name, **dates):
+        return Opportunity.objects.create(
+            firebase_id=f'urgency-{name}', collection_name='grants.gov',
+            title=self.TEXTS[Opportunity.objects.count() % len(self.TEXTS)], state='CA', **dates,
+        )
+
+    def test_expression_matches_property(self):
+        today = date.today()
+        for days in [-1, 0, 6, 7, 8, 29, 30, 31, 91, 92, 93, 365]:
+            self.create(f'close-{days}', close_date=today + timedelta(days=days))
+            self.create(f'deadline-{days}', deadline=today + timedelta(days=days))
+        # close_date wins over deadline
+        self.create('both', close_date=today + timedelta(days=92), deadline=today)
+        self.create('none')
+
+        annotated = Opportunity.objects.annotate(bucket=Opportunity.urgency_bucket_expression())
+        for opportunity in annotated:
+            with self.subTest(opportunity=opportunity.firebase_id):
+                self.assertEqual(opportunity.bucket, opportunity.urgency_bucket)
+        self.assertEqual(
+            {opportunity.bucket for opportunity in annotated}, {'urgent', 'soon', 'ongoing'}
+        )
+
+    def stored(self):
+        return {
+            opportunity_id: (round(relevance, 9), round(win_rate, 9), bucket)
+            for opportunity_id, relevance, win_rate, bucket in OpportunityMatch.objects.filter(
+                user_profile=self.profile
+            ).values_list('opportunity_id', 'relevance_score', 'win_rate', 'urgency_bucket')
+        }
+
+    def test_rerank_matches_full_rematch(self):
+        today = date.today()
+        opportunities = [
+            self.create(f'rerank-{i}', close_date=today + timedelta(days=days))
+            for i, days in enumerate([5, 25, 35, 50, 100, 120, 200])
+        ]
+        self.create('rerank-open')
+        OpportunityMatcher(self.profile).match_opportunities(full=True)
+        before = self.stored()
+
+        # Deadlines draw closer, across both bucket edges
+        for opportunity, days in zip(opportunities, [-5, 5, 15, 30, 45, 92, 93]):
+            Opportunity.objects.filter(pk=opportunity.pk).update(close_date=today + timedelta(days=days))
+        call_command('rerank_urgency', stdout=io.StringIO())
+        reranked = self.stored()
+        self.assertEqual(set(reranked), set(before))
+        self.assertNotEqual(reranked, before)
+
+        OpportunityMatch.objects.filter(user_profile=self.profile).delete()
+        OpportunityMatcher(self.profile).match_opportunities(full=True)
+        self.assertEqual(reranked, self.stored())
+
+
+class MatchApiTests(TestCase):
+    """/api/match/ pages through the stored ranking with a keyset cursor"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Groups of identical opportunities, so most scores tie
+        for i in range(23):
+            Opportunity.objects.create(
+                firebase_id=f'api-{i:02d}', collection_name='grants.gov', state='CA',
+                title=['health clinic', 'health water arts', 'water'][i % 3],
+            )
+        user = User.objects.create(username='api')
+        cls.profile = UserProfile.objects.create(
+            user=user, firebase_uid='api', funding_types=['Grants'], state='CA',
+            interests_main=['health'], interests_sub=['water', 'arts'],
+        )
+
+    def post(self, **data):
+        return self.client.post(
+            reverse('opportunities:match_opportunities'), {'firebase_uid': 'api', **data}, content_type='application/json'
+        )
+
+    def pages(self, limit):
+        """firebase ids of every page, following next_cursor to the end"""
+        pages = []
+        cursor = None
+        # A cursor that doesn't advance would page forever
+        for _ in range(Opportunity.objects.count() + 1):
+            response = self.post(limit=limit, cursor=cursor)
+            self.assertEqual(response.status_code, 200)
+            pages.append([match['id'] for match in response.json()['matches']])
+            cursor = response.json()['next_cursor']
+            if cursor is None:
+                return pages
+        self.fail(f'More pages than opportunities with limit={limit}')
+
+    def test_pages_cover_every_match_once(self):
+        for limit in [1, 4, 7, 50]:
+            with self.subTest(limit=limit):
+                ids = [firebase_id for page in self.pages(limit) for firebase_id in page]
+                self.assertEqual(len(ids), 23)
+                self.assertEqual(set(ids), set(Opportunity.objects.values_list('firebase_id', flat=True)))
+        scores = OpportunityMatch.objects.filter(user_profile=self.profile).values_list('relevance_score', flat=True)
+        self.assertLess(len(set(scores)), 4)
+
+    def test_malformed_cursor(self):
+        for cursor in ['abc', '1.5', 'x:1', '1.5:y', ['1.5', 3], {'score': 1}]:
+            with self.subTest(cursor=cursor):
+                response = self.post(cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid limit or cursor'})
+
+    def test_constant_queries(self):
+        """Scoring 3x more matches runs the same statements"""
+        def run():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post(full=True).status_code, 200)
+            return [query['sql'].split(' ', 1)[0] for query in queries]
+
+        few = run()
+        for i in range(23, 69):
+            Opportunity.objects.create(
+                firebase_id=f'api-{i:02d}', collection_name='grants.gov', state='CA', title='health water',
+            )
+        many = run()
+        self.assertEqual(OpportunityMatch.objects.filter(user_profile=self.profile).count(), 69)
+        self.assertEqual(many, few)
+        self.assertEqual(sum(statement in ('INSERT', 'UPDATE', 'DELETE') for statement in many), 3)
+
+    def test_dismissed_applied_and_saved_are_excluded(self):
+        self.pages(50)
+        OpportunityMatch.objects.filter(opportunity__firebase_id='api-00').update(is_dismissed=True)
+        Application.objects.create(user_profile=self.profile, opportunity=Opportunity.objects.get(firebase_id='api-01'))
+        SavedOpportunity.objects.create(user_profile=self.profile, opportunity=Opportunity.objects.get(firebase_id='api-02'))
+        # Another profile's application doesn't hide anything
+        other = UserProfile.objects.create(user=User.objects.create(username='api-other'), firebase_uid='api-other')
+        Application.objects.create(user_profile=other, opportunity=Opportunity.objects.get(firebase_id='api-03'))
+
+        ids = [firebase_id for page in self.pages(5) for firebase_id in page]
+        self.assertEqual(len(ids), 20)
+        self.assertEqual(set(ids), {f'api-{i:02d}' for i in range(3, 23)})
+
+
+class JsonlSourceTests(SimpleTestCase):
+    """Queries over a JSONL directory behave like Firestore"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with open(os.path.join(directory.name, 'SAM.jsonl'), 'w') as handle:
+            for i in range(25):
+                handle.write(json.dumps({'id': f'doc-{i:02d}', 'data': {
+                    'number': str(i),
+                    'updatedAt': (datetime(2025, 1, 1) + timedelta(days=i)).isoformat() + 'Z',
+                }}) + '\n')
+        self.source = JsonlSource(directory.name, timestamp_fields=('updatedAt',))
+
+    def test_timestamp_fields_are_parsed(self):
+        doc = self.source.collection('SAM').document('doc-03').get()
+        self.assertEqual(doc.get('updatedAt'), datetime(2025, 1, 4, tzinfo=dt_timezone.utc))
+        since = datetime(2025, 1, 20, tzinfo=dt_timezone.utc)
+        query = self.source.collection('SAM').where('updatedAt', '>=', since)
+        self.assertEqual([doc.id for doc in query.stream()], [f'doc-{i:02d}' for i in range(19, 25)])
+
+    def test_other_strings_compare_as_strings(self):
+        query = self.source.collection('SAM').order_by('number').limit(4)
+        self.assertEqual([doc.get('number') for doc in query.stream()], ['0', '1', '10', '11'])
+        query = self.source.collection('SAM').where('number', '>', '3')
+        self.assertEqual(sorted(doc.get('number') for doc in query.stream()),
+                         ['4', '5', '6', '7', '8', '9'])
+
+    def test_pages_read_every_document_once(self):
+        ref = self.source.collection('SAM').order_by('__name__')
+        seen, last = [], None
+        while True:
+            query = ref.limit(10) if last is None else ref.start_after({'__name__': last}).limit(10)
+            page = [(doc.id, doc.get('number')) for doc in query.stream()]
+            if not page:
+                break
+            seen.extend(page)
+            last = page[-1][0]
+        self.assertEqual(seen, [(f'doc-{i:02d}', str(i)) for i in range(25)])
+
+
+@override_settings(COMPRESS_TEXT_FIELDS=True)
+class CorpusSnapshotTests(TransactionTestCase):
+    """import_corpus restores exactly what export_corpus wrote"""
+
+    MODELS = [Opportunity, OpportunityTerm, SyncState]
+
+    def setUp(self):
+        long_text = 'Community health and clean water programs. ' * 40
+        opportunities = [
+            Opportunity.objects.create(
+                firebase_id=f'snapshot-{i}', collection_name='grants.gov', title=f'Snapshot {i}',
+                description=long_text if i % 2 else '\x01not compressed', summary=None if i % 3 else 'Short',
+                close_date=date(2025, 1, 1) + timedelta(days=i), extra_data={'index': i},
+            )
+            for i in range(25)
+        ]
+        KeywordIndex.index_opportunities(opportunities)
+        SyncState.objects.create(collection_name='grants.gov', scan_cursor='snapshot-24', generation=3,
+                                 high_water_mark=datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def rows(self):
+        """Every stored row of the snapshot tables, as the database holds it"""
+        rows = {}
+        with connection.cursor() as cursor:
+            for model in self.MODELS:
+                table = connection.ops.quote_name(model._meta.db_table)
+                cursor.execute(f'SELECT * FROM {table} ORDER BY {connection.ops.quote_name(model._meta.pk.column)}')
+                rows[model] = cursor.fetchall()
+        return rows
+
+    def index_names(self):
+        with connection.cursor() as cursor:
+            return {
+                model: set(connection.introspection.get_constraints(cursor, model._meta.db_table))
+                for model in self.MODELS
+            }
+
+    def test_round_trip(self):
+        exported = self.rows()
+        indexes = self.index_names()
+        self.assertTrue(any(row[4].startswith('\x01z') for row in exported[Opportunity] if row[4]))
+        CorpusSnapshot.export(self.directory, with_terms=True, chunk_size=7, compression='gzip')
+
+        # An empty database: tables flushed and their sequences reset
+        for model in self.MODELS:
+            model.objects.all().delete()
+        sequences = [{'table': model._meta.db_table, 'column': model._meta.pk.column} for model in self.MODELS]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_by_name_sql(no_style(), sequences):
+                cursor.execute(sql)
+        self.assertFalse(Opportunity.objects.exists())
+
+        loaded = CorpusSnapshot.load(self.directory)
+        self.assertEqual(loaded, {'opportunities': 25, 'opportunity_terms': OpportunityTerm.objects.count(),
+                                  'sync_states': 1})
+        self.assertEqual(self.rows(), exported)
+        self.assertEqual(self.index_names(), indexes)
+
+        opportunity = Opportunity.objects.get(firebase_id='snapshot-1')
+        self.assertEqual(opportunity.description, 'Community health and clean water programs. ' * 40)
+        self.assertEqual(Opportunity.objects.get(firebase_id='snapshot-0').description, '\x01not compressed')
+        created = Opportunity.objects.create(firebase_id='snapshot-new', collection_name='grants.gov')
+        self.assertGreater(created.pk, max(row[0] for row in exported[Opportunity]))
+
+    def test_without_terms_clears_indexed_at(self):
+        CorpusSnapshot.export(self.directory, compression='gzip')
+        OpportunityTerm.objects.all().delete()
+        Opportunity.objects.all().delete()
+        CorpusSnapshot.load(self.directory)
+        self.assertEqual(Opportunity.objects.filter(indexed_at__isnull=True).count(), 25)
+        self.assertFalse(OpportunityTerm.objects.exists())
+
+
+class RawDataTests(TestCase):
+    """Opportunity.raw_data rebuilds the synced document from extra_data and the columns"""
+
+    DOCUMENTS = {
+        'promoted': {
+            'title': 'Clean water grant', 'description': 'Wells and pumps', 'agency': 'EPA',
+            'url': 'https://example.com/a', 'contactEmail': 'a@example.com', 'amount': 5000,
+        },
+        # Values that differ from the column they map to stay in extra_data
+        'differs': {
+            'title': '', 'description': None, 'synopsisUrl': 'https://example.com/s', 'link': 'https://example.com/l',
+            'state': 42, 'city': ['Austin'], 'contactPhone': '',
+        },
+        'literal-markers': {
+            'title': 'Markers', '__promoted__': ['title'], '__zlib__': 'not compressed', '__document__': {'a': 1},
+        },
+        'literal-promoted-only': {'title': 'Markers', '__promoted__': 'title'},
+        'minimal': {'title': 'Only a title'},
+        'empty': {},
+        'nested': {'title': 'Nested', 'tags': ['a', 'b'], 'meta': {'title': 'inner', 'n': None}, 'ok': True},
+    }
+
+    def assertRoundTrips(self):
+        for doc_id, document in self.DOCUMENTS.items():
+            with self.subTest(document=doc_id):
+                opportunity = FirebaseService._build_opportunity(doc_id, 'grants.gov', copy.deepcopy(document))
+                opportunity.save()
+                self.assertEqual(Opportunity.objects.get(pk=opportunity.pk).raw_data, document)
+        Opportunity.objects.all().delete()
+
+    def test_round_trip(self):
+        self.assertRoundTrips()
+        packed = FirebaseService._build_opportunity('promoted', 'grants.gov', self.DOCUMENTS['promoted']).extra_data
+        self.assertEqual(set(packed), {'amount', '__promoted__'})
+
+    @override_settings(EXTRA_DATA_COMPRESS_BYTES=1)
+    def test_round_trip_compressed(self):
+        self.assertRoundTrips()
+
+
+class CompressedTextFieldTests(TestCase):
+    """Text round-trips through the field in either storage mode"""
+
+    VALUES = [
+        'Community health and clean water programs. ' * 40,
+        'Short',
+        '',
+        HEADER,
+        HEADER + 'z not base64',
+        HEADER + 'p' + HEADER + 'already escaped',
+        HEADER + 'x' * 600,
+        'Unicode ✓ ' * 100,
+        None,
+    ]
+
+    def stored(self, opportunity):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT description FROM {Opportunity._meta.db_table} WHERE id = %s', [opportunity.pk])
+            return cursor.fetchone()[0]
+
+    def assertRoundTrips(self):
+        for i, value in enumerate(self.VALUES):
+            with self.subTest(value=value and value[:20]):
+                opportunity = Opportunity.objects.create(firebase_id=f'text-{i}', description=value)
+                loaded = Opportunity.objects.get(pk=opportunity.pk)
+                self.assertEqual(loaded.description, value)
+                self.assertEqual(Opportunity.objects.filter(pk=opportunity.pk).values_list('description', flat=True).get(), value)
+                self.assertEqual(Opportunity.objects.filter(pk=opportunity.pk).values()[0]['description'], value)
+                self.assertIs(type(loaded.description), str if value is not None else type(None))
+                loaded.save()
+                self.assertEqual(Opportunity.objects.get(pk=opportunity.pk).description, value)
+
+    def test_plain_by_default(self):
+        self.assertRoundTrips()
+        self.assertEqual(self.stored(Opportunity.objects.get(firebase_id='text-0')), self.VALUES[0])
+        self.assertEqual(self.stored(Opportunity.objects.get(firebase_id='text-3')), HEADER + 'p' + HEADER)
+
+    @override_settings(COMPRESS_TEXT_FIELDS=True)
+    def test_compressed_when_enabled(self):
+        self.assertRoundTrips()
+        self.assertTrue(self.stored(Opportunity.objects.get(firebase_id='text-0')).startswith(HEADER + 'z'))
+        self.assertEqual(self.stored(Opportunity.objects.get(firebase_id='text-1')), 'Short')
+
+    def test_rewrite_command(self):
+        self.assertRoundTrips()
+        with override_settings(COMPRESS_TEXT_FIELDS=True):
+            call_command('compress_opportunity_text', stdout=io.StringIO())
+        compressed = Opportunity.objects.get(firebase_id='text-0')
+        self.assertTrue(self.stored(compressed).startswith(HEADER + 'z'))
+        self.assertEqual(compressed.description, self.VALUES[0])
+
+        call_command('compress_opportunity_text', stdout=io.StringIO())
+        self.assertEqual(self.stored(compressed), self.VALUES[0])
+        for i, value in enumerate(self.VALUES):
+            self.assertEqual(Opportunity.objects.get(firebase_id=f'text-{i}').description, value)
+
+
+class ContentHashTests(TestCase):
+    """Documents whose content hash is unchanged are not written or matched again"""
+
+    DATA = {'title': 'Rural clinic grant', 'description': 'Mental health care'}
+
+    def write(self, data):
+        """Write one document; returns (written, percolated firebase ids, SQL run)"""
+        percolator = mock.Mock(spec=ProfilePercolator)
+        opportunity = FirebaseService._build_opportunity('doc-1', 'SAM', data)
+        with CaptureQueriesContext(connection) as queries:
+            written = FirebaseService._write_chunk('SAM', [opportunity], percolator=percolator)
+        percolated = [
+            opp.firebase_id for call in percolator.percolate.call_args_list for opp in call.args[0]
+        ]
+        return written, percolated, [query['sql'] for query in queries]
+
+    def test_unchanged_document_is_skipped(self):
+        self.assertEqual(self.write(self.DATA)[:2], (1, ['doc-1']))
+        last_synced = Opportunity.objects.get().last_synced
+
+        written, percolated, sql = self.write(dict(self.DATA))
+        self.assertEqual((written, percolated), (0, []))
+        self.assertEqual([q for q in sql if q.startswith(('INSERT', 'UPDATE', 'DELETE'))], [])
+        self.assertEqual(Opportunity.objects.get().last_synced, last_synced)
+
+    def test_changed_document_is_rewritten(self):
+        self.write(self.DATA)
+        written, percolated, _ = self.write({**self.DATA, 'description': 'Clean water'})
+        self.assertEqual((written, percolated), (1, ['doc-1']))
+        opportunity = Opportunity.objects.get()
+        self.assertEqual(opportunity.description, 'Clean water')
+        self.assertEqual(
+            opportunity.content_hash, FirebaseService._content_hash('SAM', {**self.DATA, 'description': 'Clean water'})
+        )
+        self.assertEqual(set(opportunity.terms.values_list('term', flat=True)), {
+            'rural', 'clinic', 'grant', 'clean', 'water',
+        })
+
+    def test_tombstoned_document_is_restored(self):
+        self.write(self.DATA)
+        Opportunity.objects.update(tombstoned_at=timezone.now())
+
+        written, percolated, _ = self.write(dict(self.DATA))
+        self.assertEqual((written, percolated), (1, ['doc-1']))
+        self.assertIsNone(Opportunity.objects.get().tombstoned_at)
+
+
+class ParseSinceTests(SimpleTestCase):
+    """--since is parsed the same way by sync_opportunities and rematch_all"""
+
+    def test_values(self):
+        self.assertIsNone(parse_since(None))
+        self.assertIsNone(parse_since(''))
+        self.assertEqual(
+            parse_since('2025-03-04'), timezone.make_aware(datetime(2025, 3, 4)),
+        )
+        self.assertEqual(
+            parse_since('2025-03-04T05:06:07+02:00'), datetime(2025, 3, 4, 3, 6, 7, tzinfo=dt_timezone.utc),
+        )
+        self.assertTrue(timezone.is_aware(parse_since('2025-03-04 05:06')))
+
+    def test_invalid(self):
+        for command in ['sync_opportunities', 'rematch_all']:
+            with self.subTest(command=command), \
+                    self.assertRaisesMessage(CommandError, 'Invalid --since value: yesterday'):
+                call_command(command, since='yesterday')
+
+
+class SyncTestCase(TestCase):
+    """Syncs the SAM collection of a MemorySource in pages of 10 documents"""
+
+    BASE = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.source = MemorySource({'SAM': {
+            f'doc-{i:03d}': {'title': f'Opportunity {i}', 'updatedAt': self.BASE + timedelta(minutes=i)}
+            for i in range(95)
+        }})
+
+    def sync(self, interrupt_after=None, **kwargs):
+        """
+        Run one sync, raising out of it once interrupt_after pages were written
+        Returns: ids of the documents written, in order; the queries each
+        page ran are left in self.page_queries
+        """
+        write_chunk = FirebaseService._write_chunk
+        pages = []
+        self.page_queries = []
+
+        def write(*args, **kw):
+            if interrupt_after is not None and len(pages) >= interrupt_after:
+                raise RuntimeError('interrupted')
+            pages.append([opp.firebase_id for opp in args[1]])
+            with CaptureQueriesContext(connection) as queries:
+                written = write_chunk(*args, **kw)
+            self.page_queries.append(len(queries))
+            return written
+
+        with mock.patch.object(firebase_integration, 'SYNC_CHUNK_SIZE', 10), \
+                mock.patch.object(FirebaseService, '_db', self.source), \
+                mock.patch.object(FirebaseService, '_write_chunk', side_effect=write):
+            if interrupt_after is None:
+                FirebaseService.sync_opportunities_from_collection('SAM', **kwargs)
+            else:
+                with self.assertLogs(firebase_integration.logger, 'ERROR'):
+                    FirebaseService.sync_opportunities_from_collection('SAM', **kwargs)
+        return [firebase_id for page in pages for firebase_id in page]
+
+    def touch(self, indexes, minutes):
+        """Update documents in Firestore after everything synced so far"""
+        for n, i in enumerate(indexes):
+            self.source.collection('SAM').document(f'doc-{i:03d}').set({
+                'title': f'Updated {i}', 'updatedAt': self.BASE + timedelta(minutes=minutes + n),
+            })
+
+
+@override_settings(FIRESTORE_UPDATED_FIELD='updatedAt')
+class SyncResumeTests(SyncTestCase):
+    """Interrupted syncs resume after their last committed page"""
+
+    def test_full_pass_resumes_after_scan_cursor(self):
+        first = self.sync(interrupt_after=3)
+        self.assertEqual(first, [f'doc-{i:03d}' for i in range(30)])
+        state = SyncState.objects.get(collection_name='SAM')
+        self.assertEqual(state.scan_cursor, 'doc-029')
+        self.assertIsNone(state.last_completed_at)
+
+        second = self.sync()
+        self.assertEqual(second, [f'doc-{i:03d}' for i in range(30, 95)])
+        state.refresh_from_db()
+        self.assertEqual(state.scan_cursor, '')
+        self.assertEqual(state.high_water_mark, self.BASE + timedelta(minutes=94))
+        self.assertEqual(Opportunity.objects.count(), 95)
+
+    def test_incremental_pass_resumes_after_high_water_mark(self):
+        self.sync()
+        updated = [5, 50, 17, 80, 3, 64, 41, 22, 9, 70, 11, 33, 90, 2, 58]
+        self.touch(updated, minutes=1000)
+        in_update_order = [f'doc-{i:03d}' for i in updated]
+
+        first = self.sync(interrupt_after=1)
+        self.assertEqual(first, in_update_order[:10])
+        state = SyncState.objects.get(collection_name='SAM')
+        self.assertEqual(state.high_water_mark, self.BASE + timedelta(minutes=1009))
+        self.assertEqual(state.high_water_id, 'doc-070')
+
+        self.assertEqual(self.sync(), in_update_order[10:])
+        self.assertEqual(self.sync(), [])
+        self.assertEqual(Opportunity.objects.filter(title__startswith='Updated').count(), len(updated))
+
+    def test_queries_per_page(self):
+        self.sync()
+        self.assertEqual(len(self.page_queries), 10)
+        self.assertEqual(len(set(self.page_queries)), 1, self.page_queries)
+        per_page = self.page_queries[0]
+        self.assertLessEqual(per_page, 12)
+
+        # However many rows of a page changed: one more UPDATE restamps the
+        # unchanged ones, and pages with no change skip every write
+        self.touch([0, 15, 16, 17, 40], minutes=1000)
+        self.assertEqual(len(self.sync(full=True)), 95)
+        changed, unchanged = per_page + 1, min(self.page_queries)
+        self.assertLess(unchanged, per_page)
+        self.assertEqual(self.page_queries, [changed, changed, unchanged, unchanged, changed] + [unchanged] * 5)
+
+    def test_since_during_unfinished_full_pass(self):
+        self.sync(interrupt_after=3)
+        since = self.BASE + timedelta(minutes=89)
+        with self.assertRaisesMessage(CommandError, 'full pass is unfinished for: SAM'):
+            call_command('sync_opportunities', collections=['SAM'], since=since.isoformat())
+        # Other collections are not held back
+        with mock.patch.object(FirebaseService, 'sync_all_opportunities', return_value=0) as sync_all:
+            call_command('sync_opportunities', collections=['bid'], since=since.isoformat(),
+                         skip_matching=True, stdout=io.StringIO())
+        self.assertEqual(sync_all.call_args.kwargs['since'], since)
+
+        # Called directly, the pass is finished and since ignored, with a warning
+        with self.assertLogs(firebase_integration.logger, 'WARNING') as logs:
+            resumed = self.sync(since=since)
+        self.assertEqual(resumed, [f'doc-{i:03d}' for i in range(30, 95)])
+        self.assertIn('ignoring since=', '\n'.join(logs.output))
+
+    def test_since_does_not_move_the_mark_back(self):
+        self.sync()
+        self.touch([7], minutes=500)
+        self.assertEqual(self.sync(), ['doc-007'])
+        mark = SyncState.objects.get(collection_name='SAM').high_water_mark
+
+        # Replays everything updated after minute 89, including doc-007
+        backfill = self.sync(since=self.BASE + timedelta(minutes=89))
+        self.assertEqual(backfill, ['doc-090', 'doc-091', 'doc-092', 'doc-093', 'doc-094', 'doc-007'])
+        self.assertEqual(SyncState.objects.get(collection_name='SAM').high_water_mark, mark)
+
+        self.assertEqual(self.sync(), [])
+
+
+@override_settings(FIRESTORE_UPDATED_FIELD='updatedAt')
+class SyncSweepTests(SyncTestCase):
+    """Only a completed full pass removes documents deleted from Firestore"""
+
+    def delete(self, indexes):
+        for i in indexes:
+            self.source.collection('SAM').document(f'doc-{i:03d}').delete()
+
+    def remaining(self, indexes):
+        return set(Opportunity.objects.filter(
+            firebase_id__in=[f'doc-{i:03d}' for i in indexes]
+        ).values_list('firebase_id', flat=True))
+
+    def test_full_pass_removes_deleted_documents(self):
+        self.sync()
+        self.delete([10, 94])
+        self.assertEqual(len(self.sync(full=True)), 93)
+        self.assertEqual(self.remaining([10, 94]), set())
+        self.assertEqual(Opportunity.objects.count(), 93)
+
+    def test_referenced_documents_are_tombstoned(self):
+        self.sync()
+        user = User.objects.create(username='sweep-test')
+        profile = UserProfile.objects.create(user=user, firebase_uid='sweep-test')
+        Application.objects.create(user_profile=profile, opportunity=Opportunity.objects.get(firebase_id='doc-010'))
+        SavedOpportunity.objects.create(user_profile=profile, opportunity=Opportunity.objects.get(firebase_id='doc-020'))
+        self.delete([10, 20, 30])
+
+        self.sync(full=True)
+        self.assertEqual(self.remaining([10, 20, 30]), {'doc-010', 'doc-020'})
+        tombstoned = Opportunity.objects.filter(tombstoned_at__isnull=False)
+        self.assertEqual(set(tombstoned.values_list('firebase_id', flat=True)), {'doc-010', 'doc-020'})
+
+        # A tombstoned document that comes back is restored
+        self.touch([10], minutes=1000)
+        self.sync(full=True)
+        self.assertEqual(list(tombstoned.values_list('firebase_id', flat=True)), ['doc-020'])
+
+    def test_limited_and_incremental_runs_do_not_sweep(self):
+        self.sync()
+        self.delete([10, 50])
+        self.touch([60], minutes=1000)
+
+        self.assertEqual(self.sync(), ['doc-060'])
+        self.assertEqual(self.remaining([10, 50]), {'doc-010', 'doc-050'})
+
+        self.assertEqual(len(self.sync(full=True, limit=30)), 30)
+        self.assertEqual(self.remaining([10, 50]), {'doc-010', 'doc-050'})
+
+        # The next run finishes the same pass, and only then sweeps
+        self.assertEqual(len(self.sync()), 63)
+        self.assertEqual(self.remaining([10, 50]), set())
+        self.assertEqual(Opportunity.objects.count(), 93)
+
+
+@override_settings(FIRESTORE_UPDATED_FIELD='updatedAt')
+class ConcurrentSyncTests(TestCase):
+    """Reading collections on a thread pool writes what the serial sync does"""
+
+    BASE = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+    COLLECTIONS = {'SAM': 45, 'grants.gov': 32, 'rfpmart': 7, 'bid': 0}
+
+    def setUp(self):
+        self.source = MemorySource({
+            collection_name: {
+                f'{collection_name}-{i:03d}': {
+                    'title': ['health clinic', 'water arts', 'youth sports'][i % 3],
+                    'updatedAt': self.BASE + timedelta(minutes=i),
+                }
+                for i in range(size)
+            }
+            for collection_name, size in self.COLLECTIONS.items()
+        })
+        user = User.objects.create(username='concurrent')
+        self.profile = UserProfile.objects.create(
+            user=user, firebase_uid='concurrent', funding_types=['Contracts', 'Grants', 'RFPs'],
+            interests_main=['health'], interests_sub=['water'],
+        )
+
+    def sync(self, workers, **kwargs):
+        with mock.patch.object(firebase_integration, 'SYNC_CHUNK_SIZE', 10), \
+                mock.patch.object(FirebaseService, '_db', self.source):
+            return FirebaseService.sync_all_opportunities(list(self.COLLECTIONS), workers=workers, **kwargs)
+
+    def state(self):
+        """Everything a sync writes, minus wall-clock timestamps"""
+        return {
+            'opportunities': set(Opportunity.objects.values_list(
+                'firebase_id', 'collection_name', 'title', 'content_hash', 'sync_generation', 'tombstoned_at',
+            )),
+            'terms': set(OpportunityTerm.objects.values_list('opportunity__firebase_id', 'term', 'term_frequency')),
+            'matches': {
+                firebase_id: (relevance, win_rate, counts)
+                for firebase_id, relevance, win_rate, counts in OpportunityMatch.objects.values_list(
+                    'opportunity__firebase_id', 'relevance_score', 'win_rate', 'keyword_counts',
+                )
+            },
+            'sync_states': set(SyncState.objects.values_list(
+                'collection_name', 'scan_cursor', 'high_water_mark', 'high_water_id', 'generation',
+            )),
+        }
+
+    def compare(self, **kwargs):
+        """Run the serial and the concurrent sync from the same starting point"""
+        results = {}
+        for workers in [1, 3]:
+            with transaction.atomic():
+                synced = self.sync(workers, **kwargs)
+                results[workers] = (synced, self.state())
+                transaction.set_rollback(True)
+        self.assertEqual(results[3], results[1])
+        return results[1]
+
+    def test_full_sync(self):
+        synced, state = self.compare()
+        self.assertEqual(synced, 84)
+        self.assertEqual(len(state['opportunities']), 84)
+        self.assertTrue(state['matches'])
+
+    def test_incremental_and_limited_sync(self):
+        self.sync(1)
+        for n, firebase_id in enumerate(['SAM-003', 'grants.gov-010', 'grants.gov-031', 'rfpmart-000']):
+            collection_name = firebase_id.rsplit('-', 1)[0]
+            self.source.collection(collection_name).document(firebase_id).set({
+                'title': 'mental health', 'updatedAt': self.BASE + timedelta(minutes=1000 + n),
+            })
+        self.source.collection('SAM').document('SAM-004').delete()
+
+        synced, _ = self.compare()
+        self.assertEqual(synced, 4)
+        self.compare(full=True)
+        self.compare(full=True, limit_per_collection=20)
@@ -0,0 +1,367 @@
+"""
+Vectorized batch scoring of opportunities with a sparse term-count matrix
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .keywords import TOKEN_RE, KeywordMatcher, build_search_text, tokenize
+from .models import Opportunity, OpportunityMatch, SyncState
+
+logger = logging.getLogger(__name__)
+
+# Fields needed to build the matrix and the per-row scoring inputs
+CORPUS_FIELDS = (
+    'id', 'collection_name', 'state', 'close_date', 'deadline', 'last_synced', 'search_text',
+)
+TEXT_FIELDS = ('id', 'search_text')
+
+NO_DEADLINE = -1
+TEXT_FETCH_SIZE = 500
+
+
+class CorpusMatrix:
+    """
+    Sparse term-count matrix of the opportunity corpus.
+
+    Row i is one opportunity and column j one word token, so for keywords
+    that are a single token the count column is exactly the number of
+    whole-word hits. The matrix is built once per sync generation (the
+    latest SyncState checkpoint), saved to CORPUS_MATRIX_PATH and shared by
+    every profile scored afterwards, in this process and in others that
+    load the file. Opportunities edited outside of a sync are picked up
+    with the next one.
+    """
+
+    _cache = None
+    _lock = threading.Lock()
+
+    def __init__(self, ids, collections, states, deadlines, synced, vocabulary, matrix):
+        self.ids = ids
+        self.collections = collections
+        self.states = states
+        self.deadlines = deadlines
+        self.synced = synced
+        self.vocabulary = vocabulary
+        self.matrix = matrix
+        self.generation = None
+
+    @staticmethod
+    def current_generation() -> Tuple:
+        """
+        Fingerprint of the corpus that changes on every sync page: read from
+        the few SyncState rows, never from the opportunity table
+        """
+        stats = SyncState.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        return stats['count'], stats['updated'].isoformat() if stats['updated'] else ''
+
+    @classmethod
+    def current(cls) -> Optional['CorpusMatrix']:
+        """
+        The matrix of the current sync generation, from memory or from the
+        file the last build saved, without building one
+        Returns: None when no up-to-date matrix was built yet
+        """
+        generation = cls.current_generation()
+        with cls._lock:
+            if cls._cache is None or cls._cache.generation != generation:
+                stored = cls.read()
+                if stored is None or stored.generation != generation:
+                    return None
+                cls._cache = stored
+            return cls._cache
+
+    @classmethod
+    def load(cls) -> 'CorpusMatrix':
+        """Return the current matrix, building it when the corpus changed"""
+        return cls.current() or cls.refresh()
+
+    @classmethod
+    def refresh(cls) -> 'CorpusMatrix':
+        """Build the matrix for the current sync generation and save it"""
+        generation = cls.current_generation()
+        corpus = cls.build()
+        corpus.generation = generation
+        corpus.save()
+        with cls._lock:
+            cls._cache = corpus
+        return corpus
+
+    def save(self):
+        """Write the matrix to CORPUS_MATRIX_PATH, replacing the file atomically"""
+        path = getattr(settings, 'CORPUS_MATRIX_PATH', '')
+        if not path:
+            return
+        vocabulary = np.empty(len(self.vocabulary), dtype=object)
+        for term, column in self.vocabulary.items():
+            vocabulary[column] = term
+        partial = f'{path}.{os.getpid()}.tmp'
+        with open(partial, 'wb') as handle:
+            np.savez(
+                handle,
+                generation=np.asarray([str(value) for value in self.generation]),
+                ids=self.ids,
+                collections=self.collections.astype(str),
+                states=self.states.astype(str),
+                deadlines=self.deadlines,
+                synced=self.synced,
+                vocabulary=vocabulary.astype(str),
+                data=self.matrix.data,
+                indices=self.matrix.indices,
+                indptr=self.matrix.indptr,
+                shape=np.asarray(self.matrix.shape),
+            )
+        os.replace(partial, path)
+
+    @classmethod
+    def read(cls) -> Optional['CorpusMatrix']:
+        """
+        The matrix last saved to CORPUS_MATRIX_PATH
+        Returns: None when there is no readable file
+        """
+        path = getattr(settings, 'CORPUS_MATRIX_PATH', '')
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as stored:
+                corpus = cls(
+                    ids=stored['ids'],
+                    collections=stored['collections'].astype(object),
+                    states=stored['states'].astype(object),
+                    deadlines=stored['deadlines'],
+                    synced=stored['synced'],
+                    vocabulary={term: column for column, term in enumerate(stored['vocabulary'].tolist())},
+                    matrix=sparse.csc_matrix(
+                        (stored['data'], stored['indices'], stored['indptr']), shape=tuple(stored['shape'])
+                    ),
+                )
+                count, updated = stored['generation'].tolist()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable corpus matrix {path}: {e}")
+            return None
+        corpus.generation = (int(count), updated)
+        return corpus
+
+    @classmethod
+    def build(cls, chunk_size: int = 2000) -> 'CorpusMatrix':
+        """Tokenize the whole corpus into a term-count matrix"""
+        ids, collections, states, deadlines, synced = [], [], [], [], []
+        vocabulary: Dict[str, int] = {}
+        indptr, indices, data = [0], [], []
+
+        queryset = Opportunity.objects.filter(tombstoned_at__isnull=True).only(*CORPUS_FIELDS).order_by('pk')
+        for opp in queryset.iterator(chunk_size=chunk_size):
+            ids.append(opp.pk)
+            collections.append(opp.collection_name)
+            states.append((opp.state or '').lower())
+            deadline = opp.close_date or opp.deadline
+            deadlines.append(deadline.toordinal() if deadline else NO_DEADLINE)
+            synced.append(opp.last_synced.timestamp() if opp.last_synced else 0.0)
+
+            for term, tf in tokenize(build_search_text(opp)).items():
+                indices.append(vocabulary.setdefault(term, len(vocabulary)))
+                data.append(tf)
+            indptr.append(len(indices))
+
+        # Column-major so slicing out a profile's keyword columns is cheap
+        matrix = sparse.csc_matrix(
+            sparse.csr_matrix(
+                (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64),
+                 np.asarray(indptr, dtype=np.int64)),
+                shape=(len(ids), len(vocabulary))
+            )
+        )
+        return cls(
+            ids=np.asarray(ids, dtype=np.int64),
+            collections=np.asarray(collections, dtype=object),
+            states=np.asarray(states, dtype=object),
+            deadlines=np.asarray(deadlines, dtype=np.int64),
+            synced=np.asarray(synced, dtype=np.float64),
+            vocabulary=vocabulary,
+            matrix=matrix,
+        )
+
+    def columns(self, keywords: List[str]) -> np.ndarray:
+        """Column of each single-token keyword, -1 when it never occurs"""
+        return np.asarray([self.vocabulary.get(k, -1) for k in keywords], dtype=np.int64)
+
+    def keyword_counts(self, keywords: List[str], rows: np.ndarray) -> sparse.csr_matrix:
+        """Sparse (rows x keywords) hit counts for single-token keywords"""
+        cols = self.columns(keywords)
+        present = np.flatnonzero(cols >= 0)
+        if not len(present) or not len(rows):
+            return sparse.csr_matrix((len(rows), len(keywords)))
+        found = self.matrix[:, cols[present]][rows].tocoo()
+        return sparse.csr_matrix(
+            (found.data, (found.row, present[found.col])), shape=(len(rows), len(keywords))
+        )
+
+
+class SparseScoringEngine:
+    """Scores one profile against the whole corpus with array operations"""
+
+    # Keyword count matrices kept per interest signature
+    COUNTS_CACHE_SIZE = 64
+
+    def __init__(self, corpus: Optional[CorpusMatrix] = None):
+        self.corpus = corpus or CorpusMatrix.load()
+        self._counts_cache = OrderedDict()
+
+    @staticmethod
+    def is_simple_keyword(keyword: str) -> bool:
+        """Single word token, so its column count equals its regex hit count"""
+        return TOKEN_RE.fullmatch(keyword) is not None
+
+    def _complex_counts(self, keywords: List[str], rows: np.ndarray) -> sparse.csr_matrix:
+        """
+        Hit counts for phrases and keywords with non-word characters.
+        Only rows containing every word token of such a keyword are read
+        back from the database and scanned with a KeywordMatcher.
+        """
+        shape = (len(rows), len(keywords))
+        if not keywords or not len(rows):
+            return sparse.csr_matrix(shape)
+
+        candidate = np.zeros(len(rows), dtype=bool)
+        for keyword in keywords:
+            tokens = sorted(set(TOKEN_RE.findall(keyword)))
+            cols = self.corpus.columns(tokens)
+            if not tokens:
+                candidate[:] = True
+            elif (cols >= 0).all():
+                present = (self.corpus.matrix[:, cols][rows] > 0).sum(axis=1)
+                candidate |= np.asarray(present).ravel() == len(tokens)
+
+        candidate_rows = np.flatnonzero(candidate)
+        if not len(candidate_rows):
+            return sparse.csr_matrix(shape)
+
+        position = {int(self.corpus.ids[rows[i]]): i for i in candidate_rows}
+        matcher = KeywordMatcher(keywords)
+        column = {keyword: j for j, keyword in enumerate(keywords)}
+        row_ids, col_ids, data = [], [], []
+        pks = list(position)
+        for offset in range(0, len(pks), TEXT_FETCH_SIZE):
+            batch = pks[offset:offset + TEXT_FETCH_SIZE]
+            for opp in Opportunity.objects.filter(pk__in=batch).only(*TEXT_FIELDS):
+                for keyword, count in matcher.count(build_search_text(opp)).items():
+                    row_ids.append(position[opp.pk])
+                    col_ids.append(column[keyword])
+                    data.append(count)
+        return sparse.csr_matrix((data, (row_ids, col_ids)), shape=shape)
+
+    def keyword_counts(self, matcher, since: Optional[datetime] = None):
+        """
+        Rows scanned and their sparse per-keyword counts for a profile.
+        Cached per interest signature, so profiles with the same collections
+        and keywords share one computation.
+        Returns: (rows, counts, keywords)
+        """
+        key = (matcher.get_interest_signature(), since)
+        if key in self._counts_cache:
+            self._counts_cache.move_to_end(key)
+            return self._counts_cache[key]
+
+        corpus = self.corpus
+        mask = np.isin(corpus.collections, matcher.get_relevant_collections())
+        if since is not None:
+            mask &= corpus.synced >= since.timestamp()
+        rows = np.flatnonzero(mask)
+
+        simple = [k for k in matcher.keyword_matcher.keywords if self.is_simple_keyword(k)]
+        complex_ = [k for k in matcher.keyword_matcher.keywords if not self.is_simple_keyword(k)]
+        counts = sparse.hstack([
+            corpus.keyword_counts(simple, rows),
+            self._complex_counts(complex_, rows),
+        ]).tocsr()
+
+        self._counts_cache[key] = (rows, counts, simple + complex_)
+        if len(self._counts_cache) > self.COUNTS_CACHE_SIZE:
+            self._counts_cache.popitem(last=False)
+        return self._counts_cache[key]
+
+    def score(self, matcher, since: Optional[datetime] = None) -> List[OpportunityMatch]:
+        """
+        Score every relevant opportunity for the matcher's profile
+        Returns: unsaved OpportunityMatch rows for opportunities that scored
+        """
+        corpus = self.corpus
+        rows, counts, ordered = self.keyword_counts(matcher, since)
+        if not len(rows) or not ordered:
+            return []
+        keyword_index = {k: j for j, k in enumerate(ordered)}
+
+        # Weight vector: 3.0 per main keyword entry, 1.0 per sub keyword entry
+        main_cols = [keyword_index[k] for k in matcher.interests_main if k]
+        sub_cols = [keyword_index[k] for k in matcher.interests_sub if k]
+        weights = np.zeros(len(ordered))
+        np.add.at(weights, main_cols, 3.0)
+        np.add.at(weights, sub_cols, 1.0)
+        keyword_score = counts @ weights
+
+        main_count = np.zeros(len(rows))
+        if main_cols:
+            main_count = np.asarray((counts[:, main_cols] > 0).sum(axis=1)).ravel()
+
+        # Urgency from the deadline ordinal, as in Opportunity.urgency_bucket
+        deadlines = corpus.deadlines[rows]
+        days_until = deadlines - datetime.now().date().toordinal()
+        has_deadline = deadlines != NO_DEADLINE
+        urgent = has_deadline & (days_until <= 30)
+        soon = has_deadline & ~urgent & (days_until <= 92)
+
+        relevance = keyword_score * np.where(urgent, 1.2, np.where(soon, 1.1, 1.0))
+
+        user_state = (matcher.user_profile.state or '').lower()
+        location = np.zeros(len(rows))
+        if user_state:
+            location = (corpus.states[rows] == user_state) * 10.0
+        # Every row is in a relevant collection, so funding always scores 20
+        total_score = (
+            np.minimum(40, keyword_score * 2)
+            + np.minimum(25, main_count * 8)
+            + 20
+            + location
+            + np.where(urgent, 5, np.where(soon, 3, 2))
+        )
+        win_rate = total_score / 100 * 100
+
+        # Python objects (match details and reasoning) only for survivors
+        survivors = np.flatnonzero(keyword_score > 0)
+        survivors = survivors[np.argsort(-relevance[survivors], kind='stable')]
+        matches = []
+        for i in survivors:
+            row = rows[i]
+            start, end = counts.indptr[i], counts.indptr[i + 1]
+            hit_counts = {
+                ordered[j]: int(c)
+                for j, c in zip(counts.indices[start:end], counts.data[start:end]) if c
+            }
+            score, match_details = matcher.score_keyword_counts(hit_counts)
+            opportunity = Opportunity(
+                pk=int(corpus.ids[row]),
+                collection_name=corpus.collections[row],
+                state=corpus.states[row],
+                close_date=datetime.fromordinal(int(deadlines[i])).date() if has_deadline[i] else None,
+            )
+            _, reasoning = matcher.calculate_win_rate(opportunity, score, match_details)
+            matches.append(OpportunityMatch(
+                user_profile=matcher.user_profile,
+                opportunity_id=opportunity.pk,
+                relevance_score=float(relevance[i]),
+                win_rate=float(win_rate[i]),
+                win_rate_reasoning=reasoning,
+                keyword_score=score,
+                base_points=matcher.base_points(reasoning),
+                urgency_bucket=opportunity.urgency_bucket,
+                keyword_counts=hit_counts
+            ))
+        return matches
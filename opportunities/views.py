@@ -4,6 +4,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 import json
@@ -19,6 +20,44 @@ from .app_scraper import find_application_form
 
 logger = logging.getLogger(__name__)
 
+# Matches returned per /api/match/ page
+MATCH_PAGE_SIZE = 50
+MAX_MATCH_PAGE_SIZE = 200
+
+
+def visible_matches(profile, after=None):
+    """
+    Ranked matches still worth showing: not dismissed, applied or saved
+    (excluded in SQL). after=(relevance_score, id) continues below that
+    row, keyset style, in (relevance_score, id) order.
+    """
+    matches = OpportunityMatch.objects.filter(
+        user_profile=profile,
+        is_dismissed=False
+    ).exclude(
+        Exists(Application.objects.filter(user_profile=profile, opportunity=OuterRef('opportunity')))
+    ).exclude(
+        Exists(SavedOpportunity.objects.filter(user_profile=profile, opportunity=OuterRef('opportunity')))
+    ).select_related('opportunity').order_by('-relevance_score', '-id')
+    
+    if after is not None:
+        score, match_id = after
+        matches = matches.filter(
+            Q(relevance_score__lt=score) | Q(relevance_score=score, id__lt=match_id)
+        )
+    return matches
+
+
+def _parse_match_cursor(cursor):
+    """
+    Decode a "<relevance_score>:<match id>" page cursor
+    Returns: (relevance_score, id), or None for the first page
+    """
+    if not cursor:
+        return None
+    score, match_id = str(cursor).rsplit(':', 1)
+    return float(score), int(match_id)
+
 
 # HTML Template Views
 def index(request):
@@ -125,29 +164,40 @@ def match_opportunities(request):
         if not profile:
             return Response({'error': 'Profile not found'}, status=404)
         
-        # Run matching
-        matcher = OpportunityMatcher(profile)
-        matches = matcher.match_opportunities()
-        
-        # Get already applied/saved IDs
-        applied_ids = set(Application.objects.filter(
-            user_profile=profile
-        ).values_list('opportunity__firebase_id', flat=True))
-        
-        saved_ids = set(SavedOpportunity.objects.filter(
-            user_profile=profile
-        ).values_list('opportunity__firebase_id', flat=True))
-        
-        # Filter out applied/saved
-        filtered_matches = [
-            m for m in matches 
-            if m.opportunity.firebase_id not in applied_ids 
-            and m.opportunity.firebase_id not in saved_ids
-        ]
+        # Run matching (incremental unless criteria changed or a full run is requested)
+        engine = None
+        if settings.MATCHING_ENGINE == 'sparse':
+            from .vector_scoring import CorpusMatrix, SparseScoringEngine
+            # Built by sync_opportunities and rematch_all, never here; until
+            # the current corpus has one, requests score with the Python engine
+            corpus = CorpusMatrix.current()
+            if corpus is not None:
+                engine = SparseScoringEngine(corpus)
+        
+        try:
+            limit = min(int(request.data.get('limit') or MATCH_PAGE_SIZE), MAX_MATCH_PAGE_SIZE)
+            after = _parse_match_cursor(request.data.get('cursor'))
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid limit or cursor'}, status=400)
+        if limit < 1:
+            return Response({'error': 'Invalid limit or cursor'}, status=400)
+        
+        # Later pages read the stored ranking the first page computed; the
+        # run itself keeps no matches in memory (top_k=0)
+        if after is None:
+            matcher = OpportunityMatcher(profile)
+            matcher.match_opportunities(full=bool(request.data.get('full')), engine=engine, top_k=0)
+        
+        # Stored matches cover opportunities that were not rescored this run
+        page = list(visible_matches(profile, after)[:limit + 1])
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = f"{page[-1].relevance_score!r}:{page[-1].id}"
         
         # Serialize matches
         results = []
-        for match in filtered_matches[:50]:  # Limit to top 50
+        for match in page:
             opp = match.opportunity
             results.append({
                 'id': opp.firebase_id,
@@ -177,7 +227,8 @@ def match_opportunities(request):
         return Response({
             'success': True,
             'count': len(results),
-            'matches': results
+            'matches': results,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -38,6 +38,32 @@ FIREBASE_AUTH_DOMAIN = os.getenv('FIREBASE_AUTH_DOMAIN', '')
 FIREBASE_PROJECT_ID = os.getenv('FIREBASE_PROJECT_ID', '')
 FIREBASE_SERVICE_ACCOUNT_PATH = os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH', '')
 
+# Matching engine: 'python' scores opportunities one by one,
+# 'sparse' uses the NumPy/SciPy term-matrix engine in vector_scoring.py
+MATCHING_ENGINE = os.getenv('MATCHING_ENGINE', 'python')
+
+# Where the sparse engine's corpus matrix is saved after each sync, so web
+# workers load it instead of building it; empty keeps it in memory only
+CORPUS_MATRIX_PATH = os.getenv('CORPUS_MATRIX_PATH', str(BASE_DIR / 'corpus_matrix.npz'))
+
+# Firestore timestamp field set on every document write (e.g. 'updatedAt').
+# When set, syncs only fetch documents updated after the last synced one;
+# otherwise every sync is a full pass, resumable by document id.
+FIRESTORE_UPDATED_FIELD = os.getenv('FIRESTORE_UPDATED_FIELD', '')
+
+# Where opportunity and profile documents are read from: 'firestore',
+# 'jsonl:/path/to/dir' (one <collection>.jsonl file per collection) or
+# 'memory'. See opportunities/sources.py.
+OPPORTUNITY_SOURCE = os.getenv('OPPORTUNITY_SOURCE', 'firestore')
+
+# zlib-compress Opportunity.extra_data when its JSON is at least this many
+# bytes; 0 stores it as plain JSON
+EXTRA_DATA_COMPRESS_BYTES = int(os.getenv('EXTRA_DATA_COMPRESS_BYTES', '0'))
+
+# Store long Opportunity description/summary values compressed (see
+# opportunities/fields.py); run compress_opportunity_text after changing it
+COMPRESS_TEXT_FIELDS = os.getenv('COMPRESS_TEXT_FIELDS', 'False') == 'True'
+
 
 # Application definition
 